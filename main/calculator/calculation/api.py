@@ -1,15 +1,37 @@
 from abc import ABCMeta, abstractmethod
+import asyncio
 import json
+import time
+
+from httpx import HTTPError
+from requests import RequestException
+
+from .breaker import get_breaker
+from .geo import DEFAULT_GEO_TTL, resolver
+from .hedge import get_hedger
+from .metrics import SIZE_BUCKETS, get_status_class, metrics
+from .pool import get_session, run_blocking
+
+
+DEFAULT_TIMEOUT = 10
+CONNECTION_ERROR = 'Ошибка соединения'
+UNAVAILABLE_ERROR = 'Сервис временно недоступен'
+CALCULATION_ERROR = 'Ошибка расчета данных'
 
 
 class DeliveryAPI(metaclass=ABCMeta):
     """ Superclass for API subclasses """
-    def __init__(self, delivery_info: dict):
+    name = ''
+    section = ''
+
+    def __init__(self, config, delivery_info: dict):
         """
+        config: instance of ConfigParser, reading config.ini
         delivery_info: info about delivery (arrival_city, derival_city, produce_date, cargo specs)
         """
+        self._configure(config)
         self.result = {
-            'name': '',
+            'name': self.name,
             'cost': 'Ошибка',
             'days': 'Ошибка',
             'error': ''
@@ -20,10 +42,147 @@ class DeliveryAPI(metaclass=ABCMeta):
         self.arrival_region = delivery_info['arrival_region']
         self.cargo = delivery_info['cargo']
         self.date = delivery_info['produce_date']
-        self.body = self._get_request_body()
+        self.body = None
+        self.timings = {}
+
+    def _configure(self, config):
+        """ Read options shared by all API classes from carrier section of config
+        config: instance of ConfigParser, reading config.ini
+        """
+        default_timeout = config.getfloat('calculator', 'timeout', fallback=DEFAULT_TIMEOUT)
+        self.timeout = config.getfloat(self.section, 'timeout', fallback=default_timeout)
+        self.session = get_session(config, self.section)
+        self.breaker = get_breaker(config, self.section)
+        self.hedger = get_hedger(config, self.section)
+        default_geo_ttl = config.getint('calculator', 'geo_ttl', fallback=DEFAULT_GEO_TTL)
+        self.geo_ttl = config.getint(self.section, 'geo_ttl', fallback=default_geo_ttl)
+
+    def _request(self, method: str, url: str, hedge: bool = False, **kwargs):
+        """ Send request to API service within carrier timeout over pooled connections of carrier
+        method: http method
+        url: request url
+        hedge: True if request is idempotent and may be sent again when response is late
+        kwargs: requests arguments
+        Return: response
+        """
+        kwargs.setdefault('timeout', self.timeout)
+
+        if hedge and self.hedger:
+            return self.hedger.call(lambda: self._send(method, url, **kwargs))
+
+        return self._send(method, url, **kwargs)
+
+    def _send(self, method: str, url: str, **kwargs):
+        """ Send request to API service, result of request is saved to circuit breaker and metrics of carrier
+        method: http method
+        url: request url
+        kwargs: requests arguments
+        Return: response
+        """
+        start = time.perf_counter()
+        try:
+            resp = self.session.request(method, url, **kwargs)
+        except RequestException:
+            self._record_request(time.perf_counter() - start)
+            raise
+        self._record_request(time.perf_counter() - start, resp)
+
+        return resp
+
+    def _record_request(self, duration: float, resp=None):
+        """ Save result of request to circuit breaker and metrics of carrier
+        duration: duration of request in seconds
+        resp: response or None if request has failed
+        """
+        status_code = resp.status_code if resp is not None else None
+        self.breaker.record(status_code is not None and status_code < 500, duration)
+
+        labels = {'carrier': self.section}
+        metrics.observe('carrier_request_duration_seconds', labels, duration)
+        metrics.inc('carrier_requests_total', dict(labels, status=get_status_class(status_code)))
+        if resp is not None:
+            metrics.observe('carrier_response_size_bytes', labels, len(resp.content), SIZE_BUCKETS)
+
+    def _record_timings(self):
+        """ Save time of calculation phases to metrics of carrier """
+        for phase, duration in self.timings.items():
+            metrics.observe('carrier_phase_duration_seconds', {'carrier': self.section, 'phase': phase}, duration)
+
+    def _read_json(self, resp):
+        """ Get json from successful response
+        resp: response of API service
+        Return: json or None
+        """
+        if resp.status_code == 200:
+            return resp.json()
+        else:
+            self.result['error'] = CONNECTION_ERROR
+
+        return None
+
+    @classmethod
+    def error_result(cls, error: str):
+        """ Get result dictionary for calculation that has not finished
+        error: error message
+        Return: result dictionary
+        """
+        return {
+            'name': cls.name,
+            'cost': 'Ошибка',
+            'days': 'Ошибка',
+            'error': error
+        }
+
+    def _authorize(self):
+        """ Get credentials for API requests, if API needs them
+        Return: True if requests can be made
+        """
+        return True
 
     @abstractmethod
+    def _get_city_id(self, check_city: str, check_region: str):
+        pass
+
+    def _save_city_id(self, check_city: str, check_region: str, city_id):
+        """ Save city id resolved by carrier to local geo store
+        check_city: city name
+        check_region: region name
+        city_id: city id or None
+        """
+        if city_id and not self.result['error']:
+            resolver.set(self.section, check_city, check_region, city_id)
+
+    def _resolve_city_id(self, check_city: str, check_region: str):
+        """ Get city id from local geo store, ask carrier if city is not there yet
+        check_city: city name
+        check_region: region name
+        Return: city id or None
+        """
+        city_id = resolver.get(self.section, check_city, check_region, self.geo_ttl)
+
+        if city_id is None:
+            city_id = self._get_city_id(check_city, check_region)
+            self._save_city_id(check_city, check_region, city_id)
+
+        return city_id
+
     def _get_request_body(self):
+        """ Create final body for request to API, time of body build is saved to self.timings
+        Return: request body or None
+        """
+        derival_id = self._resolve_city_id(self.derival_city, self.derival_region)
+        arrival_id = self._resolve_city_id(self.arrival_city, self.arrival_region)
+
+        if derival_id and arrival_id:
+            start = time.perf_counter()
+            body = self._build_request_body(derival_id, arrival_id)
+            self.timings['build'] = time.perf_counter() - start
+            return body
+
+        return None
+
+    @abstractmethod
+    def _build_request_body(self, derival_id, arrival_id):
         pass
 
     @abstractmethod
@@ -31,9 +190,53 @@ class DeliveryAPI(metaclass=ABCMeta):
         pass
 
     @abstractmethod
-    def calculate(self):
+    def _parse_delivery_calc(self, calculation):
         pass
 
+    def calculate(self):
+        """ Main function to calculate delivery cost and time,
+        time of calculation phases is saved to self.timings and metrics of carrier
+        Return: result dictionary
+        """
+        try:
+            start = time.perf_counter()
+            authorized = self._authorize()
+            self.timings['authorize'] = time.perf_counter() - start
+            if not authorized:
+                return self.result
+
+            start = time.perf_counter()
+            self.body = self._get_request_body()
+            # build time is saved by _get_request_body
+            self.timings['resolve'] = time.perf_counter() - start - self.timings.get('build', 0)
+            if not self.body or self.result['error']:
+                return self.result
+
+            start = time.perf_counter()
+            calculation = self._get_delivery_calc()
+            self.timings['pricing'] = time.perf_counter() - start
+            if calculation:
+                start = time.perf_counter()
+                self._parse_delivery_calc(calculation)
+                self.timings['parse'] = time.perf_counter() - start
+
+            return self.result
+        finally:
+            self._record_timings()
+
+    def resolve(self):
+        """ Authorize and resolve cities of delivery without calculation, so that later
+        calculations find credentials and cities ids. Carrier with open circuit breaker is not requested.
+        Return: result dictionary with error if cities are not resolved
+        """
+        if not self.breaker.allow():
+            return self.error_result(UNAVAILABLE_ERROR)
+
+        if self._authorize():
+            self.body = self._get_request_body()
+
+        return self.result
+
     @staticmethod
     def _get_clean_region(region: str):
         """ Get region for search in api json
@@ -55,3 +258,121 @@ class DeliveryAPI(metaclass=ABCMeta):
         """
         with open(f'assets/data/{name}.json', 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=4)
+
+
+class AsyncDeliveryAPI:
+    """ Mixin for API subclasses making requests on event loop.
+    Must be placed before DeliveryAPI subclass in bases, subclasses override
+    every method that sends requests with a coroutine.
+    """
+    def __init__(self, config, delivery_info: dict, client):
+        """
+        config: instance of ConfigParser, reading config.ini
+        delivery_info: info about delivery (arrival_city, derival_city, produce_date, cargo specs)
+        client: httpx.AsyncClient shared by calculators
+        """
+        self.client = client
+        super().__init__(config, delivery_info)
+
+    async def _request(self, method: str, url: str, hedge: bool = False, **kwargs):
+        """ Send request to API service within carrier timeout
+        method: http method
+        url: request url
+        hedge: True if request is idempotent and may be sent again when response is late
+        kwargs: requests arguments
+        Return: response
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        if isinstance(kwargs.get('data'), (str, bytes)):
+            kwargs['content'] = kwargs.pop('data')
+
+        if hedge and self.hedger:
+            return await self.hedger.call_async(lambda: self._send(method, url, **kwargs))
+
+        return await self._send(method, url, **kwargs)
+
+    async def _send(self, method: str, url: str, **kwargs):
+        """ Send request to API service, result of request is saved to circuit breaker and metrics of carrier
+        method: http method
+        url: request url
+        kwargs: requests arguments
+        Return: response
+        """
+        start = time.perf_counter()
+        try:
+            resp = await self.client.request(method, url, **kwargs)
+        except HTTPError:
+            self._record_request(time.perf_counter() - start)
+            raise
+        self._record_request(time.perf_counter() - start, resp)
+
+        return resp
+
+    async def _authorize(self):
+        """ Get credentials for API requests, if API needs them
+        Return: True if requests can be made
+        """
+        return True
+
+    async def _resolve_city_id(self, check_city: str, check_region: str):
+        """ Get city id from local geo store, ask carrier if city is not there yet
+        check_city: city name
+        check_region: region name
+        Return: city id or None
+        """
+        city_id = await run_blocking(resolver.get, self.section, check_city, check_region, self.geo_ttl)
+
+        if city_id is None:
+            city_id = await self._get_city_id(check_city, check_region)
+            await run_blocking(self._save_city_id, check_city, check_region, city_id)
+
+        return city_id
+
+    async def _get_request_body(self):
+        """ Create final body for request to API, cities are requested concurrently,
+        time of body build is saved to self.timings
+        Return: request body or None
+        """
+        derival_id, arrival_id = await asyncio.gather(
+            self._resolve_city_id(self.derival_city, self.derival_region),
+            self._resolve_city_id(self.arrival_city, self.arrival_region),
+        )
+
+        if derival_id and arrival_id:
+            start = time.perf_counter()
+            body = self._build_request_body(derival_id, arrival_id)
+            self.timings['build'] = time.perf_counter() - start
+            return body
+
+        return None
+
+    async def calculate(self):
+        """ Main function to calculate delivery cost and time,
+        time of calculation phases is saved to self.timings and metrics of carrier
+        Return: result dictionary
+        """
+        try:
+            start = time.perf_counter()
+            authorized = await self._authorize()
+            self.timings['authorize'] = time.perf_counter() - start
+            if not authorized:
+                return self.result
+
+            start = time.perf_counter()
+            self.body = await self._get_request_body()
+            # build time is saved by _get_request_body
+            self.timings['resolve'] = time.perf_counter() - start - self.timings.get('build', 0)
+            if not self.body or self.result['error']:
+                return self.result
+
+            start = time.perf_counter()
+            calculation = await self._get_delivery_calc()
+            self.timings['pricing'] = time.perf_counter() - start
+            if calculation:
+                start = time.perf_counter()
+                self._parse_delivery_calc(calculation)
+                self.timings['parse'] = time.perf_counter() - start
+
+            return self.result
+        finally:
+            self._record_timings()
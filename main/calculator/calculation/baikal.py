@@ -1,30 +1,60 @@
-import requests
+from .api import AsyncDeliveryAPI, DeliveryAPI
+from .cache import CityCache
 
-from .api import DeliveryAPI
+
+BASE_API_URL = 'https://api.baikalsr.ru/v1'
+DEFAULT_CITY_TTL = 30 * 24 * 60 * 60
+DEFAULT_NEGATIVE_TTL = 24 * 60 * 60
 
 
 class BaikalAPI(DeliveryAPI):
     """ Class provides communicate with API service """
+    name = 'Байкал Сервис'
+    section = 'baikal'
+
     def __init__(self, config, delivery_info: dict):
         """
         config: instance of ConfigParser, reading config.ini
         delivery_info: info about delivery (arrival_city, derival_city, produce_date, cargo specs)
         """
-        self.base_api_url = 'https://api.baikalsr.ru/v1'
+        self.base_api_url = config.get('baikal', 'base_url', fallback=BASE_API_URL)
         self.apikey = config['baikal']['apikey']
         self.request_headers = {'Content-Type': 'application/json'}
-        super().__init__(delivery_info)
-        self.result['name'] = 'Байкал Сервис'
-
-    def _get_city_guid(self, check_city: str, check_region: str):
-        """ Get guid (code) of city
+        self.cities = CityCache(
+            'baikal',
+            config.getint('baikal', 'city_ttl', fallback=DEFAULT_CITY_TTL),
+            config.getint('baikal', 'negative_ttl', fallback=DEFAULT_NEGATIVE_TTL)
+        )
+        super().__init__(config, delivery_info)
+
+    def _get_city_id(self, check_city: str, check_region: str):
+        """ Get guid (code) of city, resolved guids are cached
         check_city: city name
         check_region: region name
         Return: guid or None
         """
-        url = f'{self.base_api_url}/fias/cities?text={check_city.lower()}'
-        resp = requests.get(url, auth=(self.apikey, ''), headers=self.request_headers)
+        city_id = self.cities.get(check_city, check_region)
+
+        if city_id is None:
+            url = f'{self.base_api_url}/fias/cities?text={check_city.lower()}'
+            resp = self._request('get', url, hedge=True, auth=(self.apikey, ''), headers=self.request_headers)
+
+            city_id = self._parse_city_id(resp, check_city, check_region)
+            if resp.status_code == 200:
+                self.cities.set(check_city, check_region, city_id)
+        elif not city_id:
+            self.result['error'] = f'{check_city}: нет доставки'
+            return None
+
+        return city_id
 
+    def _parse_city_id(self, resp, check_city: str, check_region: str):
+        """ Get guid (code) of city from response
+        resp: response of fias request
+        check_city: city name
+        check_region: region name
+        Return: guid or None
+        """
         if resp.status_code == 200:
             cities = resp.json()
             try:
@@ -41,81 +71,63 @@ class BaikalAPI(DeliveryAPI):
 
         return None
 
-    def _get_request_body(self):
+    def _build_request_body(self, derival_city_id, arrival_city_id):
         """ Create final body for request to API
+        derival_city_id: guid of derival city
+        arrival_city_id: guid of arrival city
         Return: request body
         """
-        derival_city_id = self._get_city_guid(self.derival_city, self.derival_region)
-        arrival_city_id = self._get_city_guid(self.arrival_city, self.arrival_region)
-
-        if derival_city_id and arrival_city_id:
-            body = {
-                'from': {
-                    'guid': derival_city_id,
-                    'delivery': 0,
-                    'loading': 0
-                },
-                'to': {
-                    'guid': arrival_city_id,
-                    'delivery': 0,
-                    'loading': 0
-                },
-                'insurance': 0,
-                'return_docs': 0,
-                'cargo': {
+        body = {
+            'from': {
+                'guid': derival_city_id,
+                'delivery': 0,
+                'loading': 0
+            },
+            'to': {
+                'guid': arrival_city_id,
+                'delivery': 0,
+                'loading': 0
+            },
+            'insurance': 0,
+            'return_docs': 0,
+            'cargo': {
+                'weight': self.cargo['weight'],
+                'volume': self.cargo['volume'],
+                'units': 1,
+                'max': {
                     'weight': self.cargo['weight'],
-                    'volume': self.cargo['volume'],
-                    'units': 1,
-                    'max': {
-                        'weight': self.cargo['weight'],
-                        'length': self.cargo['length'],
-                        'width': self.cargo['width'],
-                        'height': self.cargo['height']
-                    },
-                    'pack': {
-                        'crate': 0,
-                        'pallet': 0,
-                        'sealed_pallet': 0,
-                        'bubble_wrap': 0,
-                        'big_bag': 0,
-                        'medium_bag': 0,
-                        'small_bag': 0
-                    }
+                    'length': self.cargo['length'],
+                    'width': self.cargo['width'],
+                    'height': self.cargo['height']
                 },
-                'netto': 0
-            }
-
-            return body
-
-        return None
+                'pack': {
+                    'crate': 0,
+                    'pallet': 0,
+                    'sealed_pallet': 0,
+                    'bubble_wrap': 0,
+                    'big_bag': 0,
+                    'medium_bag': 0,
+                    'small_bag': 0
+                }
+            },
+            'netto': 0
+        }
+
+        return body
 
     def _get_delivery_calc(self):
         """ Get result of calculation in json format
         Return: calculation result or None
         """
         url = f'{self.base_api_url}/calculator'
+        resp = self._request('post', url, hedge=True, json=self.body, auth=(self.apikey, ''), headers=self.request_headers)
 
-        if not self.result['error']:
-            resp = requests.post(url, json=self.body, auth=(self.apikey, ''), headers=self.request_headers)
-
-            if resp.status_code == 200:
-                return resp.json()
-            else:
-                self.result['error'] = 'Ошибка соединения'
+        return self._read_json(resp)
 
-        return None
-
-    def calculate(self):
-        """ Main function to calculate delivery cost and time
-        Return: result dictionary
+    def _parse_delivery_calc(self, calculation):
+        """ Get delivery cost and time from calculation result
+        calculation: calculation result in json format
         """
-        if not self.body:
-            return self.result
-
-        calculation = self._get_delivery_calc()
-        if not calculation:
-            return self.result
-
         try:
             cost = round(float(calculation['total']['int']) * 0.8, 2)  # 20% discount
             days = calculation['transit']['int']
@@ -124,4 +136,35 @@ class BaikalAPI(DeliveryAPI):
         except KeyError:
             self.result['error'] = 'Ошибка расчета данных'
 
-        return self.result
+
+class AsyncBaikalAPI(AsyncDeliveryAPI, BaikalAPI):
+    """ Class provides communicate with API service on event loop """
+    async def _get_city_id(self, check_city: str, check_region: str):
+        """ Get guid (code) of city, resolved guids are cached
+        check_city: city name
+        check_region: region name
+        Return: guid or None
+        """
+        city_id = self.cities.get(check_city, check_region)
+
+        if city_id is None:
+            url = f'{self.base_api_url}/fias/cities?text={check_city.lower()}'
+            resp = await self._request('get', url, hedge=True, auth=(self.apikey, ''), headers=self.request_headers)
+
+            city_id = self._parse_city_id(resp, check_city, check_region)
+            if resp.status_code == 200:
+                self.cities.set(check_city, check_region, city_id)
+        elif not city_id:
+            self.result['error'] = f'{check_city}: нет доставки'
+            return None
+
+        return city_id
+
+    async def _get_delivery_calc(self):
+        """ Get result of calculation in json format
+        Return: calculation result or None
+        """
+        url = f'{self.base_api_url}/calculator'
+        resp = await self._request('post', url, hedge=True, json=self.body, auth=(self.apikey, ''), headers=self.request_headers)
+
+        return self._read_json(resp)
@@ -0,0 +1,149 @@
+from collections import deque
+from threading import Lock
+import os
+import time
+
+from .pool import get_option
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+DEFAULT_WINDOW = 20
+DEFAULT_MIN_CALLS = 10
+DEFAULT_ERROR_RATE = 0.5
+DEFAULT_SLOW_CALL = 5.0
+DEFAULT_SLOW_RATE = 0.8
+DEFAULT_OPEN_TIME = 30.0
+
+
+class CircuitBreaker:
+    """ Circuit breaker of carrier API shared by all threads of the process.
+    Breaker opens when share of failed or slow requests among recent ones is too high,
+    while it is open carrier is not requested. After open time one calculation is let
+    through to probe API, breaker closes if its request succeeds and opens again otherwise.
+    """
+    def __init__(self, window: int, min_calls: int, error_rate: float, slow_call: float,
+                 slow_rate: float, open_time: float):
+        """
+        window: number of recent requests to check
+        min_calls: minimum number of requests in window to open breaker
+        error_rate: share of failed requests opening breaker
+        slow_call: duration of request in seconds considered slow
+        slow_rate: share of slow requests opening breaker
+        open_time: seconds before probing API after breaker has opened
+        """
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.slow_rate = slow_rate
+        self.open_time = open_time
+        self._lock = Lock()
+        self._calls = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened = 0
+        self._probe_started = 0
+        self._rejected = 0
+
+    def _open(self):
+        """ Stop requests to API, must be called under lock """
+        self._state = OPEN
+        self._opened = time.monotonic()
+        self._calls.clear()
+
+    def allow(self):
+        """ Check if carrier can be requested, in half-open state only one probe is allowed
+        Return: True or False
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            if self._state == OPEN and now - self._opened >= self.open_time:
+                self._state = HALF_OPEN
+                self._probe_started = 0
+
+            # probe that has not finished within open time is replaced by new one
+            if self._state == HALF_OPEN and now - self._probe_started >= self.open_time:
+                self._probe_started = now
+                return True
+
+            if self._state == CLOSED:
+                return True
+
+            self._rejected += 1
+            return False
+
+    def record(self, success: bool, duration: float):
+        """ Save result of request to API
+        success: False if request has failed
+        duration: duration of request in seconds
+        """
+        with self._lock:
+            if self._state == HALF_OPEN:
+                if success and duration < self.slow_call:
+                    self._state = CLOSED
+                else:
+                    self._open()
+                return
+
+            if self._state == OPEN:
+                return
+
+            self._calls.append((success, duration >= self.slow_call))
+            if len(self._calls) < self.min_calls:
+                return
+
+            errors = sum(1 for success, _ in self._calls if not success)
+            slow = sum(1 for _, is_slow in self._calls if is_slow)
+            if errors >= self.error_rate * len(self._calls) or slow >= self.slow_rate * len(self._calls):
+                self._open()
+
+    def stats(self):
+        """ Get breaker info
+        Return: dict with state, recent requests, their error and slow shares and rejected calculations
+        """
+        with self._lock:
+            calls = len(self._calls)
+            return {
+                'state': self._state,
+                'calls': calls,
+                'error_rate': round(sum(1 for success, _ in self._calls if not success) / calls, 2) if calls else 0,
+                'slow_rate': round(sum(1 for _, is_slow in self._calls if is_slow) / calls, 2) if calls else 0,
+                'rejected': self._rejected,
+            }
+
+
+_breakers = {}
+_breakers_lock = Lock()
+
+
+def get_breaker(config, section: str):
+    """ Get circuit breaker of carrier of the current process, creating it on first call
+    config: instance of ConfigParser, reading config.ini
+    section: carrier section of config
+    Return: CircuitBreaker
+    """
+    key = (os.getpid(), section)
+
+    if key not in _breakers:
+        with _breakers_lock:
+            if key not in _breakers:
+                _breakers[key] = CircuitBreaker(
+                    window=get_option(config, section, 'breaker_window', DEFAULT_WINDOW),
+                    min_calls=get_option(config, section, 'breaker_min_calls', DEFAULT_MIN_CALLS),
+                    error_rate=get_option(config, section, 'breaker_error_rate', DEFAULT_ERROR_RATE, 'getfloat'),
+                    slow_call=get_option(config, section, 'breaker_slow_call', DEFAULT_SLOW_CALL, 'getfloat'),
+                    slow_rate=get_option(config, section, 'breaker_slow_rate', DEFAULT_SLOW_RATE, 'getfloat'),
+                    open_time=get_option(config, section, 'breaker_open_time', DEFAULT_OPEN_TIME, 'getfloat'),
+                )
+
+    return _breakers[key]
+
+
+def get_breaker_stats():
+    """ Get info about circuit breakers of the current process
+    Return: dict with carriers sections as keys and breakers info as values
+    """
+    with _breakers_lock:
+        return {section: breaker.stats() for (pid, section), breaker in _breakers.items() if pid == os.getpid()}
@@ -0,0 +1,355 @@
+from concurrent.futures import ThreadPoolExecutor
+from configparser import ConfigParser
+from threading import Lock
+import csv
+import glob
+import io
+import json
+import os
+import shutil
+import time
+import uuid
+
+from requests import RequestException
+
+from .api import CALCULATION_ERROR, CONNECTION_ERROR, UNAVAILABLE_ERROR
+from .cache import normalize_text
+from .calc import CALCULATORS, Calculator
+from .directories import write_atomic
+from .metrics import is_alive
+from .pool import CarrierPool
+
+
+DEFAULT_BULK_WORKERS = 8
+
+# errors after which city is resolved again by rows
+TRANSIENT_ERRORS = (CONNECTION_ERROR, UNAVAILABLE_ERROR)
+
+
+def get_city_key(city: str, region: str):
+    """ Get key of city for deduplication of cities of shipments
+    city: city name
+    region: region name
+    Return: tuple of normalized city and region
+    """
+    return normalize_text(city), normalize_text(region)
+
+
+def get_bulk_header(columns: list):
+    """ Get header of bulk quotes table
+    columns: columns of shipments table
+    Return: list of columns with cost and days of every carrier and error of row
+    """
+    header = list(columns)
+    for api_class in CALCULATORS:
+        header += [f'{api_class.name}: стоимость', f'{api_class.name}: дней']
+
+    return header + ['Ошибка']
+
+
+def get_bulk_row(values: list, results: list = None, error: str = ''):
+    """ Get row of bulk quotes table
+    values: values of shipment row
+    results: results of calculation or None if row is not calculated
+    error: error of row
+    Return: list of values with cost and days of every carrier and error of row
+    """
+    row = list(values)
+    results = {result['name']: result for result in results or ()}
+
+    for api_class in CALCULATORS:
+        result = results.get(api_class.name)
+        if result is None:
+            row += ['', '']
+        elif result['error']:
+            row += [result['error'], '']
+        else:
+            row += [result['cost'], result['days']]
+
+    return row + [error]
+
+
+class BulkCalculator(Calculator):
+    """ Calculator of one shipment of bulk quoting. Carriers jobs run in the pool of bulk
+    quoting, carriers which have no delivery to city of shipment are not requested again.
+    """
+    def __init__(self, delivery_info: dict, pool: CarrierPool, unresolved: dict):
+        """
+        delivery_info: info about delivery (arrival_city, derival_city, produce_date, cargo specs)
+        pool: CarrierPool of bulk quoting
+        unresolved: dict with (carrier section, city key) keys and error results of carriers as values
+        """
+        super().__init__(delivery_info)
+        self.pool = pool
+        self.unresolved = unresolved
+
+    def get_pool(self):
+        """ Get pool running carriers jobs of calculation
+        Return: CarrierPool of bulk quoting
+        """
+        return self.pool
+
+    def run_calculator(self, api_class):
+        """ Function for running in the carrier pool, carrier is not requested
+        if it has failed to resolve city of shipment
+        api_class: DeliveryAPI subclass
+        Return: result of calculation
+        """
+        for city, region in (
+            (self.delivery_info['derival_city'], self.delivery_info['derival_region']),
+            (self.delivery_info['arrival_city'], self.delivery_info['arrival_region']),
+        ):
+            result = self.unresolved.get((api_class.section, get_city_key(city, region)))
+            if result is not None:
+                return dict(result)
+
+        return super().run_calculator(api_class)
+
+
+class BulkQuoter:
+    """ Quoting of many shipments with bounded number of shipments in progress.
+    Carriers are authorized and cities of all shipments are resolved once before quoting,
+    so shipments find credentials in carriers sessions and cities ids in geo store.
+    Carriers jobs run in own pool of bulk quoting, sized so that every shipment
+    in progress can request all carriers at once.
+    """
+    def __init__(self, shipments: list, workers: int = None, progress=None):
+        """
+        shipments: list of delivery info dicts, None for rows which must not be calculated
+        workers: number of shipments in progress, bulk_workers option of config by default
+        progress: function called with (number of finished rows, number of rows) when row is finished
+        """
+        self.config = ConfigParser()
+        self.config.read('assets/data/config.ini')
+        self.shipments = shipments
+        self.workers = workers or self.config.getint('calculator', 'bulk_workers', fallback=DEFAULT_BULK_WORKERS)
+        self.progress = progress
+        self.unresolved = {}
+        self._lock = Lock()
+        self._done = 0
+
+    def get_cities(self):
+        """ Get unique cities of shipments
+        Return: dict with city keys as keys and delivery info from and to the city as values
+        """
+        cities = {}
+
+        for info in self.shipments:
+            if info is None:
+                continue
+            for city, region in ((info['derival_city'], info['derival_region']),
+                                 (info['arrival_city'], info['arrival_region'])):
+                key = get_city_key(city, region)
+                if key not in cities:
+                    cities[key] = dict(info, derival_city=city, derival_region=region,
+                                       arrival_city=city, arrival_region=region)
+
+        return cities
+
+    def resolve_city(self, api_class, info: dict):
+        """ Authorize carrier and resolve city through geo store or carrier
+        api_class: DeliveryAPI subclass
+        info: delivery info from and to the city, the second lookup is taken from geo store
+        Return: error result if carrier has failed to resolve city, None otherwise
+        """
+        try:
+            result = api_class(self.config, info).resolve()
+        except RequestException:
+            return None
+        except Exception:
+            # unexpected response of carrier is error of rows with the city, not of the whole batch
+            return api_class.error_result(CALCULATION_ERROR)
+
+        error = result['error']
+        return result if error and error not in TRANSIENT_ERRORS else None
+
+    def resolve(self, pool: CarrierPool):
+        """ Resolve cities of all shipments by all carriers, cities which carriers
+        have no delivery to are saved to self.unresolved
+        pool: CarrierPool of bulk quoting
+        """
+        jobs = [
+            (api_class, key, pool.submit(self.resolve_city, api_class, info))
+            for key, info in self.get_cities().items()
+            for api_class in CALCULATORS
+        ]
+
+        for api_class, key, future in jobs:
+            result = future.result()
+            if result is not None:
+                self.unresolved[(api_class.section, key)] = result
+
+    def quote_shipment(self, info: dict, pool: CarrierPool):
+        """ Calculate one shipment, errors of carriers are kept in their results
+        info: delivery info
+        pool: CarrierPool of bulk quoting
+        Return: results of calculation
+        """
+        return BulkCalculator(dict(info), pool, self.unresolved).calculate()
+
+    def finish_row(self, future=None):
+        """ Count finished row and report progress
+        future: Future of the row
+        """
+        with self._lock:
+            self._done += 1
+            done = self._done
+
+        if self.progress is not None:
+            self.progress(done, len(self.shipments))
+
+    def quote(self):
+        """ Calculate all shipments
+        Return: generator of results of shipments in order of shipments, None for rows which are not calculated
+        """
+        pool = CarrierPool(self.workers * len(CALCULATORS))
+
+        try:
+            self.resolve(pool)
+
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bulk') as executor:
+                futures = []
+                try:
+                    for info in self.shipments:
+                        if info is None:
+                            futures.append(None)
+                            self.finish_row()
+                            continue
+                        future = executor.submit(self.quote_shipment, info, pool)
+                        future.add_done_callback(self.finish_row)
+                        futures.append(future)
+
+                    for future in futures:
+                        yield future.result() if future is not None else None
+                finally:
+                    # rows which have not started yet are dropped if results are not needed anymore
+                    for future in futures:
+                        if future is not None:
+                            future.cancel()
+        finally:
+            pool.shutdown(wait=False)
+
+
+BULK_JOBS_DIR = 'assets/data/bulk'
+BULK_JOB_TTL = 24 * 60 * 60
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# web batches run one at a time in the process, so they never take all carriers connections
+_jobs_executors = {}
+_jobs_lock = Lock()
+
+
+def get_jobs_executor():
+    """ Get executor of bulk jobs of the current process, creating it on first call
+    Return: ThreadPoolExecutor with one thread
+    """
+    pid = os.getpid()
+
+    if pid not in _jobs_executors:
+        with _jobs_lock:
+            if pid not in _jobs_executors:
+                _jobs_executors[pid] = ThreadPoolExecutor(max_workers=1, thread_name_prefix='bulk-job')
+
+    return _jobs_executors[pid]
+
+
+class BulkJob:
+    """ Bulk quoting started from web and running in background thread of the process.
+    Status and result table are saved to job directory, so that any worker can show
+    progress of the job and give its result.
+    """
+    def __init__(self, job_id: str, path: str = BULK_JOBS_DIR):
+        """
+        job_id: id of job
+        path: path to jobs directory
+        """
+        self.job_id = job_id
+        self.path = os.path.join(path, job_id)
+        self.status_path = os.path.join(self.path, 'status.json')
+        self.result_path = os.path.join(self.path, 'quotes.csv')
+        self._lock = Lock()
+
+    @classmethod
+    def start(cls, dialect, shipments: list, columns: list, owner, path: str = BULK_JOBS_DIR):
+        """ Create job and schedule it in background thread
+        dialect: csv dialect of result table
+        shipments: list of (row values, delivery info or None, error)
+        columns: columns of shipments table
+        owner: id of user who has started the job
+        path: path to jobs directory
+        Return: BulkJob
+        """
+        remove_old_jobs(path)
+
+        job = cls(str(uuid.uuid4()), path)
+        os.makedirs(job.path)
+        job.write_status(state=QUEUED, done=0, total=len(shipments), owner=owner, pid=os.getpid(),
+                         started=time.time())
+        get_jobs_executor().submit(job.run, dialect, shipments, columns)
+
+        return job
+
+    def read_status(self):
+        """ Get status of job, job of finished worker which has not ended is failed
+        Return: dict with state, number of finished and all rows and owner or None if there is no such job
+        """
+        try:
+            with open(self.status_path, 'rb') as f:
+                status = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if status['state'] in (QUEUED, RUNNING) and not is_alive(status['pid']):
+            status['state'] = FAILED
+
+        return status
+
+    def write_status(self, **values):
+        """ Update status of job
+        values: changed values of status
+        """
+        with self._lock:
+            status = self.read_status() or {}
+            status.update(values)
+            write_atomic(self.status_path, json.dumps(status).encode('utf-8'))
+
+    def run(self, dialect, shipments: list, columns: list):
+        """ Calculate shipments and save result table
+        dialect: csv dialect of result table
+        shipments: list of (row values, delivery info or None, error)
+        columns: columns of shipments table
+        """
+        self.write_status(state=RUNNING)
+
+        try:
+            quoter = BulkQuoter([info for _, info, _ in shipments],
+                                progress=lambda done, total: self.write_status(done=done))
+            table = io.StringIO()
+            writer = csv.writer(table, dialect)
+            writer.writerow(get_bulk_header(columns))
+            for (values, _, error), results in zip(shipments, quoter.quote()):
+                writer.writerow(get_bulk_row(values, results, error))
+            write_atomic(self.result_path, table.getvalue().encode('utf-8'))
+        except Exception:
+            self.write_status(state=FAILED)
+            raise
+
+        self.write_status(state=DONE, finished=time.time())
+
+
+def remove_old_jobs(path: str = BULK_JOBS_DIR, ttl: float = BULK_JOB_TTL):
+    """ Remove directories of jobs started more than ttl ago
+    path: path to jobs directory
+    ttl: lifetime of job in seconds
+    """
+    now = time.time()
+
+    for job_path in glob.glob(os.path.join(path, '*')):
+        try:
+            if now - os.path.getmtime(job_path) > ttl:
+                shutil.rmtree(job_path)
+        except OSError:
+            continue
@@ -0,0 +1,190 @@
+from collections import Counter
+from threading import Lock
+import hashlib
+import json
+
+from django.core.cache import InvalidCacheBackendError, caches
+
+
+DEFAULT_TTL = 600
+DEFAULT_STALE_TTL = 24 * 60 * 60
+CACHE_ALIAS = 'quotes'
+CITIES_CACHE_ALIAS = 'cities'
+MISSING = ''
+
+
+def normalize_text(text: str):
+    """ Get text for comparison of cities and regions names
+    text: city or region name
+    Return: lowercase text with single spaces and ё replaced by е
+    """
+    return ' '.join((text or '').lower().replace('ё', 'е').split())
+
+
+def normalize_delivery_info(delivery_info: dict):
+    """ Get delivery info in form that is the same for equal routes and cargo
+    delivery_info: info about delivery (arrival_city, derival_city, produce_date, cargo specs)
+    Return: normalized delivery info
+    """
+    cargo = delivery_info['cargo']
+
+    return {
+        'derival_city': normalize_text(delivery_info['derival_city']),
+        'derival_region': normalize_text(delivery_info['derival_region']),
+        'arrival_city': normalize_text(delivery_info['arrival_city']),
+        'arrival_region': normalize_text(delivery_info['arrival_region']),
+        'produce_date': delivery_info['produce_date'],
+        'cargo': {name: round(float(cargo[name]), 3) for name in sorted(cargo)},
+    }
+
+
+def get_quote_key(api_class, delivery_info: dict):
+    """ Get key of carrier calculation for delivery
+    api_class: DeliveryAPI subclass
+    delivery_info: info about delivery (arrival_city, derival_city, produce_date, cargo specs)
+    Return: key string
+    """
+    info = json.dumps(normalize_delivery_info(delivery_info), ensure_ascii=False, sort_keys=True)
+    digest = hashlib.sha1(info.encode('utf-8')).hexdigest()
+
+    return f'quote:{api_class.section}:{digest}'
+
+
+class QuoteCache:
+    """ Cache of carriers calculation results, stored in Django cache with alias 'quotes'
+    so that it can be shared between workers. Size and eviction are set by cache backend.
+    Results are also kept for stale_ttl to be shown when carrier is not available.
+    """
+    hits = Counter()
+    misses = Counter()
+    _lock = Lock()
+
+    def __init__(self, config):
+        """
+        config: instance of ConfigParser, reading config.ini
+        """
+        self.config = config
+        try:
+            self.cache = caches[CACHE_ALIAS]
+        except InvalidCacheBackendError:
+            self.cache = caches['default']
+
+    def get_ttl(self, api_class):
+        """ Get time to live of carrier results
+        api_class: DeliveryAPI subclass
+        Return: seconds, 0 if results must not be cached
+        """
+        default_ttl = self.config.getint('calculator', 'cache_ttl', fallback=DEFAULT_TTL)
+        return self.config.getint(api_class.section, 'cache_ttl', fallback=default_ttl)
+
+    def get(self, api_class, delivery_info: dict):
+        """ Get cached result of carrier calculation
+        api_class: DeliveryAPI subclass
+        delivery_info: info about delivery (arrival_city, derival_city, produce_date, cargo specs)
+        Return: result dictionary or None
+        """
+        if not self.get_ttl(api_class):
+            return None
+
+        result = self.cache.get(get_quote_key(api_class, delivery_info))
+
+        with self._lock:
+            if result is None:
+                self.misses[api_class.section] += 1
+            else:
+                self.hits[api_class.section] += 1
+
+        return result
+
+    def set(self, api_class, delivery_info: dict, result: dict):
+        """ Save successful result of carrier calculation
+        api_class: DeliveryAPI subclass
+        delivery_info: info about delivery (arrival_city, derival_city, produce_date, cargo specs)
+        result: result dictionary
+        """
+        ttl = self.get_ttl(api_class)
+
+        if ttl and not result['error']:
+            key = get_quote_key(api_class, delivery_info)
+            self.cache.set(key, result, ttl)
+            self.cache.set(f'{key}:stale', result, self.get_stale_ttl(api_class))
+
+    def get_stale_ttl(self, api_class):
+        """ Get time to live of carrier results shown when carrier is not available
+        api_class: DeliveryAPI subclass
+        Return: seconds
+        """
+        default_ttl = self.config.getint('calculator', 'stale_ttl', fallback=DEFAULT_STALE_TTL)
+        return self.config.getint(api_class.section, 'stale_ttl', fallback=default_ttl)
+
+    def get_stale(self, api_class, delivery_info: dict):
+        """ Get last successful result of carrier calculation, even if it has expired
+        api_class: DeliveryAPI subclass
+        delivery_info: info about delivery (arrival_city, derival_city, produce_date, cargo specs)
+        Return: result dictionary marked as stale or None
+        """
+        result = self.cache.get(f'{get_quote_key(api_class, delivery_info)}:stale')
+        if result is None:
+            return None
+
+        return dict(result, stale=True)
+
+    @classmethod
+    def stats(cls):
+        """ Get hits and misses of the process by carrier
+        Return: dict with hits and misses counters
+        """
+        with cls._lock:
+            return {
+                'hits': dict(cls.hits),
+                'misses': dict(cls.misses),
+            }
+
+
+class CityCache:
+    """ Cache of city ids resolved by API service, stored in Django cache with alias 'cities'.
+    Cities unknown to API service are kept as MISSING entries with their own ttl.
+    """
+    def __init__(self, section: str, ttl: int, negative_ttl: int):
+        """
+        section: carrier section of config
+        ttl: time to live of city ids in seconds
+        negative_ttl: time to live of MISSING entries in seconds
+        """
+        self.section = section
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        try:
+            self.cache = caches[CITIES_CACHE_ALIAS]
+        except InvalidCacheBackendError:
+            self.cache = caches['default']
+
+    def get_key(self, city: str, region: str):
+        """ Get key of city id
+        city: city name
+        region: region name
+        Return: key string
+        """
+        name = f'{normalize_text(city)}|{normalize_text(region)}'
+        digest = hashlib.sha1(name.encode('utf-8')).hexdigest()
+
+        return f'city:{self.section}:{digest}'
+
+    def get(self, city: str, region: str):
+        """ Get cached city id
+        city: city name
+        region: region name
+        Return: city id, MISSING if city is unknown to API service or None if city is not cached
+        """
+        return self.cache.get(self.get_key(city, region))
+
+    def set(self, city: str, region: str, city_id):
+        """ Save city id resolved by API service
+        city: city name
+        region: region name
+        city_id: city id or None if city is unknown to API service
+        """
+        if city_id:
+            self.cache.set(self.get_key(city, region), city_id, self.ttl)
+        else:
+            self.cache.set(self.get_key(city, region), MISSING, self.negative_ttl)
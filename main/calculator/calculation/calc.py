@@ -1,69 +1,180 @@
+from concurrent.futures import TimeoutError
 from configparser import ConfigParser
 from datetime import date, timedelta
-from queue import Queue
-from threading import Thread
+import asyncio
+import logging
+import time
 
-from .dellin import DellinAPI
-from .pecom import PecomAPI
-from .gtd import GtdAPI
-from .baikal import BaikalAPI
-from .nrgtk import NrgtkAPI
-from .dpd import DPDApi
+from httpx import HTTPError
+from requests import RequestException
+
+from .api import CALCULATION_ERROR, CONNECTION_ERROR, UNAVAILABLE_ERROR
+from .breaker import get_breaker
+from .cache import QuoteCache, get_quote_key
+from .dellin import AsyncDellinAPI, DellinAPI
+from .pecom import AsyncPecomAPI, PecomAPI
+from .gtd import AsyncGtdAPI, GtdAPI
+from .baikal import AsyncBaikalAPI, BaikalAPI
+from .nrgtk import AsyncNrgtkAPI, NrgtkAPI
+from .dpd import AsyncDPDApi, DPDApi
+from .metrics import metrics
+from .pool import get_async_client, get_option, get_pool
+from .singleflight import AsyncSingleFlight, SingleFlight
+
+
+DEFAULT_DEADLINE = 15
+TIMEOUT_ERROR = 'Превышено время ожидания'
+
+logger = logging.getLogger(__name__)
+
+CALCULATORS = (
+    DellinAPI,
+    PecomAPI,
+    GtdAPI,
+    BaikalAPI,
+    NrgtkAPI,
+    DPDApi,
+)
 
 
 class Calculator:
     """ Calculator class that gathers all delivery calculators and
     transfers config and delivery info to them.
     """
-    def __init__(self, delivery_info: dict):
+    flight = SingleFlight()
+
+    def __init__(self, delivery_info: dict, profiler=None):
+        """
+        delivery_info: info about delivery (arrival_city, derival_city, produce_date, cargo specs)
+        profiler: QuoteProfiler if carriers jobs must be profiled
+        """
         self.config = ConfigParser()
         self.config.read('assets/data/config.ini')
         self.delivery_info = delivery_info
         self.delivery_info['produce_date'] = self.get_date()
-        self.calculators = [
-            DellinAPI,
-            PecomAPI,
-            GtdAPI,
-            BaikalAPI,
-            NrgtkAPI,
-            DPDApi,
-        ]
+        self.calculators = list(CALCULATORS)
+        self.cache = QuoteCache(self.config)
         self.result = []
+        self.timings = {}
+        self.profiler = profiler
 
-    def thread_run(self, work: Queue, result: Queue):
-        """ Function for running in threads
-        work: queue with calc functions
-        param: queue to put results from calc functions
+    def run_calculator(self, api_class):
+        """ Function for running in the carrier pool, identical calculations
+        in progress are made once, carriers with open circuit breaker are not requested
+        api_class: DeliveryAPI subclass
+        Return: result of calculation
         """
-        while not work.empty():
-            api_class = work.get_nowait()
+        result = self.cache.get(api_class, self.delivery_info)
+        if result is not None:
+            return result
+
+        if not get_breaker(self.config, api_class.section).allow():
+            return self.get_fallback(api_class)
+
+        key = get_quote_key(api_class, self.delivery_info)
+        return self.flight.do(key, self.request_calculator, api_class)
+
+    def get_fallback(self, api_class):
+        """ Get result of carrier which circuit breaker is open
+        api_class: DeliveryAPI subclass
+        Return: last result of calculation marked as stale, if it is enabled and cached, or error result
+        """
+        if get_option(self.config, api_class.section, 'stale_fallback', True, 'getboolean'):
+            result = self.cache.get_stale(api_class, self.delivery_info)
+            if result is not None:
+                return result
+
+        return api_class.error_result(UNAVAILABLE_ERROR)
+
+    def request_calculator(self, api_class):
+        """ Get result of calculation from API service and save it to cache,
+        time of calculation phases is saved to self.timings
+        api_class: DeliveryAPI subclass
+        Return: result of calculation
+        """
+        try:
             api = api_class(self.config, self.delivery_info)
-            res = api.calculate()
-            result.put_nowait(res)
-            work.task_done()
+            self.timings[api_class.section] = api.timings
+            result = api.calculate()
+        except RequestException:
+            return api_class.error_result(CONNECTION_ERROR)
+        except Exception:
+            # unexpected response of one carrier must not fail the others
+            logger.exception('Calculation of %s has failed', api_class.section)
+            return api_class.error_result(CALCULATION_ERROR)
+
+        self.cache.set(api_class, self.delivery_info, result)
+
+        return result
+
+    def get_deadline(self, api_class):
+        """ Get time budget of carrier calculation, limited by overall deadline
+        api_class: DeliveryAPI subclass
+        Return: seconds
+        """
+        deadline = self.config.getfloat('calculator', 'deadline', fallback=DEFAULT_DEADLINE)
+        return min(deadline, self.config.getfloat(api_class.section, 'deadline', fallback=deadline))
 
     def calculate(self):
-        """ Get result massages from all calc from self.calculators using queues and
-        concatenate them in self.result string.
+        """ Get result massages from all calc from self.calculators using shared carrier pool and
+        concatenate them in self.result string. Calculators not finished within their deadline
+        are marked as timed out.
         Return: result massage
         """
-        thread_count = len(self.calculators)
-        work_queue = Queue()
-        result_queue = Queue()
+        pool = self.get_pool()
+        started = time.monotonic()
+        jobs = [(calc, pool.submit(self.get_job(calc), calc)) for calc in self.calculators]
+
+        for calc, future in jobs:
+            remaining = started + self.get_deadline(calc) - time.monotonic()
+            try:
+                self.add_result(calc, future.result(timeout=max(remaining, 0)))
+            except TimeoutError:
+                pool.cancel(future)
+                self.add_result(calc, calc.error_result(TIMEOUT_ERROR), 'timeout')
+            except Exception:
+                logger.exception('Calculation of %s has failed', calc.section)
+                self.add_result(calc, calc.error_result(CALCULATION_ERROR))
 
-        for calc in self.calculators:
-            work_queue.put(calc)
+        self.record_duration(started)
 
-        for _ in range(thread_count):
-            thread = Thread(target=self.thread_run, args=(work_queue, result_queue), daemon=True)
-            thread.start()
+        return sorted(self.result, key=lambda x: x['name'])
 
-        work_queue.join()
+    def get_pool(self):
+        """ Get pool running carriers jobs of calculation
+        Return: CarrierPool of the current process
+        """
+        return get_pool(self.config)
 
-        while not result_queue.empty():
-            self.result.append(result_queue.get_nowait())
+    def get_job(self, api_class):
+        """ Get function calculating carrier in carrier pool
+        api_class: DeliveryAPI subclass
+        Return: run_calculator, wrapped by profiler if calculation is profiled
+        """
+        if self.profiler is None:
+            return self.run_calculator
 
-        return sorted(self.result, key=lambda x: x['name'])
+        return self.profiler.wrap(api_class.section, self.run_calculator)
+
+    def add_result(self, api_class, result: dict, outcome: str = None):
+        """ Add result of carrier calculation to self.result and metrics
+        api_class: DeliveryAPI subclass
+        result: result dictionary
+        outcome: label of result in metrics, taken from result if not set
+        """
+        if outcome is None:
+            outcome = 'stale' if result.get('stale') else 'error' if result['error'] else 'ok'
+
+        metrics.inc('carrier_calculations_total', {'carrier': api_class.section, 'result': outcome})
+        self.result.append(result)
+
+    @staticmethod
+    def record_duration(started: float):
+        """ Save duration of calculation to metrics, metrics of the process are saved
+        for metrics endpoint in background
+        started: time.monotonic() value at start of calculation
+        """
+        metrics.observe('calculator_duration_seconds', {}, time.monotonic() - started)
 
     @staticmethod
     def get_date():
@@ -73,3 +184,90 @@ class Calculator:
         elapsed_date = date.today() + timedelta(days=1)
 
         return elapsed_date.strftime('%Y-%m-%d')
+
+
+class AsyncCalculator(Calculator):
+    """ Calculator that runs all delivery calculators on the current event loop """
+    flight = AsyncSingleFlight()
+
+    def __init__(self, delivery_info: dict):
+        super().__init__(delivery_info)
+        self.calculators = [
+            AsyncDellinAPI,
+            AsyncPecomAPI,
+            AsyncGtdAPI,
+            AsyncBaikalAPI,
+            AsyncNrgtkAPI,
+            AsyncDPDApi,
+        ]
+
+    async def run_calculator(self, api_class, client):
+        """ Coroutine running calculation of one delivery calculator, identical
+        calculations in progress are made once, carriers with open circuit breaker are not requested
+        api_class: AsyncDeliveryAPI subclass
+        client: httpx.AsyncClient shared by calculators
+        Return: result of calculation
+        """
+        result = self.cache.get(api_class, self.delivery_info)
+        if result is not None:
+            return result
+
+        if not get_breaker(self.config, api_class.section).allow():
+            return self.get_fallback(api_class)
+
+        key = get_quote_key(api_class, self.delivery_info)
+        return await self.flight.do(key, self.request_calculator, api_class, client)
+
+    async def request_calculator(self, api_class, client):
+        """ Get result of calculation from API service and save it to cache,
+        time of calculation phases is saved to self.timings
+        api_class: AsyncDeliveryAPI subclass
+        client: httpx.AsyncClient shared by calculators
+        Return: result of calculation
+        """
+        try:
+            api = api_class(self.config, self.delivery_info, client)
+            self.timings[api_class.section] = api.timings
+            result = await api.calculate()
+        except HTTPError:
+            return api_class.error_result(CONNECTION_ERROR)
+        except Exception:
+            # unexpected response of one carrier must not fail the others
+            logger.exception('Calculation of %s has failed', api_class.section)
+            return api_class.error_result(CALCULATION_ERROR)
+
+        self.cache.set(api_class, self.delivery_info, result)
+
+        return result
+
+    async def calculate(self):
+        """ Get result massages from all calc from self.calculators running concurrently and
+        concatenate them in self.result string. Calculators not finished within their deadline
+        are cancelled and marked as timed out.
+        Return: result massage
+        """
+        client = get_async_client(self.config)
+        started = time.monotonic()
+        jobs = [(calc, asyncio.ensure_future(self.run_calculator(calc, client))) for calc in self.calculators]
+
+        try:
+            for calc, task in jobs:
+                remaining = started + self.get_deadline(calc) - time.monotonic()
+                try:
+                    self.add_result(calc, await asyncio.wait_for(task, timeout=max(remaining, 0)))
+                except asyncio.TimeoutError:
+                    self.add_result(calc, calc.error_result(TIMEOUT_ERROR), 'timeout')
+                except Exception:
+                    logger.exception('Calculation of %s has failed', calc.section)
+                    self.add_result(calc, calc.error_result(CALCULATION_ERROR))
+        finally:
+            # tasks left by cancelled calculation are stopped and their errors are retrieved
+            for _, task in jobs:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()
+
+        self.record_duration(started)
+
+        return sorted(self.result, key=lambda x: x['name'])
@@ -4,25 +4,74 @@ import datetime
 import json
 import math
 
-import requests
+from .api import AsyncDeliveryAPI, DeliveryAPI
+from .directories import FileIndex
+from .sessions import SessionManager
 
-from .api import DeliveryAPI
+
+BASE_API_URL = 'https://api.dellin.ru'
+TERMINALS_PATH = 'assets/data/terminals_v3.json'
+DEFAULT_SESSION_TTL = 3000
+
+
+def build_terminal_index(path: str):
+    """ Create index of dellin terminals from terminals_v3.json file
+    path: path to terminals file
+    Return: dict with kladr codes of cities as keys and ids of their first terminals as values
+    """
+    with open(path, 'r') as f:
+        cities = json.load(f)
+
+    index = {}
+    for city in cities['city']:
+        city_terminals = city['terminals']['terminal']
+        if city_terminals:
+            index.setdefault(city['code'], city_terminals[0]['id'])
+
+    return index
+
+
+sessions = SessionManager()
+terminals = FileIndex(TERMINALS_PATH, build_terminal_index)
 
 
 class DellinAPI(DeliveryAPI):
     """ Class provides communicate with API service """
+    name = 'Деловые Линии'
+    section = 'dellin'
+
     def __init__(self, config, delivery_info):
         """
         config: instance of ConfigParser, reading config.ini
         delivery_info: info about delivery (arrival_city, derival_city, produce_date, cargo specs)
         """
-        self.base_api_url = 'https://api.dellin.ru'
+        self.base_api_url = config.get('dellin', 'base_url', fallback=BASE_API_URL)
         self.appkey = config['dellin']['appkey']
         self.login = config['dellin']['login']
         self.password = config['dellin']['pass']
-        self.session_id = self._get_session_id()
-        super().__init__(delivery_info)
-        self.result['name'] = 'Деловые Линии'
+        self.session_ttl = config.getfloat('dellin', 'session_ttl', fallback=DEFAULT_SESSION_TTL)
+        self.session_id = None
+        super().__init__(config, delivery_info)
+
+    def _authorize(self):
+        """ Get session id shared by all DellinAPI instances for future api requests
+        Return: True if session id is received
+        """
+        self.session_id = sessions.get(self._get_session_id, self.session_ttl)
+        if not self.session_id:
+            self.result['error'] = 'Ошибка соединения'
+
+        return bool(self.session_id)
+
+    def _renew_session(self):
+        """ Login again after session id was rejected by API
+        Return: True if new session id is received
+        """
+        sessions.invalidate(self.session_id)
+        self.session_id = sessions.get(self._get_session_id, self.session_ttl)
+        self.body['sessionID'] = self.session_id
+
+        return bool(self.session_id)
 
     def _get_session_id(self):
         """ Get session id for future api requests
@@ -30,22 +79,28 @@ class DellinAPI(DeliveryAPI):
         """
         url = f'{self.base_api_url}/v3/auth/login.json'
 
-        resp = requests.post(url,
+        resp = self._request('post', url,
                              json={'appkey': self.appkey,
                                    'login': self.login,
                                    'password': self.password
                                    },
                              headers={'content-type': 'application/json'})
 
+        return self._parse_session_id(resp)
+
+    @staticmethod
+    def _parse_session_id(resp):
+        """ Get session id from login response
+        resp: response of login request
+        Return: sessionID or None
+        """
         if resp.status_code == 200:
             resp_json = resp.json()
             return resp_json['data']['sessionID']
-        else:
-            self.result['error'] = 'Ошибка соединения'
 
         return None
 
-    def _get_city_code(self, check_city: str, check_region: str):
+    def _get_city_id(self, check_city: str, check_region: str):
         """ Get code of city
         check_city: city name
         check_region: region name
@@ -53,11 +108,20 @@ class DellinAPI(DeliveryAPI):
         """
         url = f'{self.base_api_url}/v2/public/kladr.json'
 
-        resp = requests.post(url,
+        resp = self._request('post', url, hedge=True,
                              json={'appkey': self.appkey,
                                    'q': check_city.lower()},
                              headers={'content-type': 'application/json'})
 
+        return self._parse_city_id(resp, check_city, check_region)
+
+    def _parse_city_id(self, resp, check_city: str, check_region: str):
+        """ Get code of city from kladr response
+        resp: response of kladr request
+        check_city: city name
+        check_region: region name
+        Return: city code or None
+        """
         if resp.status_code == 200:
             resp_json = resp.json()
             try:
@@ -80,73 +144,61 @@ class DellinAPI(DeliveryAPI):
 
     @staticmethod
     def _get_terminal_id(city_code: str):
-        """ Get id of dellin terminal from terminal_v3.json file in data folder
+        """ Get id of dellin terminal from index of terminal_v3.json file in data folder
         city_code: kladr code of city
         Return: terminal id or None
         """
-        with open('assets/data/terminals_v3.json', 'r') as f:
-            content = f.read()
-            cities = json.loads(content)
-
-        for city in cities['city']:
-            if city['code'] == city_code:
-                return city['terminals']['terminal'][0]['id']
+        return terminals.get().get(city_code)
 
-        return None
-
-    def _get_request_body(self):
+    def _build_request_body(self, derival_code, arrival_code):
         """ Create final body for request to API
+        derival_code: kladr code of derival city
+        arrival_code: kladr code of arrival city
         Return: request body
         """
-        arrival_code = self._get_city_code(self.arrival_city, self.arrival_region)
-        derival_code = self._get_city_code(self.derival_city, self.derival_region)
-
-        if arrival_code and derival_code:
-            body = {
-                'appkey': self.appkey,
-                'sessionID': self.session_id,
-                'delivery': {
-                    'deliveryType': {
-                        'type': 'auto'
-                    },
-                    'arrival': {
-                        'variant': 'terminal',
-                        'city': arrival_code,
-                    },
-                    'derival': {
-                        'produceDate': self.date,
-                        'variant': 'terminal',
-                        'terminalID': self._get_terminal_id(derival_code)
-                    },
+        body = {
+            'appkey': self.appkey,
+            'sessionID': self.session_id,
+            'delivery': {
+                'deliveryType': {
+                    'type': 'auto'
                 },
-                'members': {
-                    'requester': {
-                        'role': 'sender'
-                    }
+                'arrival': {
+                    'variant': 'terminal',
+                    'city': arrival_code,
                 },
-                'cargo': {
-                    'length': self.cargo['length'],
-                    'width': self.cargo['width'],
-                    'height': self.cargo['height'],
-                    'totalVolume': self.cargo['volume'],
-                    'totalWeight': self.cargo['weight'],
-                    'hazardClass': 0
+                'derival': {
+                    'produceDate': self.date,
+                    'variant': 'terminal',
+                    'terminalID': self._get_terminal_id(derival_code)
                 },
-                'payment': {
-                    'paymentCity': arrival_code,
-                    'type': 'cash'
+            },
+            'members': {
+                'requester': {
+                    'role': 'sender'
                 }
+            },
+            'cargo': {
+                'length': self.cargo['length'],
+                'width': self.cargo['width'],
+                'height': self.cargo['height'],
+                'totalVolume': self.cargo['volume'],
+                'totalWeight': self.cargo['weight'],
+                'hazardClass': 0
+            },
+            'payment': {
+                'paymentCity': arrival_code,
+                'type': 'cash'
             }
+        }
 
-            if self.cargo['weight'] >= 80:
-                weight = self.cargo['weight']
-                quantity = math.ceil(weight / 75)
-                body['cargo']['quantity'] = quantity
-                body['cargo']['weight'] = round(weight / quantity, 1)
+        if self.cargo['weight'] >= 80:
+            weight = self.cargo['weight']
+            quantity = math.ceil(weight / 75)
+            body['cargo']['quantity'] = quantity
+            body['cargo']['weight'] = round(weight / quantity, 1)
 
-            return body
-
-        return None
+        return body
 
     def _get_delivery_calc(self):
         """ Get result of calculation in json format
@@ -154,29 +206,21 @@ class DellinAPI(DeliveryAPI):
         """
         url = f'{self.base_api_url}/v2/calculator.json'
 
-        if not self.result['error']:
-            resp = requests.post(url,
+        resp = self._request('post', url, hedge=True,
+                             json=self.body,
+                             headers={'content-type': 'application/json'})
+
+        if resp.status_code == 401 and self._renew_session():
+            resp = self._request('post', url, hedge=True,
                                  json=self.body,
                                  headers={'content-type': 'application/json'})
 
-            if resp.status_code == 200:
-                return resp.json()
-            else:
-                self.result['error'] = 'Ошибка соединения'
-
-        return None
+        return self._read_json(resp)
 
-    def calculate(self):
-        """ Main function to calculate delivery cost and time
-        Return: result dictionary
+    def _parse_delivery_calc(self, calculation):
+        """ Get delivery cost and time from calculation result
+        calculation: calculation result in json format
         """
-        if not self.session_id or not self.body:
-            return self.result
-
-        calculation = self._get_delivery_calc()
-        if not calculation:
-            return self.result
-
         try:
             derival_date = datetime.datetime.strptime(
                 self.date,
@@ -198,4 +242,79 @@ class DellinAPI(DeliveryAPI):
         except KeyError or IndexError:
             self.result['error'] = 'Ошибка расчета данных'
 
-        return self.result
+
+class AsyncDellinAPI(AsyncDeliveryAPI, DellinAPI):
+    """ Class provides communicate with API service on event loop """
+    async def _get_request_body(self):
+        """ Create final body for request to API, terminals index is needed to find derival terminal
+        Return: request body or None
+        """
+        await terminals.get_async()
+        return await super()._get_request_body()
+
+    async def _authorize(self):
+        """ Get session id shared by all DellinAPI instances for future api requests
+        Return: True if session id is received
+        """
+        self.session_id = await sessions.get_async(self._get_session_id, self.session_ttl)
+        if not self.session_id:
+            self.result['error'] = 'Ошибка соединения'
+
+        return bool(self.session_id)
+
+    async def _renew_session(self):
+        """ Login again after session id was rejected by API
+        Return: True if new session id is received
+        """
+        sessions.invalidate(self.session_id)
+        self.session_id = await sessions.get_async(self._get_session_id, self.session_ttl)
+        self.body['sessionID'] = self.session_id
+
+        return bool(self.session_id)
+
+    async def _get_session_id(self):
+        """ Get session id for future api requests
+        Return: sessionID or None
+        """
+        url = f'{self.base_api_url}/v3/auth/login.json'
+
+        resp = await self._request('post', url,
+                                   json={'appkey': self.appkey,
+                                         'login': self.login,
+                                         'password': self.password
+                                         },
+                                   headers={'content-type': 'application/json'})
+
+        return self._parse_session_id(resp)
+
+    async def _get_city_id(self, check_city: str, check_region: str):
+        """ Get code of city
+        check_city: city name
+        check_region: region name
+        Return: city code or None
+        """
+        url = f'{self.base_api_url}/v2/public/kladr.json'
+
+        resp = await self._request('post', url, hedge=True,
+                                   json={'appkey': self.appkey,
+                                         'q': check_city.lower()},
+                                   headers={'content-type': 'application/json'})
+
+        return self._parse_city_id(resp, check_city, check_region)
+
+    async def _get_delivery_calc(self):
+        """ Get result of calculation in json format
+        Return: calculation result or None
+        """
+        url = f'{self.base_api_url}/v2/calculator.json'
+
+        resp = await self._request('post', url, hedge=True,
+                                   json=self.body,
+                                   headers={'content-type': 'application/json'})
+
+        if resp.status_code == 401 and await self._renew_session():
+            resp = await self._request('post', url, hedge=True,
+                                       json=self.body,
+                                       headers={'content-type': 'application/json'})
+
+        return self._read_json(resp)
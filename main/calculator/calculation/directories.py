@@ -0,0 +1,347 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+import asyncio
+import json
+import os
+import pickle
+import tempfile
+import time
+
+from django.core.cache import InvalidCacheBackendError, caches
+
+from .cache import normalize_text
+from .pool import get_pool, run_blocking
+
+
+MANIFEST_PATH = 'assets/data/directories.json'
+
+
+@contextmanager
+def atomic_file(path: str):
+    """ Open temporary file that replaces file at path when block finishes without errors,
+    so readers see either old or new content, never partial one
+    path: path to file
+    Return: temporary file opened for binary writing
+    """
+    f = tempfile.NamedTemporaryFile(dir=os.path.dirname(path) or '.', prefix='.tmp-', delete=False)
+    try:
+        with f:
+            yield f
+        os.replace(f.name, path)
+    except BaseException:
+        os.unlink(f.name)
+        raise
+
+
+def write_atomic(path: str, data: bytes):
+    """ Write file so that readers see either old or new content, never partial one
+    path: path to file
+    data: new content of file
+    """
+    with atomic_file(path) as f:
+        f.write(data)
+
+
+def read_manifest(path: str = MANIFEST_PATH):
+    """ Get info about snapshots saved by sync_carrier_directories command
+    path: path to manifest file
+    Return: dict with snapshots paths as keys and dicts with sync info as values
+    """
+    try:
+        with open(path, 'rb') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(manifest: dict, path: str = MANIFEST_PATH):
+    """ Save info about snapshots
+    manifest: dict with snapshots paths as keys and dicts with sync info as values
+    path: path to manifest file
+    """
+    write_atomic(path, json.dumps(manifest, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+
+
+def compile_index(source: str, compiled: str, build):
+    """ Create index from data file and save it in binary form
+    source: path to data file
+    compiled: path to compiled index file
+    build: function creating index from data file path
+    Return: index
+    """
+    index = build(source)
+    write_atomic(compiled, pickle.dumps(index, pickle.HIGHEST_PROTOCOL))
+
+    return index
+
+
+def load_compiled_index(source: str, compiled: str, build):
+    """ Load index compiled from data file, compile it again if data file is newer
+    source: path to data file
+    compiled: path to compiled index file
+    build: function creating index from data file path
+    Return: index
+    """
+    try:
+        if os.stat(compiled).st_mtime_ns >= os.stat(source).st_mtime_ns:
+            with open(compiled, 'rb') as f:
+                return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass
+
+    return compile_index(source, compiled, build)
+
+
+class FileIndex:
+    """ Index built from data file once and rebuilt only when the file is modified """
+    def __init__(self, path: str, build):
+        """
+        path: path to data file
+        build: function creating index from data file path
+        """
+        self.path = path
+        self.build = build
+        self._lock = Lock()
+        self._mtime = None
+        self._index = None
+
+    def get(self):
+        """ Get index of current version of data file
+        Return: index created by build function
+        """
+        mtime = os.stat(self.path).st_mtime_ns
+
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    self._index = self.build(self.path)
+                    self._mtime = mtime
+
+        return self._index
+
+    async def get_async(self):
+        """ Get index of current version of data file, index is built in thread
+        Return: index created by build function
+        """
+        if os.stat(self.path).st_mtime_ns != self._mtime:
+            return await run_blocking(self.get)
+
+        return self._index
+
+
+class CachedDirectory:
+    """ Index of directory downloaded from API service. Index is kept in memory and
+    in Django cache 'directories', so it is downloaded by one worker at most once per
+    refresh interval and shared with others. Outdated index is used while new one
+    is downloaded in background. Snapshot of directory saved by sync_carrier_directories
+    command is used instead of download while it is not outdated, snapshot confirmed
+    by the command without changes is not loaded again.
+    """
+    def __init__(self, name: str, path: str = None, load=None):
+        """
+        name: name of directory in cache
+        path: path to snapshot file of directory
+        load: function creating index from snapshot file path
+        """
+        self.key = f'directory:{name}'
+        self.lock_key = f'directory:{name}:lock'
+        self.path = path
+        self.load = load
+        self._lock = Lock()
+        self._index = None
+        self._updated = 0
+        self._snapshot_mtime = None
+        self._refreshing = False
+        self._tasks = set()
+
+    @staticmethod
+    def _get_cache():
+        """ Get cache shared between workers
+        Return: Django cache
+        """
+        try:
+            return caches['directories']
+        except InvalidCacheBackendError:
+            return caches['default']
+
+    def _lookup(self, interval: float):
+        """ Get index from memory or from cache if index in memory is outdated
+        interval: refresh interval in seconds
+        Return: (index or None, True if index is outdated)
+        """
+        if self._index is None or time.time() - self._updated >= interval:
+            cached = self._get_cache().get(self.key)
+            if cached is not None and cached[1] > self._updated:
+                self._index, self._updated = cached
+
+        return self._index, time.time() - self._updated >= interval
+
+    def _claim(self, interval: float):
+        """ Take the right to download directory for all workers
+        interval: refresh interval in seconds
+        Return: True if this caller must download directory
+        """
+        with self._lock:
+            if self._refreshing:
+                return False
+            if not self._get_cache().add(self.lock_key, os.getpid(), timeout=interval):
+                return False
+            self._refreshing = True
+
+        return True
+
+    def _load_snapshot(self, interval: float):
+        """ Get index from snapshot file if it was checked later than index in memory was updated
+        and is not outdated
+        interval: refresh interval in seconds
+        Return: (index or None, time of snapshot check)
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime if self.path else 0
+        except OSError:
+            mtime = 0
+        if not mtime:
+            return None, 0
+
+        checked = max(mtime, read_manifest().get(self.path, {}).get('checked', 0))
+        if checked <= self._updated or time.time() - checked >= interval:
+            return None, 0
+
+        if self._index is not None and mtime == self._snapshot_mtime:
+            return self._index, checked
+
+        index = self.load(self.path)
+        self._snapshot_mtime = mtime
+
+        return index, checked
+
+    def _fetch(self, fetch, interval: float):
+        """ Get index from snapshot or download it
+        fetch: function returning index or None
+        interval: refresh interval in seconds
+        Return: (index or None, time of index)
+        """
+        index, updated = self._load_snapshot(interval)
+        if index is None:
+            index, updated = fetch(), time.time()
+
+        return index, updated
+
+    async def _fetch_async(self, fetch, interval: float):
+        """ Get index from snapshot or download it
+        fetch: coroutine function returning index or None
+        interval: refresh interval in seconds
+        Return: (index or None, time of index)
+        """
+        index, updated = await run_blocking(self._load_snapshot, interval)
+        if index is None:
+            index, updated = await fetch(), time.time()
+
+        return index, updated
+
+    def _store(self, index, updated: float):
+        """ Save downloaded index to memory and cache
+        index: new index
+        updated: time of index
+        """
+        with self._lock:
+            self._index = index
+            self._updated = updated
+            self._get_cache().set(self.key, (self._index, self._updated), None)
+
+    def _release(self, index, updated: float):
+        """ Finish background download, on failure let other workers download directory
+        index: new index or None if download has failed
+        updated: time of index
+        """
+        if index is not None:
+            self._store(index, updated)
+        else:
+            self._get_cache().delete(self.lock_key)
+
+        with self._lock:
+            self._refreshing = False
+
+    def _refresh(self, fetch, interval: float):
+        """ Download directory in background
+        fetch: function returning index or None
+        interval: refresh interval in seconds
+        """
+        index, updated = None, 0
+        try:
+            index, updated = self._fetch(fetch, interval)
+        finally:
+            self._release(index, updated)
+
+    async def _refresh_async(self, fetch, interval: float):
+        """ Download directory in background on event loop
+        fetch: coroutine function returning index or None
+        interval: refresh interval in seconds
+        """
+        index, updated = None, 0
+        try:
+            index, updated = await self._fetch_async(fetch, interval)
+        finally:
+            self._release(index, updated)
+
+    def get(self, fetch, interval: float):
+        """ Get index, download directory if there is no index yet
+        fetch: function returning index or None
+        interval: refresh interval in seconds
+        Return: index or None
+        """
+        index, outdated = self._lookup(interval)
+
+        if index is None:
+            index, updated = self._fetch(fetch, interval)
+            if index is not None:
+                self._store(index, updated)
+        elif outdated and self._claim(interval):
+            get_pool().submit(self._refresh, fetch, interval)
+
+        return index
+
+    async def get_async(self, fetch, interval: float):
+        """ Get index, download directory if there is no index yet
+        fetch: coroutine function returning index or None
+        interval: refresh interval in seconds
+        Return: index or None
+        """
+        index, outdated = self._lookup(interval)
+
+        if index is None:
+            index, updated = await self._fetch_async(fetch, interval)
+            if index is not None:
+                self._store(index, updated)
+        elif outdated and self._claim(interval):
+            task = asyncio.ensure_future(self._refresh_async(fetch, interval))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        return index
+
+
+class PrefixIndex:
+    """ Names sorted for search by beginning of name """
+    def __init__(self, items):
+        """
+        items: iterable of (name, value)
+        """
+        pairs = sorted((normalize_text(name), value) for name, value in items)
+        self.names = [name for name, _ in pairs]
+        self.values = [value for _, value in pairs]
+
+    def find(self, prefix: str):
+        """ Get values of names starting with prefix
+        prefix: beginning of name
+        Return: list of values
+        """
+        prefix = normalize_text(prefix)
+        start = bisect_left(self.names, prefix)
+        end = start
+
+        while end < len(self.names) and self.names[end].startswith(prefix):
+            end += 1
+
+        return self.values[start:end]
@@ -1,46 +1,186 @@
 from xml.etree import ElementTree as et
 import csv
 
-import requests
+from .api import AsyncDeliveryAPI, DeliveryAPI
+from .cache import normalize_text
+from .directories import FileIndex, load_compiled_index
 
-from .api import DeliveryAPI
+
+BASE_API_URL = 'http://wstest.dpd.ru/services'
+GEOGRAPHY_PATH = 'assets/data/dpd-geography.csv'
+TERMINALS_PATH = 'assets/data/dpd-terminals.xml'
+REQUEST_TEMPLATE = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<soap:Envelope'
+    ' xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"'
+    ' xmlns:ns0="http://dpd.ru/ws/calculator/2012-03-20"'
+    ' xmlns:xs="http://www.w3.org/2001/XMLSchema"'
+    ' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+    '<soap:Body>'
+    '<ns0:getServiceCost2>'
+    '<request>'
+    '<auth>'
+    '<clientNumber>{client_num}</clientNumber>'
+    '<clientKey>{client_key}</clientKey>'
+    '</auth>'
+    '<pickup>'
+    '<cityId>{derival_city_id}</cityId>'
+    '<countryCode>RU</countryCode>'
+    '</pickup>'
+    '<delivery>'
+    '<cityId>{arrival_city_id}</cityId>'
+    '<countryCode>RU</countryCode>'
+    '</delivery>'
+    '<selfPickup>true</selfPickup>'
+    '<selfDelivery>{self_delivery}</selfDelivery>'
+    '<weight>{weight}</weight>'
+    '<volume>{volume}</volume>'
+    '</request>'
+    '</ns0:getServiceCost2>'
+    '</soap:Body>'
+    '</soap:Envelope>'
+)
+TERMINALS_REQUEST_TEMPLATE = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<soap:Envelope'
+    ' xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"'
+    ' xmlns:ns0="http://dpd.ru/ws/geography/2015-05-20">'
+    '<soap:Body>'
+    '<ns0:getTerminalsSelfDelivery2>'
+    '<auth>'
+    '<clientNumber>{client_num}</clientNumber>'
+    '<clientKey>{client_key}</clientKey>'
+    '</auth>'
+    '</ns0:getTerminalsSelfDelivery2>'
+    '</soap:Body>'
+    '</soap:Envelope>'
+)
+COMPILED_GEOGRAPHY_PATH = 'assets/data/dpd-geography.pickle'
+PARSE_CHUNK_SIZE = 64 * 1024
+
+
+def build_geography_index(path: str):
+    """ Create index of DPD cities from dpd-geography.csv file
+    path: path to geography file
+    Return: dict with normalized city names as keys and tuples of (city id, normalized region) as values
+    """
+    index = {}
+
+    with open(path, encoding='windows-1251', newline='') as file:
+        reader = csv.reader(file, delimiter=';')
+        for row in reader:
+            if len(row) > 4:
+                index.setdefault(normalize_text(row[3]), []).append((row[0], normalize_text(row[4])))
+
+    return {city: tuple(matches) for city, matches in index.items()}
+
+
+def load_geography_index(path: str):
+    """ Load compiled index of DPD cities, compile it if geography file has changed
+    path: path to geography file
+    Return: index of DPD cities
+    """
+    return load_compiled_index(path, COMPILED_GEOGRAPHY_PATH, build_geography_index)
+
+
+def build_terminal_cities(path: str):
+    """ Get ids of cities with DPD terminals from dpd-terminals.xml file, the file
+    may be flat list of terminals or SOAP response of getTerminalsSelfDelivery2
+    path: path to terminals file
+    Return: frozenset of city ids
+    """
+    city_ids = set()
+    parents = []
+
+    for event, element in et.iterparse(path, events=('start', 'end')):
+        if event == 'start':
+            parents.append(element)
+            continue
+
+        parents.pop()
+        if element.tag == 'cityId':
+            city_ids.add(element.text)
+        elif element.tag == 'terminal' and parents:
+            # terminal is read, drop it and previous terminals so that the whole tree is never kept in memory
+            del parents[-1][:]
+
+    return frozenset(city_ids)
+
+
+def iter_tariffs(calculation: bytes):
+    """ Read tariffs from calculation result chunk by chunk, parsed tariffs are dropped
+    calculation: calculation result in xml format
+    Return: generator of (cost, days) of tariffs
+    """
+    parser = et.XMLPullParser()
+    cost, days = None, None
+
+    for start in range(0, len(calculation), PARSE_CHUNK_SIZE):
+        parser.feed(calculation[start:start + PARSE_CHUNK_SIZE])
+
+        for _, element in parser.read_events():
+            if element.tag == 'cost':
+                cost = element.text
+            elif element.tag == 'days':
+                days = element.text
+            elif element.tag == 'return':
+                if cost is not None:
+                    yield cost, days
+                cost, days = None, None
+                element.clear()
+
+    parser.close()
+
+
+def find_cheapest_tariff(calculation: bytes):
+    """ Find the cheapest tariff in one pass over calculation result without building xml tree
+    calculation: calculation result in xml format
+    Return: (cost, days) of the cheapest tariff or None
+    """
+    cheapest, min_cost = None, None
+
+    for cost, days in iter_tariffs(calculation):
+        if min_cost is None or float(cost) < min_cost:
+            cheapest, min_cost = (cost, days), float(cost)
+
+    return cheapest
+
+
+geography = FileIndex(GEOGRAPHY_PATH, load_geography_index)
+terminals = FileIndex(TERMINALS_PATH, build_terminal_cities)
 
 
 class DPDApi(DeliveryAPI):
     """ Class provides communicate with API service """
+    name = 'DPD'
+    section = 'dpd'
+
     def __init__(self, config, delivery_info: dict):
         """
         config: instance of ConfigParser, reading config.ini
         delivery_info: info about delivery (arrival_city, derival_city, produce_date, cargo specs)
         """
-        self.base_api_url = 'http://wstest.dpd.ru/services'
+        self.base_api_url = config.get('dpd', 'base_url', fallback=BASE_API_URL)
         self.client_num = config['dpd']['client_num']
         self.client_key = config['dpd']['client_key']
-        super().__init__(delivery_info)
-        self.result['name'] = 'DPD'
+        super().__init__(config, delivery_info)
 
     def _get_city_id(self, check_city: str, check_region: str):
-        """ Get id of terminal branch in city from dpd-terminals.xml file in data folder
+        """ Get id of city from compiled index of dpd-geography.csv file in data folder
         check_city: city name
         check_region: region name
-        Return: branch id or None
+        Return: city id or None
         """
-        matches = []
-
-        with open('assets/data/dpd-geography.csv', encoding='windows-1251', newline='') as file:
-            reader = csv.reader(file, delimiter=';')
-            for row in reader:
-                if row and row[3].lower() == check_city.lower():
-                    matches.append(row)
+        matches = geography.get().get(normalize_text(check_city), ())
 
         if len(matches) == 1:
             return matches[0][0]
         elif len(matches) > 1:
             if check_region:
-                region = self._get_clean_region(check_region)
-                for address in matches:
-                    if region in address[4].lower():
-                        return address[0]
+                region = self._get_clean_region(normalize_text(check_region))
+                for city_id, city_region in matches:
+                    if region in city_region:
+                        return city_id
                 self.result['error'] = f'{check_city} ({check_region}): нет терминала'
             else:
                 self.result['error'] = f'Уточните регионы'
@@ -52,66 +192,26 @@ class DPDApi(DeliveryAPI):
     @staticmethod
     def _check_arrival_terminal(city_id: str):
         """ Check if terminal in the city
-        city_id: city name
+        city_id: city id
         return True or False
         """
-        with open('assets/data/dpd-terminals.xml', 'r') as f:
-            content = f.read()
-            root = et.fromstring(content)
-
-        for terminal_id in root.findall('.//cityId'):
-            if city_id == terminal_id.text:
-                return True
-
-        return False
+        return city_id in terminals.get()
 
-    def _get_request_body(self):
+    def _build_request_body(self, derival_city_id, arrival_city_id):
         """ Create final body for request to API
-        Return: request body or None
+        derival_city_id: id of derival city
+        arrival_city_id: id of arrival city
+        Return: request body
         """
-        derival_city_id = self._get_city_id(self.derival_city, self.derival_region)
-        arrival_city_id = self._get_city_id(self.arrival_city, self.arrival_region)
-
-        if derival_city_id and arrival_city_id:
-            body = f"""<?xml version="1.0" encoding="UTF-8"?>
-                <soap:Envelope
-                    xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"
-                    xmlns:ns0="http://dpd.ru/ws/calculator/2012-03-20"
-                    xmlns:xs="http://www.w3.org/2001/XMLSchema"
-                    xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
-                    <soap:Body>
-                        <ns0:getServiceCost2>
-                            <request>
-                                <auth>
-                                    <clientNumber>{self.client_num}</clientNumber>
-                                    <clientKey>{self.client_key}</clientKey>
-                                </auth>
-                                <pickup>
-                                    <cityId>{derival_city_id}</cityId>
-                                    <countryCode>RU</countryCode>
-                                </pickup>
-                                <delivery>
-                                    <cityId>{arrival_city_id}</cityId>
-                                    <countryCode>RU</countryCode>
-                                </delivery>
-                                <selfPickup>true</selfPickup>
-                                <selfDelivery>true</selfDelivery>
-                                <weight>{self.cargo['weight']}</weight>
-                                <volume>{self.cargo['volume']}</volume>
-                            </request>
-                        </ns0:getServiceCost2>
-                    </soap:Body>
-                </soap:Envelope>"""
-
-            if not self._check_arrival_terminal(arrival_city_id):
-                body = body.replace(
-                    '<selfDelivery>true</selfDelivery>',
-                    '<selfDelivery>false</selfDelivery>'
-                )
-
-            return body
-
-        return None
+        return REQUEST_TEMPLATE.format(
+            client_num=self.client_num,
+            client_key=self.client_key,
+            derival_city_id=derival_city_id,
+            arrival_city_id=arrival_city_id,
+            self_delivery='true' if self._check_arrival_terminal(arrival_city_id) else 'false',
+            weight=self.cargo['weight'],
+            volume=self.cargo['volume']
+        ).encode('utf-8')
 
     def _get_delivery_calc(self):
         """ Get results of calculation in xml format
@@ -119,39 +219,62 @@ class DPDApi(DeliveryAPI):
         """
         url = f'{self.base_api_url}/calculator2?wsdl'
 
-        if not self.result['error']:
-            resp = requests.post(url,
-                                 data=self.body,
-                                 headers={'content-type': 'text/xml; charset=utf-8'})
-            if resp.status_code == 200:
-                return resp.content
-            else:
-                self.result['error'] = 'Ошибка соединения'
+        resp = self._request('post', url, hedge=True,
+                             data=self.body,
+                             headers={'content-type': 'text/xml; charset=utf-8'})
+
+        return self._read_content(resp)
+
+    def _read_content(self, resp):
+        """ Get content from successful response
+        resp: response of calculator request
+        Return: content or None
+        """
+        if resp.status_code == 200:
+            return resp.content
+        else:
+            self.result['error'] = 'Ошибка соединения'
 
         return None
 
-    def calculate(self):
-        """ Main function to calculate delivery cost and time
-        Return: result dictionary
+    def _parse_delivery_calc(self, calculation):
+        """ Get the cheapest delivery cost and time from calculation result
+        calculation: calculation result in xml format
         """
-        if not self.body:
-            return self.result
+        tariff = find_cheapest_tariff(calculation)
 
-        calculation = self._get_delivery_calc()
-        if not calculation:
-            return self.result
+        if tariff:
+            self.result['cost'], self.result['days'] = tariff
+        else:
+            self.result['error'] = 'Ошибка расчета данных'
 
-        costs = []
 
-        tariffs = et.fromstring(calculation).findall('.//return')
-        for tariff in tariffs:
-            costs.append((
-                tariff.find('.//cost').text,
-                tariff.find('.//days').text
-            ))
+class AsyncDPDApi(AsyncDeliveryAPI, DPDApi):
+    """ Class provides communicate with API service on event loop """
+    async def _get_city_id(self, check_city: str, check_region: str):
+        """ Get id of city from compiled index of dpd-geography.csv file in data folder
+        check_city: city name
+        check_region: region name
+        Return: city id or None
+        """
+        await geography.get_async()
+        return super()._get_city_id(check_city, check_region)
+
+    async def _get_request_body(self):
+        """ Create final body for request to API, terminals index is needed to check arrival terminal
+        Return: request body or None
+        """
+        await terminals.get_async()
+        return await super()._get_request_body()
+
+    async def _get_delivery_calc(self):
+        """ Get results of calculation in xml format
+        Return: results or None
+        """
+        url = f'{self.base_api_url}/calculator2?wsdl'
 
-        costs = sorted(costs, key=lambda item: float(item[0]))
-        self.result['cost'] = costs[0][0]
-        self.result['days'] = costs[0][1]
+        resp = await self._request('post', url, hedge=True,
+                                   data=self.body,
+                                   headers={'content-type': 'text/xml; charset=utf-8'})
 
-        return self.result
+        return self._read_content(resp)
@@ -0,0 +1,103 @@
+from collections import Counter
+from threading import Lock, local
+import os
+import sqlite3
+import time
+
+from .cache import normalize_text
+
+
+GEO_PATH = 'assets/data/geo.sqlite3'
+DEFAULT_GEO_TTL = 30 * 24 * 60 * 60
+
+
+class GeoResolver:
+    """ Local store of cities ids of all carriers for normalized city and region names.
+    Store is SQLite file shared by workers and kept between restarts, ids are saved
+    there when carrier resolves city through its API or data files.
+    """
+    hits = Counter()
+    misses = Counter()
+    _lock = Lock()
+
+    def __init__(self, path: str):
+        """
+        path: path to SQLite file
+        """
+        self.path = path
+        self._local = local()
+
+    def _connect(self):
+        """ Get connection of the current thread, creating it and the store on first call
+        Return: sqlite3 connection
+        """
+        conn = getattr(self._local, 'conn', None)
+
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            # city_id has no type so that ids keep their type (int or str)
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cities ('
+                'city TEXT NOT NULL, region TEXT NOT NULL, carrier TEXT NOT NULL, '
+                'city_id, updated REAL NOT NULL, '
+                'PRIMARY KEY (city, region, carrier))'
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+
+        return conn
+
+    def get(self, carrier: str, city: str, region: str, ttl: float):
+        """ Get city id of carrier
+        carrier: carrier section of config
+        city: city name
+        region: region name
+        ttl: maximum age of city id in seconds
+        Return: city id or None
+        """
+        try:
+            row = self._connect().execute(
+                'SELECT city_id FROM cities WHERE city = ? AND region = ? AND carrier = ? AND updated > ?',
+                (normalize_text(city), normalize_text(region), carrier, time.time() - ttl)
+            ).fetchone()
+        except sqlite3.Error:
+            row = None
+
+        with self._lock:
+            if row is None:
+                self.misses[carrier] += 1
+            else:
+                self.hits[carrier] += 1
+
+        return row[0] if row else None
+
+    def set(self, carrier: str, city: str, region: str, city_id):
+        """ Save city id resolved by carrier
+        carrier: carrier section of config
+        city: city name
+        region: region name
+        city_id: city id
+        """
+        try:
+            self._connect().execute(
+                'INSERT OR REPLACE INTO cities (city, region, carrier, city_id, updated) VALUES (?, ?, ?, ?, ?)',
+                (normalize_text(city), normalize_text(region), carrier, city_id, time.time())
+            )
+        except sqlite3.Error:
+            pass
+
+    @classmethod
+    def stats(cls):
+        """ Get hits and misses of the process by carrier
+        Return: dict with hits and misses counters
+        """
+        with cls._lock:
+            return {
+                'hits': dict(cls.hits),
+                'misses': dict(cls.misses),
+            }
+
+
+resolver = GeoResolver(GEO_PATH)
@@ -1,140 +1,239 @@
 # https://gtdel.com/developers/api-doc
 
-import requests
+import json
 
-from .api import DeliveryAPI
+from .api import AsyncDeliveryAPI, DeliveryAPI
+from .cache import normalize_text
+from .directories import CachedDirectory, PrefixIndex
+
+
+BASE_API_URL = 'https://capi.gtdel.com/1.0'
+CITIES_PATH = 'assets/data/gtd-cities.json'
+REGIONS_PATH = 'assets/data/gtd-regions.json'
+DEFAULT_REFRESH_INTERVAL = 24 * 60 * 60
+
+
+def build_city_index(city_list: list):
+    """ Create index of GTD cities
+    city_list: cities json
+    Return: PrefixIndex of city names with (city code, region code) as values
+    """
+    return PrefixIndex((city['name'], (city['code'], city['region_code'])) for city in city_list)
+
+
+def load_city_index(path: str):
+    """ Create index of GTD cities from snapshot file
+    path: path to cities file
+    Return: PrefixIndex of cities
+    """
+    with open(path, 'rb') as f:
+        return build_city_index(json.load(f))
+
+
+def build_region_index(regions: list):
+    """ Create index of GTD regions
+    regions: regions json
+    Return: dict with normalized region names, full and cleaned, as keys and region codes as values
+    """
+    index = {}
+    for region in regions:
+        name = normalize_text(region['name'])
+        index.setdefault(DeliveryAPI._get_clean_region(name), region['code'])
+        index.setdefault(name, region['code'])
+
+    return index
+
+
+def load_region_index(path: str):
+    """ Create index of GTD regions from snapshot file
+    path: path to regions file
+    Return: dict of regions
+    """
+    with open(path, 'rb') as f:
+        return build_region_index(json.load(f))
+
+
+cities = CachedDirectory('gtd_cities', CITIES_PATH, load_city_index)
+regions = CachedDirectory('gtd_regions', REGIONS_PATH, load_region_index)
 
 
 class GtdAPI(DeliveryAPI):
     """ Class provides communicate with API service """
+    name = 'GTD'
+    section = 'gtd'
+
     def __init__(self, config, delivery_info: dict):
         """
         config: instance of ConfigParser, reading config.ini
         delivery_info: info about delivery (arrival_city, derival_city, produce_date, cargo specs)
         """
-        self.base_api_url = 'https://capi.gtdel.com/1.0'
+        self.base_api_url = config.get('gtd', 'base_url', fallback=BASE_API_URL)
         self.apikey = config['gtd']['apikey']
         self.request_headers = {
             'Content-Type': 'application/json',
             'Authorization': f'Bearer {self.apikey}'
         }
-        super().__init__(delivery_info)
-        self.result['name'] = 'GTD'
+        self.refresh_interval = config.getint('gtd', 'refresh_interval', fallback=DEFAULT_REFRESH_INTERVAL)
+        super().__init__(config, delivery_info)
+
+    def _get_regions(self):
+        """ Get index of all regions of GTD
+        Return: regions index or None
+        """
+        url = f'{self.base_api_url}/tdd/region/get-list/'
+        resp = self._request('post', url, headers=self.request_headers)
+
+        return self._parse_regions(resp)
+
+    @staticmethod
+    def _parse_regions(resp):
+        """ Get index of regions from response
+        resp: response of region list request
+        Return: regions index or None
+        """
+        if resp.status_code == 200:
+            return build_region_index(resp.json())
+
+        return None
+
+    def _get_cities(self):
+        """ Get index of all cities of GTD
+        Return: cities index or None
+        """
+        url = f'{self.base_api_url}/tdd/city/get-list/'
+        resp = self._request('post', url, headers=self.request_headers)
+
+        return self._parse_cities(resp)
+
+    @staticmethod
+    def _parse_cities(resp):
+        """ Get index of cities from response
+        resp: response of city list request
+        Return: cities index or None
+        """
+        if resp.status_code == 200:
+            return build_city_index(resp.json())
+
+        return None
 
     def _get_region_code(self, check_region: str):
         """ Get region code for region
         check_region: region name
         Return: region code or None
         """
-        url = f'{self.base_api_url}/tdd/region/get-list/'
-        resp = requests.post(url, headers=self.request_headers)
+        region_index = regions.get(self._get_regions, self.refresh_interval)
 
-        if resp.status_code == 200:
-            regions = resp.json()
-            check_region = self._get_clean_region(check_region)
+        return self._find_region_code(region_index, check_region)
 
-            for region in regions:
-                if check_region in region['name'].lower():
-                    return region['code']
-        else:
+    def _find_region_code(self, region_index: dict, check_region: str):
+        """ Get region code for region from regions index
+        region_index: regions index
+        check_region: region name
+        Return: region code or None
+        """
+        if region_index is None:
             self.result['error'] = 'Ошибка соединения'
+            return None
+
+        check_region = self._get_clean_region(normalize_text(check_region))
+        if check_region in region_index:
+            return region_index[check_region]
+
+        for name, code in region_index.items():
+            if check_region in name:
+                return code
 
         return None
 
-    def _get_city_code(self, check_city: str, check_region: str):
+    def _get_city_id(self, check_city: str, check_region: str):
         """ Get city codes for city
         check_city: city name
         check_region: region name
         Return: city code or None
         """
-        url = f'{self.base_api_url}/tdd/city/get-list/'
-        resp = requests.post(url, headers=self.request_headers)
+        city_index = cities.get(self._get_cities, self.refresh_interval)
 
-        if resp.status_code == 200:
-            cities = resp.json()
-            matches = []
-
-            for city in cities:
-                if city['name'].lower().startswith(check_city.lower()):
-                    matches.append(city)
-
-            if len(matches) == 1:
-                return matches[0]['code']
-            elif len(matches) > 1:
-                if check_region:
-                    region_code = self._get_region_code(check_region)
-                    for city in matches:
-                        if city['region_code'] == region_code:
-                            return city['code']
-                    self.result['error'] = f'{check_city} ({check_region}): нет терминала'
-                else:
-                    return matches[0]['code']
-            else:
-                self.result['error'] = f'{check_city}: нет доставки'
-        else:
+        matches = self._find_cities(city_index, check_city)
+        if len(matches) > 1 and check_region:
+            region_code = self._get_region_code(check_region)
+            return self._get_region_city_code(matches, region_code, check_city, check_region)
+        elif matches:
+            return matches[0][0]
+
+        return None
+
+    def _find_cities(self, city_index, check_city: str):
+        """ Get cities which names start with city name
+        city_index: cities index
+        check_city: city name
+        Return: list of (code, region_code) of cities
+        """
+        if city_index is None:
             self.result['error'] = 'Ошибка соединения'
+            return []
+
+        matches = city_index.find(check_city)
+        if not matches:
+            self.result['error'] = f'{check_city}: нет доставки'
+
+        return matches
+
+    def _get_region_city_code(self, matches: list, region_code: str, check_city: str, check_region: str):
+        """ Get code of city in region
+        matches: (code, region_code) of cities with the same name
+        region_code: region code
+        check_city: city name
+        check_region: region name
+        Return: city code or None
+        """
+        for code, city_region_code in matches:
+            if city_region_code == region_code:
+                return code
+        self.result['error'] = f'{check_city} ({check_region}): нет терминала'
 
         return None
 
-    def _get_request_body(self):
+    def _build_request_body(self, derival_code, arrival_code):
         """ Create final body for request to API
+        derival_code: code of derival city
+        arrival_code: code of arrival city
         Return: request body
         """
-        derival_code = self._get_city_code(self.derival_city, self.derival_region)
-        arrival_code = self._get_city_code(self.arrival_city, self.arrival_region)
-
-        if derival_code and arrival_code:
-            body = {
-                'city_pickup_code': derival_code,
-                'city_delivery_code': arrival_code,
-                'declared_price': 100,
-                'pick_up': 0,
-                'delivery': 0,
-                'insurance': 0,
-                'have_doc': 0,
-                'places': [
-                    {
-                        'count_place': 1,
-                        'height': self.cargo['height'] * 100,
-                        'width': self.cargo['width'] * 100,
-                        'length': self.cargo['length'] * 100,
-                        'weight': self.cargo['weight'],
-                        'volume': self.cargo['volume']
-                    },
-                ]
-            }
-
-            return body
+        body = {
+            'city_pickup_code': derival_code,
+            'city_delivery_code': arrival_code,
+            'declared_price': 100,
+            'pick_up': 0,
+            'delivery': 0,
+            'insurance': 0,
+            'have_doc': 0,
+            'places': [
+                {
+                    'count_place': 1,
+                    'height': self.cargo['height'] * 100,
+                    'width': self.cargo['width'] * 100,
+                    'length': self.cargo['length'] * 100,
+                    'weight': self.cargo['weight'],
+                    'volume': self.cargo['volume']
+                },
+            ]
+        }
 
-        return None
+        return body
 
     def _get_delivery_calc(self):
         """ Get results of calculation in json format
         Return: results or None
         """
         url = f'{self.base_api_url}/order/calculate'
+        resp = self._request('post', url, hedge=True, json=self.body, headers=self.request_headers)
 
-        if not self.result['error']:
-            resp = requests.post(url, json=self.body, headers=self.request_headers)
-
-            if resp.status_code == 200:
-                return resp.json()
-            else:
-                self.result['error'] = 'Ошибка соединения'
+        return self._read_json(resp)
 
-        return None
-
-    def calculate(self):
-        """ Main function to calculate delivery cost and time
-        Return: result dictionary
+    def _parse_delivery_calc(self, calculation):
+        """ Get delivery cost and time from calculation result
+        calculation: calculation result in json format
         """
-        if not self.body:
-            return self.result
-
-        calculation = self._get_delivery_calc()
-        if not calculation:
-            return self.result
-
         try:
             cost = 0
             services = calculation[0]['standart']['detail']
@@ -148,4 +247,58 @@ class GtdAPI(DeliveryAPI):
         except KeyError or IndexError:
             self.result['error'] = 'Ошибка расчета данных'
 
-        return self.result
+
+class AsyncGtdAPI(AsyncDeliveryAPI, GtdAPI):
+    """ Class provides communicate with API service on event loop """
+    async def _get_regions(self):
+        """ Get index of all regions of GTD
+        Return: regions index or None
+        """
+        url = f'{self.base_api_url}/tdd/region/get-list/'
+        resp = await self._request('post', url, headers=self.request_headers)
+
+        return self._parse_regions(resp)
+
+    async def _get_cities(self):
+        """ Get index of all cities of GTD
+        Return: cities index or None
+        """
+        url = f'{self.base_api_url}/tdd/city/get-list/'
+        resp = await self._request('post', url, headers=self.request_headers)
+
+        return self._parse_cities(resp)
+
+    async def _get_region_code(self, check_region: str):
+        """ Get region code for region
+        check_region: region name
+        Return: region code or None
+        """
+        region_index = await regions.get_async(self._get_regions, self.refresh_interval)
+
+        return self._find_region_code(region_index, check_region)
+
+    async def _get_city_id(self, check_city: str, check_region: str):
+        """ Get city codes for city
+        check_city: city name
+        check_region: region name
+        Return: city code or None
+        """
+        city_index = await cities.get_async(self._get_cities, self.refresh_interval)
+
+        matches = self._find_cities(city_index, check_city)
+        if len(matches) > 1 and check_region:
+            region_code = await self._get_region_code(check_region)
+            return self._get_region_city_code(matches, region_code, check_city, check_region)
+        elif matches:
+            return matches[0][0]
+
+        return None
+
+    async def _get_delivery_calc(self):
+        """ Get results of calculation in json format
+        Return: results or None
+        """
+        url = f'{self.base_api_url}/order/calculate'
+        resp = await self._request('post', url, hedge=True, json=self.body, headers=self.request_headers)
+
+        return self._read_json(resp)
@@ -0,0 +1,251 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError, wait
+from threading import Lock
+import asyncio
+import math
+import os
+import time
+
+from .pool import DEFAULT_WORKERS, get_option, get_workers
+
+
+DEFAULT_PERCENTILE = 95
+DEFAULT_MIN_SAMPLES = 20
+DEFAULT_MAX_RATE = 0.1
+DEFAULT_WINDOW = 100
+
+
+class Hedger:
+    """ Hedged requests of carrier API shared by all threads of the process.
+    If request is not answered within delay taken from recent latency percentile,
+    the same request is sent again and the first response is used. Share of hedged
+    requests among recent ones is limited by max_rate.
+    """
+    def __init__(self, percentile: float, min_samples: int, max_rate: float, window: int,
+                 workers: int = DEFAULT_WORKERS):
+        """
+        percentile: percentile of recent latency used as hedge delay
+        min_samples: minimum number of latency samples to start hedging
+        max_rate: maximum share of hedged requests
+        window: number of recent requests to calculate latency and hedge rate
+        workers: number of threads of carrier pool
+        """
+        self.workers = workers
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_rate = max_rate
+        self._lock = Lock()
+        self._latencies = deque(maxlen=window)
+        self._hedged = deque(maxlen=window)
+        self._hedges = 0
+        self._wins = 0
+        self._losses = 0
+
+    def record(self, duration: float):
+        """ Save latency of request
+        duration: duration of request in seconds
+        """
+        with self._lock:
+            self._latencies.append(duration)
+
+    def get_delay(self):
+        """ Get time to wait for response before hedging request
+        Return: seconds or None if there are not enough latency samples
+        """
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            latencies = sorted(self._latencies)
+
+        return latencies[max(math.ceil(self.percentile / 100 * len(latencies)) - 1, 0)]
+
+    def _claim(self, hedge: bool):
+        """ Save if request is hedged, hedging is allowed while hedge rate is below max_rate
+        hedge: True if request needs hedging
+        Return: True if request must be hedged
+        """
+        with self._lock:
+            hedge = hedge and sum(self._hedged) < self.max_rate * (len(self._hedged) + 1)
+            self._hedged.append(hedge)
+            if hedge:
+                self._hedges += 1
+
+        return hedge
+
+    def _count(self, hedge_won: bool):
+        """ Save which request of hedged pair has answered first
+        hedge_won: True if hedge request has answered first
+        """
+        with self._lock:
+            if hedge_won:
+                self._wins += 1
+            else:
+                self._losses += 1
+
+    def _timed(self, send):
+        """ Send request saving its latency
+        send: function sending request
+        Return: response
+        """
+        start = time.perf_counter()
+        try:
+            return send()
+        finally:
+            self.record(time.perf_counter() - start)
+
+    async def _timed_async(self, send):
+        """ Send request saving its latency
+        send: coroutine function sending request
+        Return: response
+        """
+        start = time.perf_counter()
+        try:
+            return await send()
+        finally:
+            self.record(time.perf_counter() - start)
+
+    def call(self, send):
+        """ Send request, hedge it if response is late
+        send: function sending request
+        Return: the first successful response
+        """
+        delay = self.get_delay()
+        if delay is None:
+            self._claim(False)
+            return self._timed(send)
+
+        executor = get_executor(self.workers)
+        primary = executor.submit(self._timed, send)
+        try:
+            response = primary.result(timeout=delay)
+        except TimeoutError:
+            pass
+        else:
+            self._claim(False)
+            return response
+
+        if not self._claim(True):
+            return primary.result()
+
+        hedge = executor.submit(self._timed, send)
+        pending, error = {primary, hedge}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    self._count(future is hedge)
+                    return future.result()
+                error = error or future.exception()
+
+        raise error
+
+    async def call_async(self, send):
+        """ Send request on event loop, hedge it if response is late
+        send: coroutine function sending request
+        Return: the first successful response
+        """
+        delay = self.get_delay()
+        if delay is None:
+            self._claim(False)
+            return await self._timed_async(send)
+
+        primary = asyncio.ensure_future(self._timed_async(send))
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                self._claim(False)
+                return primary.result()
+
+            if not self._claim(True):
+                return await primary
+
+            hedge = asyncio.ensure_future(self._timed_async(send))
+            pending, error = {primary, hedge}, None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self._count(task is hedge)
+                        return task.result()
+                    error = error or task.exception()
+
+            raise error
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def stats(self):
+        """ Get hedging info
+        Return: dict with current delay, hedged requests and wins and losses of hedge requests
+        """
+        delay = self.get_delay()
+
+        with self._lock:
+            return {
+                'delay': round(delay, 3) if delay is not None else None,
+                'requests': len(self._hedged),
+                'hedge_rate': round(sum(self._hedged) / len(self._hedged), 2) if self._hedged else 0,
+                'hedges': self._hedges,
+                'wins': self._wins,
+                'losses': self._losses,
+            }
+
+
+_executor = None
+_executor_lock = Lock()
+_hedgers = {}
+_hedgers_lock = Lock()
+
+
+def get_executor(workers: int = DEFAULT_WORKERS):
+    """ Get thread pool of the current process sending hedged requests, creating it on first call.
+    It is separate from carrier pool, so carrier jobs never wait for their own queue, and has
+    two threads per thread of carrier pool, so primary requests never queue there and fire hedges.
+    workers: number of threads of carrier pool
+    Return: ThreadPoolExecutor
+    """
+    global _executor
+
+    with _executor_lock:
+        if _executor is None or _executor.pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=workers * 2, thread_name_prefix='hedge')
+            _executor.pid = os.getpid()
+
+    return _executor
+
+
+def get_hedger(config, section: str):
+    """ Get hedger of carrier of the current process, creating it on first call
+    config: instance of ConfigParser, reading config.ini
+    section: carrier section of config
+    Return: Hedger or None if hedging is not enabled for carrier
+    """
+    if not get_option(config, section, 'hedge', False, 'getboolean'):
+        return None
+
+    key = (os.getpid(), section)
+
+    if key not in _hedgers:
+        with _hedgers_lock:
+            if key not in _hedgers:
+                _hedgers[key] = Hedger(
+                    percentile=get_option(config, section, 'hedge_percentile', DEFAULT_PERCENTILE, 'getfloat'),
+                    min_samples=get_option(config, section, 'hedge_min_samples', DEFAULT_MIN_SAMPLES),
+                    max_rate=get_option(config, section, 'hedge_max_rate', DEFAULT_MAX_RATE, 'getfloat'),
+                    window=get_option(config, section, 'hedge_window', DEFAULT_WINDOW),
+                    workers=get_workers(config),
+                )
+
+    return _hedgers[key]
+
+
+def get_hedge_stats():
+    """ Get hedging info of carriers of the current process
+    Return: dict with carriers sections as keys and hedging info as values
+    """
+    with _hedgers_lock:
+        hedgers = [(section, hedger) for (pid, section), hedger in _hedgers.items() if pid == os.getpid()]
+
+    return {section: hedger.stats() for section, hedger in hedgers}
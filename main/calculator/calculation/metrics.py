@@ -0,0 +1,395 @@
+from collections import Counter
+from threading import Lock, Thread
+import atexit
+import fcntl
+import glob
+import hmac
+import json
+import os
+import time
+
+from .breaker import OPEN, get_breaker_stats
+from .cache import QuoteCache
+from .directories import write_atomic
+from .geo import GeoResolver
+from .hedge import get_hedge_stats
+from .pool import get_pool_stats, get_session_stats
+from .singleflight import get_flight_stats
+
+
+METRICS_DIR = 'assets/data/metrics'
+DEAD_WORKERS = 'dead'
+FLUSH_INTERVAL = 5
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# name: (type, help)
+METRICS = {
+    'calculator_duration_seconds': ('histogram', 'Duration of calculation of all carriers'),
+    'carrier_phase_duration_seconds': ('histogram', 'Duration of carrier calculation phase'),
+    'carrier_calculations_total': ('counter', 'Carrier calculations by result'),
+    'carrier_request_duration_seconds': ('histogram', 'Duration of request to carrier API'),
+    'carrier_requests_total': ('counter', 'Requests to carrier API by status class'),
+    'carrier_response_size_bytes': ('histogram', 'Size of carrier API response body'),
+    'carrier_quote_cache_total': ('counter', 'Quote cache lookups by result'),
+    'carrier_geo_store_total': ('counter', 'Geo store lookups by result'),
+    'carrier_connections_total': ('counter', 'Connections opened to carrier API'),
+    'carrier_pooled_requests_total': ('counter', 'Requests sent over carrier connection pool'),
+    'carrier_breaker_open': ('gauge', 'Number of workers with open circuit breaker of carrier'),
+    'carrier_breaker_rejected_total': ('counter', 'Calculations rejected by open circuit breaker'),
+    'carrier_hedges_total': ('counter', 'Hedge requests by result'),
+    'carrier_pool_queued': ('gauge', 'Carrier jobs waiting for thread of carrier pool'),
+    'carrier_pool_active': ('gauge', 'Carrier jobs running in carrier pool'),
+    'carrier_pool_saturation': ('gauge', 'Share of busy threads of carrier pool of worker'),
+    'quote_singleflight_in_flight': ('gauge', 'Calculations of carriers shared by concurrent quotes'),
+    'quote_singleflight_waiters': ('gauge', 'Quotes waiting for calculation started by another quote'),
+    'quote_singleflight_coalesced_total': ('counter', 'Quotes which got result of calculation of another quote'),
+}
+
+
+def get_status_class(status_code: int = None):
+    """ Get label of response status
+    status_code: http status code or None if request has failed
+    Return: status class like '2xx' or 'error'
+    """
+    if status_code is None:
+        return 'error'
+
+    return f'{status_code // 100}xx'
+
+
+def escape_label(value):
+    """ Get label value for Prometheus text format
+    value: label value
+    Return: escaped string
+    """
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def is_alive(pid: int):
+    """ Check if process is running
+    pid: process id
+    Return: True or False
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+
+    return True
+
+
+def is_scrape_allowed(request, config):
+    """ Check if request may read metrics, metrics expose carriers and traffic data, so they are
+    given to requests with Authorization: Bearer header equal to metrics_token option, to staff users
+    and to addresses of metrics_allow option. Both options are in calculator section of config.
+    No address is allowed by default: behind local reverse proxy every client comes from 127.0.0.1,
+    so metrics_allow is safe only when clients reach the application directly.
+    request: Django request
+    config: instance of ConfigParser, reading config.ini
+    Return: True or False
+    """
+    allowed = config.get('calculator', 'metrics_allow', fallback='')
+    if request.META.get('REMOTE_ADDR') in {address.strip() for address in allowed.split(',') if address.strip()}:
+        return True
+
+    token = config.get('calculator', 'metrics_token', fallback='')
+    header = request.headers.get('Authorization', '')
+    if token and hmac.compare_digest(header.encode(), f'Bearer {token}'.encode()):
+        return True
+
+    return request.user.is_staff
+
+
+def format_labels(labels):
+    """ Get labels for Prometheus text format
+    labels: iterable of (name, value)
+    Return: string like {name="value"} or empty string
+    """
+    labels = ','.join(f'{name}="{escape_label(value)}"' for name, value in labels)
+
+    return f'{{{labels}}}' if labels else ''
+
+
+class Metrics:
+    """ Counters and histograms of the process. Every worker saves its metrics to its own
+    file in metrics directory in background thread and on scrape, metrics endpoint sums files
+    of all workers, so values are correct under uWSGI with several processes. Files of finished
+    workers are merged into one file of dead workers. Counters of process are reset after fork.
+    """
+    def __init__(self, path: str, interval: float = FLUSH_INTERVAL):
+        """
+        path: path to metrics directory
+        interval: seconds between saves of metrics of the process
+        """
+        self.path = path
+        self.interval = interval
+        self._lock = Lock()
+        self._pid = os.getpid()
+        self._counters = Counter()
+        self._histograms = {}
+        self._flusher_pid = None
+        self._flushed_pid = None
+
+    def _check_pid(self):
+        """ Drop metrics inherited from parent process, must be called under lock """
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._counters = Counter()
+            self._histograms = {}
+
+    def _start_flusher(self):
+        """ Start saving metrics of the process once it has recorded something, must be called under lock """
+        if self._flusher_pid != self._pid:
+            self._flusher_pid = self._pid
+            Thread(target=self._flush_forever, name='metrics', daemon=True).start()
+
+    def _flush_forever(self):
+        """ Save metrics of the process every interval """
+        while True:
+            time.sleep(self.interval)
+            self.flush(force=False)
+
+    def inc(self, name: str, labels: dict, value: float = 1):
+        """ Increase counter
+        name: name of metric
+        labels: dict with labels of metric
+        value: increment
+        """
+        key = (name, tuple(sorted(labels.items())))
+
+        with self._lock:
+            self._check_pid()
+            self._start_flusher()
+            self._counters[key] += value
+
+    def observe(self, name: str, labels: dict, value: float, buckets=LATENCY_BUCKETS):
+        """ Add value to histogram
+        name: name of metric
+        labels: dict with labels of metric
+        value: observed value
+        buckets: upper bounds of histogram buckets
+        """
+        key = (name, tuple(sorted(labels.items())))
+
+        with self._lock:
+            self._check_pid()
+            self._start_flusher()
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'buckets': buckets, 'counts': [0] * len(buckets),
+                                                     'sum': 0, 'count': 0}
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['counts'][i] += 1
+                    break
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    @staticmethod
+    def collect_stats():
+        """ Get counters and gauges from caches, geo store, sessions, breakers, hedgers, pool and flights of the process
+        Return: list of [name, labels, value]
+        """
+        samples = []
+
+        quotes = QuoteCache.stats()
+        geo = GeoResolver.stats()
+        for name, stats in (('carrier_quote_cache_total', quotes), ('carrier_geo_store_total', geo)):
+            for result, key in (('hit', 'hits'), ('miss', 'misses')):
+                for carrier, value in stats[key].items():
+                    samples.append([name, [['carrier', carrier], ['result', result]], value])
+
+        for carrier, stats in get_session_stats().items():
+            samples.append(['carrier_connections_total', [['carrier', carrier]], stats['connections']])
+            samples.append(['carrier_pooled_requests_total', [['carrier', carrier]], stats['requests']])
+
+        for carrier, stats in get_breaker_stats().items():
+            samples.append(['carrier_breaker_open', [['carrier', carrier]], int(stats['state'] == OPEN)])
+            samples.append(['carrier_breaker_rejected_total', [['carrier', carrier]], stats['rejected']])
+
+        for carrier, stats in get_hedge_stats().items():
+            for result, key in (('won', 'wins'), ('lost', 'losses')):
+                samples.append(['carrier_hedges_total', [['carrier', carrier], ['result', result]], stats[key]])
+
+        stats = get_pool_stats()
+        if stats is not None:
+            samples.append(['carrier_pool_queued', [], stats['queued']])
+            samples.append(['carrier_pool_active', [], stats['active']])
+            # shares of workers are not summed, so saturation is given for every worker
+            samples.append(['carrier_pool_saturation', [['worker', str(os.getpid())]], stats['saturation']])
+
+        stats = get_flight_stats()
+        samples.append(['quote_singleflight_in_flight', [], stats['in_flight']])
+        samples.append(['quote_singleflight_waiters', [], stats['waiters']])
+        samples.append(['quote_singleflight_coalesced_total', [], stats['coalesced']])
+
+        return samples
+
+    def get_worker_path(self, worker):
+        """ Get path to metrics file of worker
+        worker: process id or DEAD_WORKERS
+        Return: path
+        """
+        return os.path.join(self.path, f'{worker}.json')
+
+    @staticmethod
+    def read(path: str):
+        """ Read metrics file
+        path: path to file
+        Return: dict with counters and histograms or None if file is not read
+        """
+        try:
+            with open(path, 'rb') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def merge(counters: Counter, histograms: dict, data: dict, gauges: bool = True):
+        """ Add metrics of worker to sums
+        counters: sums of counters with (name, labels) keys
+        histograms: sums of histograms with (name, labels) keys
+        data: dict with counters and histograms of worker
+        gauges: False if gauges of worker must be skipped
+        """
+        for name, labels, value in data['counters']:
+            if METRICS[name][0] == 'gauge' and not gauges:
+                continue
+            counters[(name, tuple(tuple(label) for label in labels))] += value
+
+        for name, labels, histogram in data['histograms']:
+            key = (name, tuple(tuple(label) for label in labels))
+            total = histograms.get(key)
+            if total is None or total['buckets'] != histogram['buckets']:
+                histograms[key] = dict(histogram, buckets=list(histogram['buckets']), counts=list(histogram['counts']))
+                continue
+            total['counts'] = [a + b for a, b in zip(total['counts'], histogram['counts'])]
+            total['sum'] += histogram['sum']
+            total['count'] += histogram['count']
+
+    def collect_dead(self, pids: list):
+        """ Merge files of finished workers into file of dead workers and remove them,
+        so that counters never decrease and metrics directory does not grow
+        pids: process ids of finished workers
+        """
+        os.makedirs(self.path, exist_ok=True)
+
+        with open(os.path.join(self.path, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            counters, histograms = Counter(), {}
+            dead = self.read(self.get_worker_path(DEAD_WORKERS))
+            if dead is not None:
+                self.merge(counters, histograms, dead)
+
+            paths = []
+            for pid in pids:
+                data = self.read(self.get_worker_path(pid))
+                if data is not None:
+                    self.merge(counters, histograms, data, gauges=False)
+                    paths.append(self.get_worker_path(pid))
+            if not paths:
+                return
+
+            write_atomic(self.get_worker_path(DEAD_WORKERS), json.dumps({
+                'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+                'histograms': [[name, labels, histogram] for (name, labels), histogram in histograms.items()],
+            }).encode('utf-8'))
+            for path in paths:
+                os.remove(path)
+
+    def reset(self):
+        """ Forget metrics recorded by the process """
+        with self._lock:
+            self._counters = Counter()
+            self._histograms = {}
+
+    def flush(self, force: bool = True):
+        """ Save metrics of the process to its file in metrics directory, file left by
+        finished process with the same id is merged into file of dead workers first
+        force: False if metrics must not be saved while the process has recorded nothing
+        """
+        with self._lock:
+            self._check_pid()
+            if not force and not self._counters and not self._histograms:
+                return
+            data = {
+                'counters': [[name, labels, value] for (name, labels), value in self._counters.items()],
+                'histograms': [[name, labels, dict(histogram, counts=list(histogram['counts']))]
+                               for (name, labels), histogram in self._histograms.items()],
+            }
+            first = self._flushed_pid != self._pid
+            self._flushed_pid = self._pid
+        data['counters'].extend(self.collect_stats())
+
+        try:
+            if first:
+                self.collect_dead([os.getpid()])
+            os.makedirs(self.path, exist_ok=True)
+            write_atomic(self.get_worker_path(os.getpid()), json.dumps(data).encode('utf-8'))
+        except OSError:
+            pass
+
+    def aggregate(self):
+        """ Sum metrics of all workers, counters of finished workers are included so that
+        counters never decrease, gauges are taken from running workers only
+        Return: (counters, histograms) dicts with (name, labels) keys
+        """
+        dead = []
+        for path in glob.glob(os.path.join(self.path, '*.json')):
+            name = os.path.basename(path)[:-len('.json')]
+            if name.isdigit() and not is_alive(int(name)):
+                dead.append(int(name))
+        if dead:
+            try:
+                self.collect_dead(dead)
+            except OSError:
+                pass
+
+        counters = Counter()
+        histograms = {}
+
+        for path in glob.glob(os.path.join(self.path, '*.json')):
+            name = os.path.basename(path)[:-len('.json')]
+            data = self.read(path)
+            if data is None or not (name.isdigit() or name == DEAD_WORKERS):
+                continue
+            self.merge(counters, histograms, data, gauges=name != DEAD_WORKERS)
+
+        return counters, histograms
+
+    def render(self):
+        """ Get metrics of all workers in Prometheus text format, metrics of the process are saved first
+        Return: text
+        """
+        self.flush()
+        counters, histograms = self.aggregate()
+        lines = []
+
+        for name, (kind, description) in METRICS.items():
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+
+            for (sample, labels), value in sorted(counters.items()):
+                if sample == name:
+                    lines.append(f'{name}{format_labels(labels)} {value}')
+
+            for (sample, labels), histogram in sorted(histograms.items(), key=lambda item: item[0]):
+                if sample != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(histogram['buckets'], histogram['counts']):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{format_labels(labels + (("le", bound),))} {cumulative}')
+                lines.append(f'{name}_bucket{format_labels(labels + (("le", "+Inf"),))} {histogram["count"]}')
+                lines.append(f'{name}_sum{format_labels(labels)} {histogram["sum"]}')
+                lines.append(f'{name}_count{format_labels(labels)} {histogram["count"]}')
+
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics(METRICS_DIR)
+atexit.register(metrics.flush, force=False)
@@ -1,48 +1,112 @@
-import requests
+import json
 
-from .api import DeliveryAPI
+from .api import AsyncDeliveryAPI, DeliveryAPI
+from .cache import normalize_text
+from .directories import CachedDirectory, PrefixIndex
+from .sessions import SessionManager
+
+
+BASE_API_URL = 'https://mainapi.nrg-tk.ru/v3'
+CITIES_PATH = 'assets/data/nrgtk-cities.json'
+DEFAULT_TOKEN_TTL = 3000
+DEFAULT_REFRESH_INTERVAL = 24 * 60 * 60
+
+
+def build_city_index(city_list: list):
+    """ Create index of Energia cities
+    city_list: cities json
+    Return: PrefixIndex of city names with (city id, normalized description) as values
+    """
+    return PrefixIndex((city['name'], (city['id'], normalize_text(city['description']))) for city in city_list)
+
+
+def load_city_index(path: str):
+    """ Create index of Energia cities from snapshot file
+    path: path to cities file
+    Return: PrefixIndex of cities
+    """
+    with open(path, 'rb') as f:
+        return build_city_index(json.load(f)['cityList'])
+
+
+sessions = SessionManager()
+cities = CachedDirectory('nrgtk_cities', CITIES_PATH, load_city_index)
 
 
 class NrgtkAPI(DeliveryAPI):
     """ Class provides communicate with API service """
+    name = 'Энергия'
+    section = 'nrgtk'
+
     def __init__(self, config, delivery_info: dict):
         """
         config: instance of ConfigParser, reading config.ini
         delivery_info: info about delivery (arrival_city, derival_city, produce_date, cargo specs)
         """
-        self.base_api_url = 'https://mainapi.nrg-tk.ru/v3'
+        self.base_api_url = config.get('nrgtk', 'base_url', fallback=BASE_API_URL)
         self.dev_token = config['nrgtk']['dev_token']
         self.user = config['nrgtk']['login']
         self.password = config['nrgtk']['pass']
         self.request_header = {'NrgApi-DevToken': self.dev_token}
-        self.user_token, self.account_id = self._user_login()
-        super().__init__(delivery_info)
-        self.result['name'] = 'Энергия'
+        self.token_ttl = config.getfloat('nrgtk', 'token_ttl', fallback=DEFAULT_TOKEN_TTL)
+        self.refresh_interval = config.getint('nrgtk', 'refresh_interval', fallback=DEFAULT_REFRESH_INTERVAL)
+        super().__init__(config, delivery_info)
 
     def _user_login(self):
         """ Get token and accountId to communicate with API
-        Return: (user_token, account_id) or (None, None)
+        Return: (user_token, account_id) or None
         """
         url = f'{self.base_api_url}/login'
 
-        resp = requests.get(url, headers=self.request_header, params={
+        resp = self._request('get', url, headers=self.request_header, params={
             'user': self.user,
             'password': self.password
         })
 
+        return self._parse_user_login(resp)
+
+    @staticmethod
+    def _parse_user_login(resp):
+        """ Get token and accountId from login response
+        resp: response of login request
+        Return: (user_token, account_id) or None
+        """
         if resp.status_code == 200:
             resp_json = resp.json()
             return resp_json['token'], resp_json['accountId']
-        else:
-            self.result['error'] = 'Ошибка соединения'
 
-        return None, None
+        return None
+
+    def _get_cities(self):
+        """ Get index of all cities of Energia, login is shared by all NrgtkAPI instances
+        Return: cities index or None
+        """
+        url = f'{self.base_api_url}/cities'
+
+        session = sessions.get(self._user_login, self.token_ttl)
+        if not session:
+            return None
+        resp = self._request('get', url, headers=self.request_header, params={'token': session[0]})
 
-    def _user_logout(self):
-        """ Logout user and delete all opened sessions
+        if resp.status_code == 401:
+            sessions.invalidate(session)
+            session = sessions.get(self._user_login, self.token_ttl)
+            if not session:
+                return None
+            resp = self._request('get', url, headers=self.request_header, params={'token': session[0]})
+
+        return self._parse_cities(resp)
+
+    @staticmethod
+    def _parse_cities(resp):
+        """ Get index of cities from response
+        resp: response of cities request
+        Return: cities index or None
         """
-        url = f'{self.base_api_url}/{self.account_id}/logout'
-        requests.get(url, headers=self.request_header, params={'token': self.user_token})
+        if resp.status_code == 200:
+            return build_city_index(resp.json()['cityList'])
+
+        return None
 
     def _get_city_id(self, check_city: str, check_region: str):
         """ Get city ids of derival and arrival cities
@@ -50,92 +114,75 @@ class NrgtkAPI(DeliveryAPI):
         check_region: region name
         Return: city id or None
         """
-        url = f'{self.base_api_url}/cities'
-        resp = requests.get(url, headers=self.request_header, params={'token': self.user_token})
+        city_index = cities.get(self._get_cities, self.refresh_interval)
 
-        if resp.status_code == 200:
-            resp_json = resp.json()
-            matches = []
-
-            for city in resp_json['cityList']:
-                if city['name'].lower().startswith(check_city.lower()):
-                    matches.append(city)
-
-            if len(matches) == 1:
-                return matches[0]['id']
-            elif len(matches) > 1:
-                if check_region:
-                    region = self._get_clean_region(check_region)
-                    for city in matches:
-                        if region in city['description'].lower():
-                            return city['id']
-                    self.result['error'] = f'{check_city} ({check_region}): нет терминала'
-                else:
-                    return matches[0]['id']
+        return self._find_city_id(city_index, check_city, check_region)
+
+    def _find_city_id(self, city_index, check_city: str, check_region: str):
+        """ Get city id from cities index
+        city_index: cities index
+        check_city: city name
+        check_region: region name
+        Return: city id or None
+        """
+        if city_index is None:
+            self.result['error'] = 'Ошибка соединения'
+            return None
+
+        matches = city_index.find(check_city)
+
+        if len(matches) == 1:
+            return matches[0][0]
+        elif len(matches) > 1:
+            if check_region:
+                region = self._get_clean_region(normalize_text(check_region))
+                for city_id, description in matches:
+                    if region in description:
+                        return city_id
+                self.result['error'] = f'{check_city} ({check_region}): нет терминала'
             else:
-                self.result['error'] = f'{check_city}: нет доставки'
+                return matches[0][0]
         else:
-            self.result['error'] = 'Ошибка соединения'
+            self.result['error'] = f'{check_city}: нет доставки'
 
         return None
 
-    def _get_request_body(self):
+    def _build_request_body(self, derival_id, arrival_id):
         """ Create final body for request to API
+        derival_id: id of derival city
+        arrival_id: id of arrival city
         Return: request body
         """
-        derival_id = self._get_city_id(self.derival_city, self.derival_region)
-        arrival_id = self._get_city_id(self.arrival_city, self.arrival_region)
-
-        if derival_id and arrival_id:
-
-            body = {
-                'idCityFrom': derival_id,
-                'idCityTo': arrival_id,
-                'cover': 0,
-                'items': [
-                    {
-                        'weight': self.cargo['weight'],
-                        'width': self.cargo['width'],
-                        'height': self.cargo['width'],
-                        'length': self.cargo['length'],
-                        'isStandardSize': True
-                    }
-                ],
-            }
-
-            return body
+        body = {
+            'idCityFrom': derival_id,
+            'idCityTo': arrival_id,
+            'cover': 0,
+            'items': [
+                {
+                    'weight': self.cargo['weight'],
+                    'width': self.cargo['width'],
+                    'height': self.cargo['width'],
+                    'length': self.cargo['length'],
+                    'isStandardSize': True
+                }
+            ],
+        }
 
-        return None
+        return body
 
     def _get_delivery_calc(self):
         """ Get results of calculation in json format
         Return: results or None
         """
         url = f'{self.base_api_url}/price'
+        resp = self._request('post', url, hedge=True, headers=self.request_header, json=self.body)
 
-        if not self.result['error']:
-            resp = requests.post(url, headers=self.request_header, json=self.body)
-            self._user_logout()
-
-            if resp.status_code == 200:
-                return resp.json()
-            else:
-                self.result['error'] = 'Ошибка соединения'
-
-        self._user_logout()
-        return None
+        return self._read_json(resp)
 
-    def calculate(self):
-        """ Main function to calculate delivery cost and time
-        Return: result dictionary
+    def _parse_delivery_calc(self, calculation):
+        """ Get delivery cost and time from calculation result
+        calculation: calculation result in json format
         """
-        if not self.body:
-            return self.result
-
-        calculation = self._get_delivery_calc()
-        if not calculation:
-            return self.result
-
         try:
             for transfer in calculation['transfer']:
                 if transfer['typeId'] in (1, 3):
@@ -153,4 +200,57 @@ class NrgtkAPI(DeliveryAPI):
         except KeyError or IndexError:
             self.result['error'] = 'Ошибка расчета данных'
 
-        return self.result
+
+class AsyncNrgtkAPI(AsyncDeliveryAPI, NrgtkAPI):
+    """ Class provides communicate with API service on event loop """
+    async def _user_login(self):
+        """ Get token and accountId to communicate with API
+        Return: (user_token, account_id) or None
+        """
+        url = f'{self.base_api_url}/login'
+
+        resp = await self._request('get', url, headers=self.request_header, params={
+            'user': self.user,
+            'password': self.password
+        })
+
+        return self._parse_user_login(resp)
+
+    async def _get_cities(self):
+        """ Get index of all cities of Energia, login is shared by all NrgtkAPI instances
+        Return: cities index or None
+        """
+        url = f'{self.base_api_url}/cities'
+
+        session = await sessions.get_async(self._user_login, self.token_ttl)
+        if not session:
+            return None
+        resp = await self._request('get', url, headers=self.request_header, params={'token': session[0]})
+
+        if resp.status_code == 401:
+            sessions.invalidate(session)
+            session = await sessions.get_async(self._user_login, self.token_ttl)
+            if not session:
+                return None
+            resp = await self._request('get', url, headers=self.request_header, params={'token': session[0]})
+
+        return self._parse_cities(resp)
+
+    async def _get_city_id(self, check_city: str, check_region: str):
+        """ Get city ids of derival and arrival cities
+        check_city: city name
+        check_region: region name
+        Return: city id or None
+        """
+        city_index = await cities.get_async(self._get_cities, self.refresh_interval)
+
+        return self._find_city_id(city_index, check_city, check_region)
+
+    async def _get_delivery_calc(self):
+        """ Get results of calculation in json format
+        Return: results or None
+        """
+        url = f'{self.base_api_url}/price'
+        resp = await self._request('post', url, hedge=True, headers=self.request_header, json=self.body)
+
+        return self._read_json(resp)
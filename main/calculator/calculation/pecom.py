@@ -1,34 +1,80 @@
 # https://kabinet.pecom.ru/api/v1/help/calculator#toc-method-calculateprice
 
-import requests
+import json
 
-from .api import DeliveryAPI
+from .api import AsyncDeliveryAPI, DeliveryAPI
+from .directories import CachedDirectory
+
+
+BASE_API_URL = 'https://kabinet.pecom.ru/api/v1'
+BRANCHES_PATH = 'assets/data/pecom-branches.json'
+DEFAULT_REFRESH_INTERVAL = 24 * 60 * 60
+
+
+def build_branch_index(branches: list):
+    """ Create index of Pecom branches
+    branches: branches json
+    Return: dict with bitrixId as keys and tuples of lowercase addressDivision as values
+    """
+    index = {}
+    for branch in branches:
+        try:
+            address = branch['divisions'][0]['warehouses'][0]['addressDivision'].lower()
+        except (IndexError, KeyError):
+            continue
+        index[branch['bitrixId']] = index.get(branch['bitrixId'], ()) + (address,)
+
+    return index
+
+
+def load_branch_index(path: str):
+    """ Create index of Pecom branches from snapshot file
+    path: path to branches file
+    Return: dict of branches
+    """
+    with open(path, 'rb') as f:
+        return build_branch_index(json.load(f)['branches'])
+
+
+branches = CachedDirectory('pecom_branches', BRANCHES_PATH, load_branch_index)
 
 
 class PecomAPI(DeliveryAPI):
     """ Class provides communicate with API service """
+    name = 'ПЭК'
+    section = 'pecom'
+
     def __init__(self, config, delivery_info: dict):
         """
         config: instance of ConfigParser, reading config.ini
         delivery_info: info about delivery (arrival_city, derival_city, produce_date, cargo specs)
         """
-        self.base_api_url = 'https://kabinet.pecom.ru/api/v1'
+        self.base_api_url = config.get('pecom', 'base_url', fallback=BASE_API_URL)
         self.login = config['pecom']['login']
         self.apikey = config['pecom']['apikey']
-        self.branches = self._get_all_branches()
-        super().__init__(delivery_info)
-        self.result['name'] = 'ПЭК'
+        self.refresh_interval = config.getint('pecom', 'refresh_interval', fallback=DEFAULT_REFRESH_INTERVAL)
+        self.branches = None
+        super().__init__(config, delivery_info)
 
     def _get_all_branches(self):
-        """ Get all branches of Pecom
-        Return branches json or None
+        """ Get index of all branches of Pecom
+        Return branches index or None
         """
         url = f'{self.base_api_url}/branches/all/'
-        resp = requests.post(url,
+        resp = self._request('post', url,
                              auth=(self.login, self.apikey),
                              headers={'content-type': 'application/json'})
+
+        return self._parse_all_branches(resp)
+
+    @staticmethod
+    def _parse_all_branches(resp):
+        """ Get index of branches from response
+        resp: response of branches request
+        Return branches index or None
+        """
         if resp.status_code == 200:
-            return resp.json()['branches']
+            return build_branch_index(resp.json()['branches'])
 
         return None
 
@@ -36,12 +82,10 @@ class PecomAPI(DeliveryAPI):
         """ Check if branch in region
         Return: True if branch in region or False
         """
-        for branch in self.branches:
-            if branch['bitrixId'] == branch_id and \
-                    region in branch['divisions'][0]['warehouses'][0]['addressDivision'].lower():
-                return True
+        if not self.branches:
+            return False
 
-        return False
+        return any(region in address for address in self.branches.get(branch_id, ()))
 
     def _get_city_id(self, check_city: str, check_region: str):
         """ Get id of terminal branch in city
@@ -50,11 +94,20 @@ class PecomAPI(DeliveryAPI):
         Return: branch id or None
         """
         url = f'{self.base_api_url}/branches/findbytitle/'
-        resp = requests.post(url,
+        resp = self._request('post', url, hedge=True,
                              auth=(self.login, self.apikey),
                              json={'title': check_city, 'exact': False},
                              headers={'content-type': 'application/json'})
 
+        return self._parse_city_id(resp, check_city, check_region)
+
+    def _parse_city_id(self, resp, check_city: str, check_region: str):
+        """ Get id of terminal branch in city from response
+        resp: response of findbytitle request
+        check_city: city name
+        check_region: region name
+        Return: branch id or None
+        """
         if resp.status_code == 200:
             cities = resp.json()
             if cities['success']:
@@ -77,55 +130,58 @@ class PecomAPI(DeliveryAPI):
         return None
 
     def _get_request_body(self):
+        """ Create final body for request to API, branches are needed to check cities regions
+        Return: request body or None
+        """
+        self.branches = branches.get(self._get_all_branches, self.refresh_interval)
+        return super()._get_request_body()
+
+    def _build_request_body(self, derival_city_id, arrival_city_id):
         """ Create final body for request to API
+        derival_city_id: branch id of derival city
+        arrival_city_id: branch id of arrival city
         Return: request body
         """
-        derival_city_id = self._get_city_id(self.derival_city, self.derival_region)
-        arrival_city_id = self._get_city_id(self.arrival_city, self.arrival_region)
-
-        if derival_city_id and arrival_city_id:
-            body = {
-                'senderCityId': derival_city_id,
-                'receiverCityId': arrival_city_id,
-                'isOpenCarSender': False,
-                'senderDistanceType': 0,
-                'isDayByDay': False,
-                'isOpenCarReceiver': False,
-                'receiverDistanceType': 0,
-                'isHyperMarket': False,
-                'calcDate': self.date,
-                'isInsurance': False,
-                'isInsurancePrice': 0,
-                'isPickUp': False,
-                'isDelivery': False,
-                'pickupServices': {
-                    'isLoading': False,
-                    'floor': 0,
-                    'carryingDistance': 0,
-                    'isElevator': False
-                },
-                'deliveryServices': {
-                    'isLoading': False,
-                    'floor': 0,
-                    'carryingDistance': 0,
-                    'isElevator': False
-                },
-                'Cargos': [{
-                    'length': self.cargo['length'],
-                    'width': self.cargo['width'],
-                    'height': self.cargo['height'],
-                    'volume': self.cargo['volume'],
-                    'maxSize': max(self.cargo['length'], self.cargo['width'], self.cargo['height']),
-                    'isHP': False,
-                    'sealingPositionsCount': 0,
-                    'weight': self.cargo['weight'],
-                    'overSize': False
-                }]
-            }
-
-            return body
+        body = {
+            'senderCityId': derival_city_id,
+            'receiverCityId': arrival_city_id,
+            'isOpenCarSender': False,
+            'senderDistanceType': 0,
+            'isDayByDay': False,
+            'isOpenCarReceiver': False,
+            'receiverDistanceType': 0,
+            'isHyperMarket': False,
+            'calcDate': self.date,
+            'isInsurance': False,
+            'isInsurancePrice': 0,
+            'isPickUp': False,
+            'isDelivery': False,
+            'pickupServices': {
+                'isLoading': False,
+                'floor': 0,
+                'carryingDistance': 0,
+                'isElevator': False
+            },
+            'deliveryServices': {
+                'isLoading': False,
+                'floor': 0,
+                'carryingDistance': 0,
+                'isElevator': False
+            },
+            'Cargos': [{
+                'length': self.cargo['length'],
+                'width': self.cargo['width'],
+                'height': self.cargo['height'],
+                'volume': self.cargo['volume'],
+                'maxSize': max(self.cargo['length'], self.cargo['width'], self.cargo['height']),
+                'isHP': False,
+                'sealingPositionsCount': 0,
+                'weight': self.cargo['weight'],
+                'overSize': False
+            }]
+        }
 
-        return None
+        return body
 
     def _get_delivery_calc(self):
         """ Get results of calculation in json format
@@ -133,34 +189,29 @@ class PecomAPI(DeliveryAPI):
         """
         url = f'{self.base_api_url}/calculator/calculateprice/'
 
-        if not self.result['error']:
-            resp = requests.post(url,
-                                 auth=(self.login, self.apikey),
-                                 json=self.body,
-                                 headers={'content-type': 'application/json'})
-
-            if resp.status_code == 200:
-                resp_json = resp.json()
-                if 'error' not in resp_json.keys():
-                    return resp_json
-                else:
-                    self.result['error'] = 'Ошибка соединения'
-            else:
-                self.result['error'] = 'Ошибка соединения'
+        resp = self._request('post', url, hedge=True,
+                             auth=(self.login, self.apikey),
+                             json=self.body,
+                             headers={'content-type': 'application/json'})
 
-        return None
+        return self._parse_calculation_response(resp)
 
-    def calculate(self):
-        """ Main function to calculate delivery cost and time
-        Return: result dictionary
+    def _parse_calculation_response(self, resp):
+        """ Get calculation result from response
+        resp: response of calculateprice request
+        Return: results or None
         """
-        if not self.body:
-            return self.result
+        resp_json = self._read_json(resp)
+        if resp_json and 'error' in resp_json.keys():
+            self.result['error'] = 'Ошибка соединения'
+            return None
 
-        calculation = self._get_delivery_calc()
-        if not calculation:
-            return self.result
+        return resp_json
 
+    def _parse_delivery_calc(self, calculation):
+        """ Get delivery cost and time from calculation result
+        calculation: calculation result in json format
+        """
         try:
             cost = 0
             for transfer in calculation['transfers']:
@@ -172,4 +223,50 @@ class PecomAPI(DeliveryAPI):
         except KeyError or IndexError:
             self.result['error'] = 'Ошибка расчета данных'
 
-        return self.result
+
+class AsyncPecomAPI(AsyncDeliveryAPI, PecomAPI):
+    """ Class provides communicate with API service on event loop """
+    async def _get_all_branches(self):
+        """ Get index of all branches of Pecom
+        Return branches index or None
+        """
+        url = f'{self.base_api_url}/branches/all/'
+        resp = await self._request('post', url,
+                                   auth=(self.login, self.apikey),
+                                   headers={'content-type': 'application/json'})
+
+        return self._parse_all_branches(resp)
+
+    async def _get_city_id(self, check_city: str, check_region: str):
+        """ Get id of terminal branch in city
+        check_city: city name
+        check_region: region name
+        Return: branch id or None
+        """
+        url = f'{self.base_api_url}/branches/findbytitle/'
+        resp = await self._request('post', url, hedge=True,
+                                   auth=(self.login, self.apikey),
+                                   json={'title': check_city, 'exact': False},
+                                   headers={'content-type': 'application/json'})
+
+        return self._parse_city_id(resp, check_city, check_region)
+
+    async def _get_request_body(self):
+        """ Create final body for request to API, branches are needed to check cities regions
+        Return: request body or None
+        """
+        self.branches = await branches.get_async(self._get_all_branches, self.refresh_interval)
+        return await super()._get_request_body()
+
+    async def _get_delivery_calc(self):
+        """ Get results of calculation in json format
+        Return: results or None
+        """
+        url = f'{self.base_api_url}/calculator/calculateprice/'
+
+        resp = await self._request('post', url, hedge=True,
+                                   auth=(self.login, self.apikey),
+                                   json=self.body,
+                                   headers={'content-type': 'application/json'})
+
+        return self._parse_calculation_response(resp)
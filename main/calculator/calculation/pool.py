@@ -0,0 +1,281 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from weakref import WeakKeyDictionary
+import asyncio
+import atexit
+import os
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import httpx
+import requests
+
+try:
+    import uwsgi
+except ImportError:
+    uwsgi = None
+
+
+DEFAULT_WORKERS = 12
+DEFAULT_CONNECTIONS = 100
+DEFAULT_POOL_SIZE = 10
+DEFAULT_RETRIES = 1
+DEFAULT_BACKOFF = 0.1
+RETRY_STATUSES = (502, 503, 504)
+
+
+class CarrierPool:
+    """ Bounded thread pool shared by all Calculator instances of the process """
+    def __init__(self, max_workers: int):
+        """
+        max_workers: maximum number of threads running carrier jobs
+        """
+        self.max_workers = max_workers
+        self.pid = os.getpid()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='carrier')
+        self._lock = Lock()
+        self._queued = 0
+        self._active = 0
+        self._submitted = 0
+        self._completed = 0
+
+    def _run(self, func, args):
+        """ Wrapper around job to keep pool counters up to date
+        func: job function
+        args: job function arguments
+        Return: job result
+        """
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._completed += 1
+
+    def submit(self, func, *args):
+        """ Schedule job in the pool
+        func: job function
+        args: job function arguments
+        Return: Future of the job
+        """
+        with self._lock:
+            self._queued += 1
+            self._submitted += 1
+        try:
+            return self._executor.submit(self._run, func, args)
+        except RuntimeError:
+            with self._lock:
+                self._queued -= 1
+                self._submitted -= 1
+            raise
+
+    def cancel(self, future):
+        """ Cancel job that has not started yet
+        future: Future returned by submit
+        Return: True if job was cancelled
+        """
+        cancelled = future.cancel()
+        if cancelled:
+            with self._lock:
+                self._queued -= 1
+        return cancelled
+
+    def stats(self):
+        """ Get pool load info
+        Return: dict with queue depth, busy workers and saturation
+        """
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'queued': self._queued,
+                'active': self._active,
+                'submitted': self._submitted,
+                'completed': self._completed,
+                'saturation': round(self._active / self.max_workers, 2),
+            }
+
+    def shutdown(self, wait: bool = True):
+        """ Stop accepting jobs and release worker threads
+        wait: wait for running jobs to finish
+        """
+        self._executor.shutdown(wait=wait)
+
+
+_pool = None
+_pool_lock = Lock()
+
+
+def get_workers(config=None):
+    """ Get number of threads of carrier pool
+    config: instance of ConfigParser, reading config.ini
+    Return: workers option of config or default number
+    """
+    if config is None:
+        return DEFAULT_WORKERS
+
+    return config.getint('calculator', 'workers', fallback=DEFAULT_WORKERS)
+
+
+def get_pool(config=None):
+    """ Get pool of the current process, creating it on first call
+    config: instance of ConfigParser, reading config.ini
+    Return: CarrierPool
+    """
+    global _pool
+
+    if _pool is None or _pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                _pool = CarrierPool(get_workers(config))
+
+    return _pool
+
+
+def get_pool_stats():
+    """ Get load info of pool of the current process
+    Return: dict with queue depth, busy workers and saturation or None if pool is not created
+    """
+    with _pool_lock:
+        pool = _pool if _pool is not None and _pool.pid == os.getpid() else None
+
+    return pool.stats() if pool is not None else None
+
+
+def shutdown_pool():
+    """ Shutdown pool of the current process if it was created """
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None and _pool.pid == os.getpid():
+            _pool.shutdown(wait=False)
+        _pool = None
+
+
+_sessions = {}
+_sessions_lock = Lock()
+
+
+def get_option(config, section: str, option: str, fallback, getter: str = 'getint'):
+    """ Get option of carrier section falling back to calculator section
+    config: instance of ConfigParser, reading config.ini
+    section: carrier section of config
+    option: name of option
+    fallback: value if option is in neither section
+    getter: name of ConfigParser method reading option
+    Return: option value
+    """
+    default = getattr(config, getter)('calculator', option, fallback=fallback)
+    return getattr(config, getter)(section, option, fallback=default)
+
+
+def create_session(config, section: str):
+    """ Create http session with connection pool and retry policy of carrier
+    config: instance of ConfigParser, reading config.ini
+    section: carrier section of config
+    Return: requests.Session
+    """
+    pool_size = get_option(config, section, 'pool_size', DEFAULT_POOL_SIZE)
+    # only idempotent methods are retried, POST requests are sent once
+    retry = Retry(
+        total=get_option(config, section, 'retries', DEFAULT_RETRIES),
+        backoff_factor=get_option(config, section, 'backoff', DEFAULT_BACKOFF, 'getfloat'),
+        status_forcelist=RETRY_STATUSES,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if not get_option(config, section, 'keep_alive', True, 'getboolean'):
+        session.headers['Connection'] = 'close'
+
+    return session
+
+
+def get_session(config, section: str):
+    """ Get http session of carrier shared by threads of the current process, creating it on first call
+    config: instance of ConfigParser, reading config.ini
+    section: carrier section of config
+    Return: requests.Session
+    """
+    key = (os.getpid(), section)
+
+    if key not in _sessions:
+        with _sessions_lock:
+            if key not in _sessions:
+                _sessions[key] = create_session(config, section)
+
+    return _sessions[key]
+
+
+def get_session_stats():
+    """ Get connection reuse info of carriers sessions of the current process
+    Return: dict with carriers sections as keys and dicts with opened connections,
+    sent requests and share of requests sent over reused connections as values
+    """
+    stats = {}
+
+    with _sessions_lock:
+        sessions = [(section, session) for (pid, section), session in _sessions.items() if pid == os.getpid()]
+
+    for section, session in sessions:
+        connections, sent = 0, 0
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    connections += pool.num_connections
+                    sent += pool.num_requests
+        stats[section] = {
+            'connections': connections,
+            'requests': sent,
+            'reuse': round(1 - connections / sent, 2) if sent else 0,
+        }
+
+    return stats
+
+
+_clients = WeakKeyDictionary()
+
+
+async def run_blocking(func, *args):
+    """ Run blocking function (disk, sqlite) in default executor, so that event loop is not blocked
+    func: blocking function
+    args: function arguments
+    Return: function result
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+def get_async_client(config=None):
+    """ Get http client of the running event loop, creating it on first call
+    config: instance of ConfigParser, reading config.ini
+    Return: httpx.AsyncClient
+    """
+    loop = asyncio.get_event_loop()
+
+    if loop not in _clients:
+        max_connections = DEFAULT_CONNECTIONS
+        if config is not None:
+            max_connections = config.getint('calculator', 'connections', fallback=DEFAULT_CONNECTIONS)
+        _clients[loop] = httpx.AsyncClient(limits=httpx.Limits(max_connections=max_connections))
+
+    return _clients[loop]
+
+
+atexit.register(shutdown_pool)
+
+if uwsgi is not None:
+    _uwsgi_atexit = getattr(uwsgi, 'atexit', None)
+
+    def _uwsgi_shutdown():
+        shutdown_pool()
+        if _uwsgi_atexit:
+            _uwsgi_atexit()
+
+    uwsgi.atexit = _uwsgi_shutdown
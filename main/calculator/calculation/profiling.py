@@ -0,0 +1,180 @@
+from threading import Lock
+import cProfile
+import json
+import os
+import pstats
+import time
+
+from .directories import write_atomic
+
+
+PROFILES_DIR = 'assets/data/profiles'
+PROFILE_HEADER = 'X-Calculator-Profile'
+PROFILE_PARAM = 'profile'
+TOP_FUNCTIONS = 30
+
+# parse kind: parts of profiled function names of parsing modules
+PARSERS = {
+    'json': ('/json/', '_json.'),
+    'xml': ('/xml/', 'pyexpat', 'XMLParser', '_elementtree'),
+    'csv': ('/csv.py', '_csv.'),
+}
+
+
+def is_profiling_requested(request):
+    """ Check if staff user has asked to profile calculation by header or query parameter
+    request: Django request
+    Return: True or False
+    """
+    if not request.user.is_staff:
+        return False
+
+    return request.headers.get(PROFILE_HEADER) == '1' or request.GET.get(PROFILE_PARAM) == '1'
+
+
+def get_function_name(function):
+    """ Get readable name of profiled function
+    function: (file, line, name) key of pstats
+    Return: name string
+    """
+    filename, line, name = function
+    if filename == '~':
+        return name
+
+    return f'{filename}:{line}({name})'
+
+
+def get_parse_kind(function):
+    """ Get kind of data parsed by function
+    function: (file, line, name) key of pstats
+    Return: 'json', 'xml', 'csv' or None
+    """
+    name = get_function_name(function)
+
+    for kind, parts in PARSERS.items():
+        if any(part in name for part in parts):
+            return kind
+
+    return None
+
+
+class QuoteProfiler:
+    """ Profiler of one calculation. Calculator thread and every carrier job in carrier
+    pool are profiled separately, their stats are merged in report. Calculator makes no
+    profiler calls when it has no profiler, so calculations without profiling have no overhead.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._profiles = []
+        self.carriers = {}
+        self.wall = 0
+
+    def _add(self, profile):
+        """ Save profile of finished job
+        profile: cProfile.Profile
+        """
+        with self._lock:
+            self._profiles.append(profile)
+
+    def run(self, func, *args):
+        """ Run function in the current thread under profiler
+        func: function
+        args: function arguments
+        Return: result of function
+        """
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            return func(*args)
+        finally:
+            profile.disable()
+            self.wall = time.perf_counter() - start
+            self._add(profile)
+
+    def wrap(self, section: str, func):
+        """ Get function running under profiler in carrier pool thread
+        section: carrier section of config
+        func: function
+        Return: function saving profile and wall time of carrier job
+        """
+        def run(*args):
+            profile = cProfile.Profile()
+            start = time.perf_counter()
+            profile.enable()
+            try:
+                return func(*args)
+            finally:
+                profile.disable()
+                self.carriers[section] = time.perf_counter() - start
+                self._add(profile)
+
+        return run
+
+    def get_report(self, limit: int = TOP_FUNCTIONS):
+        """ Get merged profile of calculator and carriers threads
+        limit: number of functions in report
+        Return: dict with wall time of calculation and of carriers jobs,
+        time of json, xml and csv parsing and top functions by cumulative time
+        """
+        with self._lock:
+            profiles = list(self._profiles)
+
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+
+        parse = dict.fromkeys(PARSERS, 0)
+        for function, (_, _, tottime, _, _) in stats.stats.items():
+            kind = get_parse_kind(function)
+            if kind:
+                parse[kind] += tottime
+
+        functions = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+
+        return {
+            'wall': round(self.wall, 4),
+            'carriers': {section: round(wall, 4) for section, wall in sorted(self.carriers.items())},
+            'parse': {kind: round(value, 4) for kind, value in parse.items()},
+            'functions': [
+                {
+                    'function': get_function_name(function),
+                    'calls': calls,
+                    'tottime': round(tottime, 4),
+                    'cumtime': round(cumtime, 4),
+                }
+                for function, (_, calls, tottime, cumtime, _) in functions
+            ],
+        }
+
+    @staticmethod
+    def format_report(report: dict):
+        """ Get report as text
+        report: dict created by get_report
+        Return: text
+        """
+        lines = [f'wall: {report["wall"]:.4f}s']
+        lines += [f'carrier {section}: {wall:.4f}s' for section, wall in report['carriers'].items()]
+        lines += [f'parse {kind}: {value:.4f}s' for kind, value in report['parse'].items()]
+        lines.append(f'{"calls":>8} {"tottime":>8} {"cumtime":>8}  function')
+        lines += [f'{f["calls"]:>8} {f["tottime"]:>8.4f} {f["cumtime"]:>8.4f}  {f["function"]}'
+                  for f in report['functions']]
+
+        return '\n'.join(lines)
+
+    @staticmethod
+    def save_report(report: dict, path: str = PROFILES_DIR):
+        """ Save report to profiles directory
+        report: dict created by get_report
+        path: path to profiles directory
+        Return: path to report file or None if it was not saved
+        """
+        filename = os.path.join(path, f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{time.monotonic_ns()}.json')
+
+        try:
+            os.makedirs(path, exist_ok=True)
+            write_atomic(filename, json.dumps(report, ensure_ascii=False, indent=4).encode('utf-8'))
+        except OSError:
+            return None
+
+        return filename
@@ -0,0 +1,136 @@
+from threading import Lock
+from weakref import WeakKeyDictionary
+import asyncio
+import time
+
+from .pool import get_pool
+
+
+class SessionManager:
+    """ Credentials of API service shared by all API instances of the process.
+    Credentials are reused until they expire and renewed in background
+    during the last tenth of their lifetime.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._login_lock = Lock()
+        self._async_login_locks = WeakKeyDictionary()
+        self._value = None
+        self._expires = 0
+        self._refresh_at = 0
+        self._refreshing = False
+        self._tasks = set()
+
+    def _check(self):
+        """ Get current credentials and mark them as refreshing if it is time to renew them
+        Return: (credentials or None, True if caller must start refresh)
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            if self._value is None or now >= self._expires:
+                return None, False
+            if now >= self._refresh_at and not self._refreshing:
+                self._refreshing = True
+                return self._value, True
+
+            return self._value, False
+
+    def _store(self, value, ttl: float):
+        """ Save received credentials
+        value: credentials or None if login has failed
+        ttl: lifetime of credentials in seconds
+        """
+        with self._lock:
+            self._refreshing = False
+            if value:
+                now = time.monotonic()
+                self._value = value
+                self._expires = now + ttl
+                self._refresh_at = now + ttl * 0.9
+
+    def _refresh(self, login, ttl: float):
+        """ Renew credentials in background
+        login: function returning credentials or None
+        ttl: lifetime of credentials in seconds
+        """
+        try:
+            value = login()
+        except Exception:
+            value = None
+        self._store(value, ttl)
+
+    async def _refresh_async(self, login, ttl: float):
+        """ Renew credentials in background on event loop
+        login: coroutine function returning credentials or None
+        ttl: lifetime of credentials in seconds
+        """
+        try:
+            value = await login()
+        except Exception:
+            value = None
+        self._store(value, ttl)
+
+    def _get_async_login_lock(self):
+        """ Get lock of login on the running event loop, creating it on first call
+        Return: asyncio.Lock
+        """
+        loop = asyncio.get_event_loop()
+
+        with self._lock:
+            lock = self._async_login_locks.get(loop)
+            if lock is None:
+                lock = self._async_login_locks[loop] = asyncio.Lock()
+
+        return lock
+
+    def get(self, login, ttl: float):
+        """ Get valid credentials, login if there are none
+        login: function returning credentials or None
+        ttl: lifetime of credentials in seconds
+        Return: credentials or None
+        """
+        value, refresh = self._check()
+        if refresh:
+            get_pool().submit(self._refresh, login, ttl)
+        if value:
+            return value
+
+        with self._login_lock:
+            value, _ = self._check()
+            if not value:
+                value = login()
+                self._store(value, ttl)
+
+        return value
+
+    async def get_async(self, login, ttl: float):
+        """ Get valid credentials, login if there are none
+        login: coroutine function returning credentials or None
+        ttl: lifetime of credentials in seconds
+        Return: credentials or None
+        """
+        value, refresh = self._check()
+        if refresh:
+            task = asyncio.ensure_future(self._refresh_async(login, ttl))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        if value:
+            return value
+
+        async with self._get_async_login_lock():
+            value, _ = self._check()
+            if not value:
+                value = await login()
+                self._store(value, ttl)
+
+        return value
+
+    def invalidate(self, value):
+        """ Forget credentials rejected by API service
+        value: rejected credentials
+        """
+        with self._lock:
+            if self._value == value:
+                self._value = None
+                self._expires = 0
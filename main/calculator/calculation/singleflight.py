@@ -0,0 +1,164 @@
+from threading import Event, Lock
+from weakref import WeakKeyDictionary, WeakSet
+import asyncio
+
+
+# flights of the process, their calls are exported to metrics
+_flights = WeakSet()
+_flights_lock = Lock()
+
+
+class _Call:
+    """ Call in progress with its result """
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """ Runs only one call with the same key at a time, calls made while it is
+    in progress wait for it and get a copy of its result.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._calls = {}
+        self._coalesced = 0
+        with _flights_lock:
+            _flights.add(self)
+
+    def do(self, key: str, func, *args):
+        """ Run func or wait for call with the same key
+        key: key of the call
+        func: function returning result dictionary
+        args: function arguments
+        Return: result dictionary
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+            else:
+                call.waiters += 1
+                self._coalesced += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            with self._lock:
+                call.waiters -= 1
+            if call.error is not None:
+                raise call.error
+            return dict(call.result)
+
+        try:
+            call.result = func(*args)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
+
+    def stats(self):
+        """ Get info about calls in progress
+        Return: dict with calls in progress, waiting callers and total coalesced calls
+        """
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'waiters': sum(call.waiters for call in self._calls.values()),
+                'coalesced': self._coalesced,
+            }
+
+
+class AsyncSingleFlight:
+    """ SingleFlight for coroutines, calls are shared within one event loop """
+    def __init__(self):
+        # calls are changed on event loops and read by metrics from other threads
+        self._lock = Lock()
+        self._calls = WeakKeyDictionary()
+        self._waiters = {}
+        self._coalesced = 0
+        with _flights_lock:
+            _flights.add(self)
+
+    async def do(self, key: str, func, *args):
+        """ Run coroutine func or wait for call with the same key
+        key: key of the call
+        func: coroutine function returning result dictionary
+        args: function arguments
+        Return: result dictionary
+        """
+        loop = asyncio.get_event_loop()
+        with self._lock:
+            calls = self._calls.setdefault(loop, {})
+            if key in calls:
+                self._coalesced += 1
+
+        while key in calls:
+            future = calls[key]
+            with self._lock:
+                self._waiters[key] = self._waiters.get(key, 0) + 1
+            try:
+                return dict(await asyncio.shield(future))
+            except asyncio.CancelledError:
+                # leader was cancelled by its deadline, this call becomes leader
+                if not future.cancelled():
+                    raise
+            finally:
+                with self._lock:
+                    self._waiters[key] -= 1
+                    if not self._waiters[key]:
+                        del self._waiters[key]
+
+        with self._lock:
+            future = calls[key] = loop.create_future()
+        try:
+            result = await func(*args)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # mark exception as retrieved, it is raised here even if nobody waits for it
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                del calls[key]
+
+        return result
+
+    def stats(self):
+        """ Get info about calls in progress
+        Return: dict with calls in progress, waiting callers and total coalesced calls
+        """
+        with self._lock:
+            return {
+                'in_flight': sum(len(calls) for calls in self._calls.values()),
+                'waiters': sum(self._waiters.values()),
+                'coalesced': self._coalesced,
+            }
+
+
+def get_flight_stats():
+    """ Get info about calls in progress of all flights of the process
+    Return: dict with calls in progress, waiting callers and total coalesced calls
+    """
+    with _flights_lock:
+        flights = list(_flights)
+
+    total = {'in_flight': 0, 'waiters': 0, 'coalesced': 0}
+    for flight in flights:
+        for key, value in flight.stats().items():
+            total[key] += value
+
+    return total
@@ -0,0 +1,468 @@
+from abc import ABCMeta, abstractmethod
+from xml.etree import ElementTree as et
+import csv
+import hashlib
+import io
+import json
+import os
+import time
+
+import requests
+
+from . import dellin, dpd, gtd, nrgtk, pecom
+from .directories import MANIFEST_PATH, atomic_file, read_manifest, write_manifest
+from .pool import get_pool
+
+
+DEFAULT_SYNC_TIMEOUT = 60
+CHUNK_SIZE = 64 * 1024
+DIGESTS_PATH = 'assets/data/directories-digests.json'
+
+
+class SnapshotUnchanged(Exception):
+    """ Downloaded directory has the same entries as its snapshot """
+
+
+def get_digest(entry):
+    """ Get hash of directory entry
+    entry: entry bytes or json
+    Return: hex digest
+    """
+    if not isinstance(entry, bytes):
+        entry = json.dumps(entry, ensure_ascii=False, sort_keys=True).encode('utf-8')
+
+    return hashlib.sha1(entry).hexdigest()
+
+
+class DirectorySync(metaclass=ABCMeta):
+    """ Download of carrier directory to snapshot file in data folder. Directory is requested
+    with ETag and Last-Modified of previous download, snapshot is replaced only if entries
+    of directory have changed, so indexes of unchanged directories are not rebuilt.
+    """
+    section = ''
+    name = ''
+    path = ''
+    base_api_url = ''
+    load = None
+
+    def __init__(self, config, session):
+        """
+        config: instance of ConfigParser, reading config.ini
+        session: requests.Session shared by downloads
+        """
+        self.config = config
+        self.session = session
+        self.timeout = config.getfloat('calculator', 'sync_timeout', fallback=DEFAULT_SYNC_TIMEOUT)
+        self.base_api_url = config.get(self.section, 'base_url', fallback=self.base_api_url)
+
+    @classmethod
+    def is_configured(cls, config):
+        """ Check if config has options needed to download directory
+        config: instance of ConfigParser, reading config.ini
+        Return: True or False
+        """
+        return config.has_section(cls.section)
+
+    @abstractmethod
+    def request(self, headers: dict):
+        """ Send request for directory, response body is read by download
+        headers: conditional request headers
+        Return: streamed response
+        """
+
+    @abstractmethod
+    def read_entries(self, f):
+        """ Read entries of directory
+        f: snapshot file opened for binary reading
+        Return: iterable of (key, entry)
+        """
+
+    def get_digests(self, path: str):
+        """ Get hashes of directory entries from snapshot file
+        path: path to snapshot file
+        Return: dict with entries keys as keys and hashes as values, empty if there is no file
+        """
+        digests = {}
+
+        try:
+            with open(path, 'rb') as f:
+                for key, entry in self.read_entries(f):
+                    key, digest = str(key), get_digest(entry)
+                    # entries with the same key are compared together
+                    digests[key] = get_digest((digests[key] + digest).encode()) if key in digests else digest
+        except FileNotFoundError:
+            pass
+
+        return digests
+
+    def download(self, resp, f):
+        """ Write response body to file chunk by chunk
+        resp: streamed response
+        f: file opened for binary writing
+        Return: number of written bytes
+        """
+        size = 0
+        for chunk in resp.iter_content(CHUNK_SIZE):
+            f.write(chunk)
+            size += len(chunk)
+
+        return size
+
+    @staticmethod
+    def get_conditional_headers(state: dict):
+        """ Get headers asking API service to send directory only if it was modified
+        state: sync info of previous download
+        Return: dict with headers
+        """
+        headers = {}
+        if state.get('etag'):
+            headers['If-None-Match'] = state['etag']
+        if state.get('last_modified'):
+            headers['If-Modified-Since'] = state['last_modified']
+
+        return headers
+
+    def build_index(self):
+        """ Create index of snapshot like workers do
+        Return: time of index creation in seconds
+        """
+        start = time.perf_counter()
+        self.load(self.path)
+
+        return time.perf_counter() - start
+
+    def run(self, state: dict, old: dict):
+        """ Download directory and replace its snapshot if entries of directory have changed
+        state: sync info of previous download
+        old: hashes of snapshot entries
+        Return: (dict with sync info, new state, hashes of directory entries)
+        """
+        start = time.perf_counter()
+        info = {
+            'name': self.name,
+            'status': 'updated',
+            'bytes': 0,
+            'bytes_saved': 0,
+            'rebuild_saved': 0,
+            'added': 0,
+            'removed': 0,
+            'changed': 0,
+        }
+
+        if not os.path.exists(self.path):
+            state, old = {}, {}
+        elif old is None:
+            old = self.get_digests(self.path)
+        new = old
+
+        with self.request(self.get_conditional_headers(state)) as resp:
+            if resp.status_code == 304:
+                info['status'] = 'not modified'
+                info['bytes_saved'] = state.get('bytes', 0)
+                info['rebuild_saved'] = state.get('build_time', 0)
+            else:
+                resp.raise_for_status()
+                try:
+                    with atomic_file(self.path) as f:
+                        info['bytes'] = self.download(resp, f)
+                        f.flush()
+                        new = self.get_digests(f.name)
+                        if not new:
+                            raise ValueError('directory is empty')
+                        if new == old:
+                            raise SnapshotUnchanged
+                except SnapshotUnchanged:
+                    info['status'] = 'unchanged'
+                    info['rebuild_saved'] = state.get('build_time', 0)
+                else:
+                    state = {**state, 'bytes': info['bytes'], 'build_time': self.build_index()}
+                state = {
+                    **state,
+                    'etag': resp.headers.get('ETag'),
+                    'last_modified': resp.headers.get('Last-Modified'),
+                }
+
+        info.update({
+            'duration': time.perf_counter() - start,
+            'entries': len(new),
+            'added': len(new.keys() - old.keys()),
+            'removed': len(old.keys() - new.keys()),
+            'changed': sum(1 for key in new.keys() & old.keys() if new[key] != old[key]),
+        })
+        state = {
+            **state,
+            'checked': time.time(),
+            'bytes_saved': info['bytes_saved'],
+            'rebuild_saved': info['rebuild_saved'],
+            'total_bytes_saved': state.get('total_bytes_saved', 0) + info['bytes_saved'],
+            'total_rebuild_saved': state.get('total_rebuild_saved', 0) + info['rebuild_saved'],
+        }
+
+        return info, state, new
+
+
+class JSONDirectorySync(DirectorySync):
+    """ Download of directory in json format """
+    items_key = None
+    id_key = ''
+
+    def read_entries(self, f):
+        """ Read entries of directory
+        f: snapshot file opened for binary reading
+        Return: iterable of (key, entry)
+        """
+        data = json.load(f)
+        items = data[self.items_key] if self.items_key else data
+
+        return ((item[self.id_key], item) for item in items)
+
+
+class DellinTerminalsSync(JSONDirectorySync):
+    """ Download of Dellin terminals file """
+    section = 'dellin'
+    name = 'dellin terminals'
+    path = dellin.TERMINALS_PATH
+    base_api_url = dellin.BASE_API_URL
+    load = staticmethod(dellin.build_terminal_index)
+    items_key = 'city'
+    id_key = 'id'
+
+    def get_file_url(self):
+        """ Get url of terminals file
+        Return: url
+        """
+        resp = self.session.post(f'{self.base_api_url}/v3/public/terminals.json',
+                                 json={'appkey': self.config['dellin']['appkey']},
+                                 headers={'content-type': 'application/json'},
+                                 timeout=self.timeout)
+        resp.raise_for_status()
+
+        return resp.json()['url']
+
+    def request(self, headers: dict):
+        """ Send request for directory, response body is read by download
+        headers: conditional request headers
+        Return: streamed response
+        """
+        return self.session.get(self.get_file_url(), headers=headers, stream=True, timeout=self.timeout)
+
+
+class PecomBranchesSync(JSONDirectorySync):
+    """ Download of Pecom branches """
+    section = 'pecom'
+    name = 'pecom branches'
+    path = pecom.BRANCHES_PATH
+    base_api_url = pecom.BASE_API_URL
+    load = staticmethod(pecom.load_branch_index)
+    items_key = 'branches'
+    id_key = 'bitrixId'
+
+    def request(self, headers: dict):
+        """ Send request for directory, response body is read by download
+        headers: conditional request headers
+        Return: streamed response
+        """
+        return self.session.post(f'{self.base_api_url}/branches/all/',
+                                 auth=(self.config['pecom']['login'], self.config['pecom']['apikey']),
+                                 headers={'content-type': 'application/json', **headers},
+                                 stream=True, timeout=self.timeout)
+
+
+class GtdCitiesSync(JSONDirectorySync):
+    """ Download of GTD cities """
+    section = 'gtd'
+    name = 'gtd cities'
+    path = gtd.CITIES_PATH
+    base_api_url = gtd.BASE_API_URL
+    load = staticmethod(gtd.load_city_index)
+    id_key = 'code'
+    directory = 'city'
+
+    def request(self, headers: dict):
+        """ Send request for directory, response body is read by download
+        headers: conditional request headers
+        Return: streamed response
+        """
+        return self.session.post(f'{self.base_api_url}/tdd/{self.directory}/get-list/',
+                                 headers={'Content-Type': 'application/json',
+                                          'Authorization': f'Bearer {self.config["gtd"]["apikey"]}',
+                                          **headers},
+                                 stream=True, timeout=self.timeout)
+
+
+class GtdRegionsSync(GtdCitiesSync):
+    """ Download of GTD regions """
+    name = 'gtd regions'
+    path = gtd.REGIONS_PATH
+    load = staticmethod(gtd.load_region_index)
+    directory = 'region'
+
+
+class NrgtkCitiesSync(JSONDirectorySync):
+    """ Download of Energia cities """
+    section = 'nrgtk'
+    name = 'nrgtk cities'
+    path = nrgtk.CITIES_PATH
+    base_api_url = nrgtk.BASE_API_URL
+    load = staticmethod(nrgtk.load_city_index)
+    items_key = 'cityList'
+    id_key = 'id'
+
+    def request(self, headers: dict):
+        """ Login and send request for directory, response body is read by download
+        headers: conditional request headers
+        Return: streamed response
+        """
+        dev_headers = {'NrgApi-DevToken': self.config['nrgtk']['dev_token']}
+
+        resp = self.session.get(f'{self.base_api_url}/login', headers=dev_headers, timeout=self.timeout, params={
+            'user': self.config['nrgtk']['login'],
+            'password': self.config['nrgtk']['pass']
+        })
+        session = nrgtk.NrgtkAPI._parse_user_login(resp)
+        if not session:
+            raise ValueError(f'login failed with status {resp.status_code}')
+
+        return self.session.get(f'{self.base_api_url}/cities', headers={**dev_headers, **headers},
+                                params={'token': session[0]},
+                                stream=True, timeout=self.timeout)
+
+
+class DPDTerminalsSync(DirectorySync):
+    """ Download of DPD terminals """
+    section = 'dpd'
+    name = 'dpd terminals'
+    path = dpd.TERMINALS_PATH
+    base_api_url = dpd.BASE_API_URL
+    load = staticmethod(dpd.build_terminal_cities)
+
+    def read_entries(self, f):
+        """ Read terminals from xml file
+        f: snapshot file opened for binary reading
+        Return: iterable of (terminal code, terminal xml)
+        """
+        parents = []
+
+        for event, element in et.iterparse(f, events=('start', 'end')):
+            if event == 'start':
+                parents.append(element)
+                continue
+
+            parents.pop()
+            if element.tag == 'terminal' and parents:
+                yield element.findtext('terminalCode'), et.tostring(element)
+                del parents[-1][:]
+
+    def request(self, headers: dict):
+        """ Send request for directory, response body is read by download
+        headers: conditional request headers
+        Return: streamed response
+        """
+        body = dpd.TERMINALS_REQUEST_TEMPLATE.format(
+            client_num=self.config['dpd']['client_num'],
+            client_key=self.config['dpd']['client_key']
+        )
+
+        return self.session.post(f'{self.base_api_url}/geography2?wsdl',
+                                 data=body.encode('utf-8'),
+                                 headers={'content-type': 'text/xml; charset=utf-8', **headers},
+                                 stream=True, timeout=self.timeout)
+
+
+class DPDGeographySync(DirectorySync):
+    """ Download of DPD geography, file is published by DPD at [dpd] geography_url """
+    section = 'dpd'
+    name = 'dpd geography'
+    path = dpd.GEOGRAPHY_PATH
+    base_api_url = dpd.BASE_API_URL
+    load = staticmethod(dpd.load_geography_index)
+
+    @classmethod
+    def is_configured(cls, config):
+        """ Check if config has options needed to download directory
+        config: instance of ConfigParser, reading config.ini
+        Return: True or False
+        """
+        return config.has_option(cls.section, 'geography_url')
+
+    def read_entries(self, f):
+        """ Read cities from csv file
+        f: snapshot file opened for binary reading
+        Return: iterable of (city id, row)
+        """
+        reader = csv.reader(io.TextIOWrapper(f, encoding='windows-1251', newline=''), delimiter=';')
+
+        return ((row[0], row) for row in reader if row)
+
+    def request(self, headers: dict):
+        """ Send request for directory, response body is read by download
+        headers: conditional request headers
+        Return: streamed response
+        """
+        return self.session.get(self.config['dpd']['geography_url'], headers=headers, stream=True,
+                                timeout=self.timeout)
+
+
+SYNCS = [
+    DellinTerminalsSync,
+    PecomBranchesSync,
+    GtdCitiesSync,
+    GtdRegionsSync,
+    NrgtkCitiesSync,
+    DPDTerminalsSync,
+    DPDGeographySync,
+]
+
+
+def get_syncs(config, sections=None):
+    """ Get directories which can be downloaded with current config
+    config: instance of ConfigParser, reading config.ini
+    sections: carriers sections to sync, all if None
+    Return: list of DirectorySync subclasses
+    """
+    return [
+        sync for sync in SYNCS
+        if (sections is None or sync.section in sections) and sync.is_configured(config)
+    ]
+
+
+def run_sync(sync, state: dict, digests: dict):
+    """ Run directory download catching its errors
+    sync: DirectorySync instance
+    state: sync info of previous download
+    digests: hashes of snapshot entries or None if they are unknown
+    Return: (dict with sync info, with error if download has failed, new state, new hashes)
+    """
+    try:
+        info, state, digests = sync.run(state, digests)
+        info['error'] = ''
+    except (requests.RequestException, ValueError, KeyError, et.ParseError, OSError) as e:
+        info = {'name': sync.name, 'error': f'{type(e).__name__}: {e}'}
+
+    return info, state, digests
+
+
+def sync_directories(config, sections=None):
+    """ Download carriers directories concurrently, save sync info to manifest
+    config: instance of ConfigParser, reading config.ini
+    sections: carriers sections to sync, all if None
+    Return: list of dicts with sync info
+    """
+    pool = get_pool(config)
+    manifest = read_manifest(MANIFEST_PATH)
+    digests = read_manifest(DIGESTS_PATH)
+
+    with requests.Session() as session:
+        futures = [
+            (sync.path, pool.submit(run_sync, sync(config, session), manifest.get(sync.path, {}), digests.get(sync.path)))
+            for sync in get_syncs(config, sections)
+        ]
+        results = []
+        for path, future in futures:
+            info, manifest[path], digests[path] = future.result()
+            results.append(info)
+
+    write_manifest(digests, DIGESTS_PATH)
+    write_manifest(manifest, MANIFEST_PATH)
+
+    return results
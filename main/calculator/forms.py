@@ -1,3 +1,5 @@
+import csv
+
 from django import forms
 from django.core.exceptions import ValidationError
 
@@ -6,6 +8,21 @@ from crispy_forms.bootstrap import Tab, TabHolder, FormActions
 from crispy_forms.layout import Layout, Submit, Field, Row
 
 
+SHIPMENT_COLUMNS = (
+    'derival_city',
+    'derival_region',
+    'arrival_city',
+    'arrival_region',
+    'weight',
+    'length',
+    'width',
+    'height',
+    'volume',
+)
+REQUIRED_COLUMNS = ('derival_city', 'arrival_city', 'weight')
+MAX_BULK_ROWS = 200
+
+
 class CalculatorForm(forms.Form):
     derival_city = forms.CharField(
         label='Откуда',
@@ -113,3 +130,79 @@ class CalculatorForm(forms.Form):
         if not volume:
             if not width or not length or not height:
                 raise ValidationError('Заполните размеры (ширина, высота, длина) и/или объём груза.')
+
+
+def decode_csv(data: bytes):
+    """ Get text of csv file saved in UTF-8 or in Windows-1251 by Excel
+    data: content of file
+    Return: text
+    """
+    try:
+        return data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return data.decode('windows-1251')
+
+
+def read_shipments(text: str):
+    """ Read shipments from csv table, every row is validated by CalculatorForm
+    text: csv with header of SHIPMENT_COLUMNS separated by comma or semicolon, region, dimensions
+    and volume columns may be absent
+    Return: (csv dialect, list of (row values, cleaned data or None, error))
+    """
+    try:
+        dialect = csv.Sniffer().sniff(text.split('\n', 1)[0], delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+
+    reader = csv.reader(text.splitlines(), dialect)
+    header = [column.strip().lower() for column in next(reader, [])]
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise ValidationError(f'В файле нет колонок: {", ".join(missing)}.')
+
+    shipments = []
+    for values in reader:
+        if not any(value.strip() for value in values):
+            continue
+        row = dict(zip(header, (value.strip() for value in values)))
+        values = [row.get(column, '') for column in SHIPMENT_COLUMNS]
+
+        form = CalculatorForm(dict(zip(SHIPMENT_COLUMNS, values)))
+        if form.is_valid():
+            shipments.append((values, form.cleaned_data, ''))
+        else:
+            errors = [f'{column}: {" ".join(messages)}' if column != '__all__' else ' '.join(messages)
+                      for column, messages in form.errors.items()]
+            shipments.append((values, None, ' '.join(errors)))
+
+    return dialect, shipments
+
+
+class BulkForm(forms.Form):
+    file = forms.FileField(
+        label='Файл CSV',
+        help_text=f'Колонки: {", ".join(SHIPMENT_COLUMNS)}. Не больше {MAX_BULK_ROWS} строк.'
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.helper = FormHelper()
+        self.helper.layout = Layout(
+            Field('file'),
+            FormActions(
+                Submit('submit', 'Рассчитать')
+            )
+        )
+
+    def clean_file(self):
+        try:
+            dialect, shipments = read_shipments(decode_csv(self.cleaned_data['file'].read()))
+        except csv.Error:
+            raise ValidationError('Файл не является таблицей CSV.')
+
+        if not shipments:
+            raise ValidationError('В файле нет строк для расчета.')
+        if len(shipments) > MAX_BULK_ROWS:
+            raise ValidationError(f'В файле больше {MAX_BULK_ROWS} строк.')
+
+        return dialect, shipments
@@ -0,0 +1,57 @@
+import json
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand
+
+from calculator.standin.benchmark import MODES, run_benchmark
+from calculator.standin.server import StandinServer
+
+
+class Command(BaseCommand):
+    help = 'Benchmark quotes of all carriers against local stand-in of carriers APIs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=MODES, default='calculator',
+                            help='Calculator in threads, AsyncCalculator or calculator view')
+        parser.add_argument('--quotes', type=int, default=200, help='number of measured quotes')
+        parser.add_argument('--concurrency', type=int, default=8, help='number of quotes in progress')
+        parser.add_argument('--warmup', type=int, help='number of quotes before measurement, one per route by default')
+        parser.add_argument('--latency', type=float, default=0.05, help='delay of stand-in responses in seconds')
+        parser.add_argument('--jitter', type=float, default=0.02, help='maximum random deviation of delay in seconds')
+        parser.add_argument('--error-rate', type=float, default=0, help='share of stand-in requests answered with error')
+        parser.add_argument('--cache', action='store_true', help='let quotes be taken from cache')
+        parser.add_argument('--workdir', help='directory for config and data files, temporary by default')
+        parser.add_argument('--output', help='path to save report as json')
+
+    def handle(self, *args, **options):
+        server = StandinServer(latency=options['latency'], jitter=options['jitter'],
+                               error_rate=options['error_rate']).start()
+        # data files of carriers are relative to the current directory, benchmark keeps its own ones
+        workdir = options['workdir'] or tempfile.mkdtemp(prefix='benchmark-')
+        cwd = os.getcwd()
+
+        try:
+            os.makedirs(workdir, exist_ok=True)
+            os.chdir(workdir)
+            report = run_benchmark(server, options['mode'], options['quotes'], options['concurrency'],
+                                   options['warmup'], options['cache'])
+        finally:
+            os.chdir(cwd)
+            server.stop()
+
+        latency = report['latency']
+        self.stdout.write(
+            f'{report["mode"]}: {report["quotes"]} quotes, concurrency {report["concurrency"]}, '
+            f'{report["elapsed"]:.2f} s, {report["throughput"]:.2f} quotes/s\n'
+            f'latency: mean {latency["mean"] * 1000:.1f} ms, p50 {latency["p50"] * 1000:.1f} ms, '
+            f'p95 {latency["p95"] * 1000:.1f} ms, p99 {latency["p99"] * 1000:.1f} ms\n'
+            f'upstream requests per quote: {report["upstream_total_per_quote"]:.2f} '
+            f'({", ".join(f"{section} {calls:.2f}" for section, calls in report["upstream_per_quote"].items())})'
+        )
+        if report['errors']:
+            self.stdout.write(f'failed calculations: {report["errors"]}')
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=4)
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from calculator.calculation.directories import compile_index
+from calculator.calculation.dpd import COMPILED_GEOGRAPHY_PATH, GEOGRAPHY_PATH, build_geography_index
+
+
+class Command(BaseCommand):
+    help = 'Compile index of dpd-geography.csv file for fast city search'
+
+    def handle(self, *args, **options):
+        index = compile_index(GEOGRAPHY_PATH, COMPILED_GEOGRAPHY_PATH, build_geography_index)
+        self.stdout.write(self.style.SUCCESS(f'{len(index)} cities saved to {COMPILED_GEOGRAPHY_PATH}'))
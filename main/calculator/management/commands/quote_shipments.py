@@ -0,0 +1,51 @@
+import csv
+import sys
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from calculator.calculation.bulk import BulkQuoter, get_bulk_header, get_bulk_row
+from calculator.forms import SHIPMENT_COLUMNS, decode_csv, read_shipments
+from calculator.views import get_delivery_info
+
+
+class Command(BaseCommand):
+    help = 'Calculate delivery of all carriers for every shipment of csv file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='path to csv file with shipments')
+        parser.add_argument('--output', help='path to save csv file with quotes, stdout by default')
+        parser.add_argument('--workers', type=int, help='number of shipments in progress, bulk_workers option by default')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['input'], 'rb') as f:
+                dialect, shipments = read_shipments(decode_csv(f.read()))
+        except OSError as e:
+            raise CommandError(e)
+        except (ValidationError, csv.Error) as e:
+            raise CommandError(' '.join(getattr(e, 'messages', [str(e)])))
+
+        started = time.monotonic()
+
+        def progress(done, total):
+            self.stderr.write(f'{done}/{total} rows, {time.monotonic() - started:.1f} s', ending='\r')
+
+        quoter = BulkQuoter([get_delivery_info(data) if data else None for _, data, _ in shipments],
+                            options['workers'], progress)
+
+        output = open(options['output'], 'w', encoding='utf-8', newline='') if options['output'] else sys.stdout
+        try:
+            writer = csv.writer(output, dialect)
+            writer.writerow(get_bulk_header(SHIPMENT_COLUMNS))
+            for (values, _, error), results in zip(shipments, quoter.quote()):
+                writer.writerow(get_bulk_row(values, results, error))
+                output.flush()
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        elapsed = time.monotonic() - started
+        self.stderr.write(f'\n{len(shipments)} rows in {elapsed:.1f} s, {len(shipments) / elapsed:.2f} rows/s, '
+                          f'{quoter.workers} workers')
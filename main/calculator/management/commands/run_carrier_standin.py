@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from calculator.standin.server import DEFAULT_ERROR_STATUS, StandinServer
+
+
+class Command(BaseCommand):
+    help = 'Run local server replaying recorded responses of carriers APIs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='address to listen')
+        parser.add_argument('--port', type=int, default=8099, help='port to listen')
+        parser.add_argument('--latency', type=float, default=0, help='delay of responses in seconds')
+        parser.add_argument('--jitter', type=float, default=0, help='maximum random deviation of delay in seconds')
+        parser.add_argument('--error-rate', type=float, default=0, help='share of requests answered with error')
+        parser.add_argument('--error-status', type=int, default=DEFAULT_ERROR_STATUS, help='http status of errors')
+
+    def handle(self, *args, **options):
+        server = StandinServer(options['host'], options['port'], latency=options['latency'],
+                               jitter=options['jitter'], error_rate=options['error_rate'],
+                               error_status=options['error_status'])
+
+        self.stdout.write(f'Carriers stand-in is running at {server.url}, add to config.ini:')
+        for section in server.fixtures:
+            self.stdout.write(f'[{section}]\nbase_url = {server.get_base_url(section)}')
+            if section == 'dpd':
+                self.stdout.write(f'geography_url = {server.get_base_url(section)}/files/geography.csv')
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.httpd.server_close()
@@ -0,0 +1,55 @@
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from calculator.standin.microbenchmarks import (BASELINE_PATH, DEFAULT_REPEAT, DEFAULT_THRESHOLD, compare,
+                                                read_baseline, run_microbenchmarks, write_baseline)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark CPU-bound quote functions on generated carriers directories and compare with baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help='names of benchmarks, all by default')
+        parser.add_argument('--baseline', default=BASELINE_PATH, help='path to baseline results')
+        parser.add_argument('--save', action='store_true', help='save results as new baseline')
+        parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                            help='allowed slowdown against baseline, 0.2 is 20%%')
+        parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='number of runs of every benchmark')
+        parser.add_argument('--seed', type=int, default=0, help='seed of generated directories')
+
+    def handle(self, *args, **options):
+        baseline_path = os.path.abspath(options['baseline'])
+        cwd = os.getcwd()
+
+        # generated data files are written to carriers data paths relative to the current directory
+        with tempfile.TemporaryDirectory(prefix='microbenchmarks-') as workdir:
+            try:
+                os.chdir(workdir)
+                results = run_microbenchmarks(options['names'] or None, options['repeat'], options['seed'])
+            except KeyError as e:
+                raise CommandError(e.args[0])
+            finally:
+                os.chdir(cwd)
+
+        baseline = read_baseline(baseline_path)
+        rows = compare(results, baseline, options['threshold'])
+
+        for name, seconds, base, change, regressed in rows:
+            line = f'{name:<24} {seconds * 1e6:>12.2f} us'
+            if base is not None:
+                line += f' {base * 1e6:>12.2f} us {change:>+8.1%}'
+            self.stdout.write(self.style.ERROR(line) if regressed else line)
+
+        if options['save']:
+            if baseline:
+                results = dict(baseline, **results)
+            write_baseline(results, baseline_path)
+            self.stdout.write(self.style.SUCCESS(f'Baseline is saved to {baseline_path}'))
+            return
+
+        regressions = [name for name, *_, regressed in rows if regressed]
+        if regressions:
+            raise CommandError(f'{len(regressions)} benchmarks are slower than baseline by more than '
+                               f'{options["threshold"]:.0%}: {", ".join(regressions)}')
@@ -0,0 +1,34 @@
+from configparser import ConfigParser
+
+from django.core.management.base import BaseCommand, CommandError
+
+from calculator.calculation.sync import sync_directories
+
+
+class Command(BaseCommand):
+    help = 'Download directories of carriers (terminals, branches, cities) to data folder'
+
+    def add_arguments(self, parser):
+        parser.add_argument('sections', nargs='*', help='carriers sections of config, all by default')
+        parser.add_argument('--config', default='assets/data/config.ini', help='path to config file')
+
+    def handle(self, *args, **options):
+        config = ConfigParser()
+        if not config.read(options['config']):
+            raise CommandError(f'Config file {options["config"]} is not found')
+
+        failed = 0
+        for info in sync_directories(config, options['sections'] or None):
+            if info['error']:
+                failed += 1
+                self.stderr.write(f'{info["name"]}: {info["error"]}')
+            else:
+                self.stdout.write(
+                    f'{info["name"]}: {info["status"]}, {info["bytes"]} bytes, {info["duration"]:.2f} s, '
+                    f'{info["entries"]} entries, {info["added"]} added, '
+                    f'{info["removed"]} removed, {info["changed"]} changed, '
+                    f'saved {info["bytes_saved"]} bytes and {info["rebuild_saved"]:.3f} s of rebuild'
+                )
+
+        if failed:
+            raise CommandError(f'{failed} directories are not downloaded')
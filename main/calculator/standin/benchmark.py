@@ -0,0 +1,235 @@
+from concurrent.futures import ThreadPoolExecutor
+from configparser import ConfigParser
+import asyncio
+import math
+import os
+import time
+
+from django.contrib.auth.models import User
+from django.test import RequestFactory
+
+from calculator import views
+from calculator.calculation.calc import AsyncCalculator, Calculator
+from calculator.calculation.sync import sync_directories
+
+
+CONFIG_PATH = 'assets/data/config.ini'
+MODES = ('calculator', 'async', 'view')
+
+# routes covered by fixtures: derival city and region, arrival city and region
+ROUTES = [
+    ('Москва', 'Москва', 'Тула', 'Тульская область'),
+    ('Москва', 'Москва', 'Санкт-Петербург', 'Санкт-Петербург'),
+    ('Санкт-Петербург', 'Санкт-Петербург', 'Казань', 'Республика Татарстан'),
+    ('Казань', 'Республика Татарстан', 'Москва', 'Москва'),
+]
+
+CREDENTIALS = {
+    'dellin': {'appkey': 'standin', 'login': 'standin', 'pass': 'standin'},
+    'pecom': {'login': 'standin', 'apikey': 'standin'},
+    'gtd': {'apikey': 'standin'},
+    'baikal': {'apikey': 'standin'},
+    'nrgtk': {'dev_token': 'standin', 'login': 'standin', 'pass': 'standin'},
+    'dpd': {'client_num': '1', 'client_key': 'standin'},
+}
+
+
+def get_percentile(values: list, percentile: float):
+    """ Get percentile of values by nearest rank
+    values: sorted list of numbers
+    percentile: percentile from 0 to 100
+    Return: value or 0 if there are no values
+    """
+    if not values:
+        return 0
+
+    return values[max(math.ceil(percentile / 100 * len(values)) - 1, 0)]
+
+
+def get_shipments(count: int):
+    """ Get calculator form data of shipments on fixtures routes, cargo differs
+    so that identical calculations are not coalesced
+    count: number of shipments
+    Return: list of dicts
+    """
+    shipments = []
+
+    for i in range(count):
+        derival_city, derival_region, arrival_city, arrival_region = ROUTES[i % len(ROUTES)]
+        shipments.append({
+            'derival_city': derival_city,
+            'derival_region': derival_region,
+            'arrival_city': arrival_city,
+            'arrival_region': arrival_region,
+            'weight': 10 + i % 490,
+            'length': 1,
+            'width': 1,
+            'height': 1,
+            'volume': '',
+        })
+
+    return shipments
+
+
+def get_cleaned_data(shipment: dict):
+    """ Get form data of shipment as cleaned data of CalculatorForm
+    shipment: form data
+    Return: dict
+    """
+    return dict(shipment, volume=shipment['volume'] or None)
+
+
+def prepare_workdir(server, cache: bool = False):
+    """ Create config pointing carriers to stand-in and download directories from it,
+    must be called in working directory of benchmark
+    server: running StandinServer
+    cache: False if quotes must not be cached, so that every quote requests carriers
+    Return: instance of ConfigParser
+    """
+    os.makedirs(os.path.dirname(CONFIG_PATH), exist_ok=True)
+
+    config = ConfigParser()
+    config.read_dict(CREDENTIALS)
+    config['calculator'] = {} if cache else {'cache_ttl': '0'}
+    server.configure(config)
+    with open(CONFIG_PATH, 'w', encoding='utf-8') as f:
+        config.write(f)
+
+    for info in sync_directories(config):
+        if info['error']:
+            raise RuntimeError(f'{info["name"]}: {info["error"]}')
+
+    return config
+
+
+def count_errors(results: list):
+    """ Get carriers which calculation has failed
+    results: results of calculation
+    Return: list of carriers names
+    """
+    return [result['name'] for result in results if result['error']]
+
+
+def quote_calculator(shipment: dict):
+    """ Calculate shipment with Calculator
+    shipment: form data
+    Return: list of failed carriers names
+    """
+    return count_errors(Calculator(views.get_delivery_info(get_cleaned_data(shipment))).calculate())
+
+
+def quote_view(shipment: dict):
+    """ Calculate shipment with calculator view
+    shipment: form data
+    Return: list with 'view' if response is not successful
+    """
+    request = RequestFactory().post('/calculator/', shipment)
+    request.user = User(username='benchmark')
+    response = views.index(request)
+
+    return [] if response.status_code == 200 else ['view']
+
+
+def run_threads(func, shipments: list, concurrency: int):
+    """ Run quotes in fixed number of threads
+    func: function quoting shipment
+    shipments: list of form data
+    concurrency: number of threads
+    Return: (list of (duration, failed carriers) of quotes, elapsed seconds)
+    """
+    def run(shipment):
+        start = time.perf_counter()
+        errors = func(shipment)
+        return time.perf_counter() - start, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='benchmark') as executor:
+        quotes = list(executor.map(run, shipments))
+
+    return quotes, time.perf_counter() - start
+
+
+def run_async(shipments: list, concurrency: int):
+    """ Run quotes with AsyncCalculator on event loop, at most concurrency at a time
+    shipments: list of form data
+    concurrency: number of quotes in progress
+    Return: (list of (duration, failed carriers) of quotes, elapsed seconds)
+    """
+    async def run(shipment, semaphore):
+        async with semaphore:
+            start = time.perf_counter()
+            calculator = AsyncCalculator(views.get_delivery_info(get_cleaned_data(shipment)))
+            errors = count_errors(await calculator.calculate())
+            return time.perf_counter() - start, errors
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(*(run(shipment, semaphore) for shipment in shipments))
+
+    start = time.perf_counter()
+    quotes = asyncio.run(main())
+
+    return list(quotes), time.perf_counter() - start
+
+
+def run_load(mode: str, shipments: list, concurrency: int):
+    """ Run quotes in benchmark mode
+    mode: 'calculator', 'async' or 'view'
+    shipments: list of form data
+    concurrency: number of quotes in progress
+    Return: (list of (duration, failed carriers) of quotes, elapsed seconds)
+    """
+    if mode == 'async':
+        return run_async(shipments, concurrency)
+
+    return run_threads(quote_view if mode == 'view' else quote_calculator, shipments, concurrency)
+
+
+def run_benchmark(server, mode: str = 'calculator', quotes: int = 200, concurrency: int = 8, warmup: int = None,
+                  cache: bool = False):
+    """ Benchmark quotes against stand-in, must be called in working directory of benchmark
+    server: running StandinServer
+    mode: 'calculator', 'async' or 'view'
+    quotes: number of measured quotes
+    concurrency: number of quotes in progress
+    warmup: number of quotes made before measurement to log in and load directories, one per route by default
+    cache: True if quotes may be taken from cache
+    Return: dict with throughput, latency percentiles, errors and upstream requests per quote
+    """
+    # errors are injected into measured quotes only
+    error_rate, server.error_rate = server.error_rate, 0
+    prepare_workdir(server, cache)
+
+    shipments = get_shipments(quotes + (len(ROUTES) if warmup is None else warmup))
+    warmup_shipments, shipments = shipments[:len(shipments) - quotes], shipments[len(shipments) - quotes:]
+    run_load(mode, warmup_shipments, concurrency)
+    server.reset()
+    server.error_rate = error_rate
+
+    results, elapsed = run_load(mode, shipments, concurrency)
+    durations = sorted(duration for duration, _ in results)
+    errors = {}
+    for _, failed in results:
+        for name in failed:
+            errors[name] = errors.get(name, 0) + 1
+    upstream = server.stats()
+
+    return {
+        'mode': mode,
+        'quotes': quotes,
+        'concurrency': concurrency,
+        'elapsed': round(elapsed, 3),
+        'throughput': round(quotes / elapsed, 2) if elapsed else 0,
+        'latency': {
+            'mean': round(sum(durations) / len(durations), 4) if durations else 0,
+            'p50': round(get_percentile(durations, 50), 4),
+            'p95': round(get_percentile(durations, 95), 4),
+            'p99': round(get_percentile(durations, 99), 4),
+        },
+        'errors': errors,
+        'upstream_per_quote': {
+            section: round(calls / quotes, 2) for section, calls in sorted(upstream['requests'].items())
+        },
+        'upstream_total_per_quote': round(sum(upstream['requests'].values()) / quotes, 2) if quotes else 0,
+        'injected_errors': upstream['errors'],
+    }
@@ -0,0 +1,293 @@
+from configparser import ConfigParser
+from xml.sax.saxutils import escape
+import json
+import os
+import random
+import sys
+import timeit
+
+from calculator.calculation import dellin, dpd, gtd, nrgtk
+from calculator.calculation.api import DeliveryAPI
+from calculator.calculation.baikal import BaikalAPI
+from calculator.calculation.cache import get_quote_key, normalize_text
+from calculator.calculation.directories import PrefixIndex
+from calculator.calculation.pecom import PecomAPI
+from calculator.standin.benchmark import CREDENTIALS
+
+
+BASELINE_PATH = 'assets/data/microbenchmarks.json'
+DEFAULT_THRESHOLD = 0.2
+DEFAULT_REPEAT = 5
+
+# sizes of generated directories, close to sizes of carriers directories
+GEOGRAPHY_SIZE = 40000
+DPD_TERMINALS_SIZE = 1500
+DELLIN_CITIES_SIZE = 1000
+GTD_CITIES_SIZE = 5000
+NRGTK_CITIES_SIZE = 2000
+REGIONS_SIZE = 85
+TARIFFS_SIZE = 12
+
+SYLLABLES = ['ка', 'ли', 'но', 'ра', 'ве', 'ско', 'мир', 'град', 'ов', 'ин', 'ро', 'су', 'да', 'лес', 'бор']
+
+# cities looked up by benchmarks: name, region
+CITIES = [
+    ('Москва', 'Москва'),
+    ('Санкт-Петербург', 'Санкт-Петербург'),
+    ('Тула', 'Тульская область'),
+    ('Казань', 'Республика Татарстан'),
+    ('Новосибирск', 'Новосибирская область'),
+    ('Березовский', 'Свердловская область'),
+]
+
+DELIVERY_INFO = {
+    'derival_city': 'Москва',
+    'derival_region': 'Москва',
+    'arrival_city': 'Тула',
+    'arrival_region': 'Тульская область',
+    'produce_date': '2030-01-01',
+    'cargo': {'length': 1.2, 'width': 0.8, 'height': 0.6, 'weight': 120, 'volume': 0.576},
+}
+
+
+class Directories:
+    """ Generated carriers directories of realistic size with benchmark cities among them.
+    Files are written to the data paths of carriers, relative to the current directory.
+    """
+    def __init__(self, seed: int = 0):
+        """
+        seed: seed of random names, the same seed gives the same directories
+        """
+        self.random = random.Random(seed)
+        self.regions = [region for _, region in CITIES] + [
+            f'{self.get_name().capitalize()}ская область' for _ in range(REGIONS_SIZE - len(CITIES))
+        ]
+
+    def get_name(self):
+        """ Get random city name
+        Return: name
+        """
+        return ''.join(self.random.choice(SYLLABLES) for _ in range(self.random.randint(2, 4))).capitalize()
+
+    def get_cities(self, size: int):
+        """ Get random cities with benchmark cities among them, some benchmark cities
+        have namesakes in other regions
+        size: number of cities
+        Return: list of (name, region)
+        """
+        cities = list(CITIES) + [(name, self.random.choice(self.regions)) for name, _ in CITIES[2:]]
+        cities += [(self.get_name(), self.random.choice(self.regions)) for _ in range(size - len(cities))]
+        self.random.shuffle(cities)
+
+        return cities
+
+    @staticmethod
+    def write(path: str, data: bytes):
+        """ Write data file
+        path: path to file
+        data: content of file
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def write_dpd_geography(self):
+        """ Write DPD geography csv file """
+        rows = [f'{49000000 + i};RU;г;{name};{region}\n' for i, (name, region) in enumerate(self.get_cities(GEOGRAPHY_SIZE))]
+        self.write(dpd.GEOGRAPHY_PATH, ''.join(rows).encode('windows-1251'))
+
+    def write_dpd_terminals(self):
+        """ Write DPD terminals xml file, terminals are in the first cities of geography """
+        terminals = ''.join(
+            f'<terminal><terminalCode>T{i}</terminalCode><terminalName>{escape(self.get_name())}</terminalName>'
+            f'<address><cityId>{49000000 + i}</cityId><street>{escape(self.get_name())}</street></address></terminal>'
+            for i in range(DPD_TERMINALS_SIZE)
+        )
+        self.write(dpd.TERMINALS_PATH, f'<?xml version="1.0" encoding="UTF-8"?><return>{terminals}</return>'.encode())
+
+    def write_dellin_terminals(self):
+        """ Write Dellin terminals json file """
+        cities = [
+            {
+                'id': i,
+                'name': name,
+                'code': f'{i:013d}000000000000',
+                'terminals': {'terminal': [{'id': i * 10 + j, 'name': self.get_name()} for j in range(i % 3)]},
+            }
+            for i, (name, _) in enumerate(self.get_cities(DELLIN_CITIES_SIZE))
+        ]
+        self.write(dellin.TERMINALS_PATH, json.dumps({'city': cities}, ensure_ascii=False).encode('utf-8'))
+
+    def get_gtd_cities(self):
+        """ Get GTD cities json
+        Return: list of cities
+        """
+        return [
+            {'name': name, 'code': f'{i:013d}', 'region_code': str(self.regions.index(region))}
+            for i, (name, region) in enumerate(self.get_cities(GTD_CITIES_SIZE))
+        ]
+
+    def get_gtd_regions(self):
+        """ Get GTD regions json
+        Return: list of regions
+        """
+        return [{'name': region, 'code': str(i)} for i, region in enumerate(self.regions)]
+
+    def get_nrgtk_cities(self):
+        """ Get Energia cities json
+        Return: list of cities
+        """
+        return [
+            {'id': i, 'name': name, 'description': region}
+            for i, (name, region) in enumerate(self.get_cities(NRGTK_CITIES_SIZE))
+        ]
+
+    def get_dpd_calculation(self):
+        """ Get DPD calculation response
+        Return: xml bytes
+        """
+        tariffs = ''.join(
+            f'<return><serviceCode>S{i}</serviceCode><serviceName>{escape(self.get_name())}</serviceName>'
+            f'<cost>{self.random.uniform(500, 5000):.2f}</cost><days>{self.random.randint(1, 10)}</days></return>'
+            for i in range(TARIFFS_SIZE)
+        )
+
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<S:Envelope xmlns:S="http://schemas.xmlsoap.org/soap/envelope/"><S:Body>'
+            f'<ns2:getServiceCost2Response xmlns:ns2="http://dpd.ru/ws/calculator/2012-03-20">{tariffs}'
+            '</ns2:getServiceCost2Response></S:Body></S:Envelope>'
+        ).encode()
+
+    def write_files(self):
+        """ Write all data files of carriers """
+        self.write_dpd_geography()
+        self.write_dpd_terminals()
+        self.write_dellin_terminals()
+
+
+def get_config():
+    """ Get config with credentials of all carriers
+    Return: instance of ConfigParser
+    """
+    config = ConfigParser()
+    config.read_dict(CREDENTIALS)
+
+    return config
+
+
+def get_benchmarks(directories: Directories):
+    """ Prepare benchmarks of CPU-bound quote functions, must be called in directory with data files
+    directories: generated directories, their files are written
+    Return: dict with benchmark names as keys and functions without arguments as values
+    """
+    config = get_config()
+    apis = {api_class.section: api_class(config, dict(DELIVERY_INFO))
+            for api_class in (dellin.DellinAPI, PecomAPI, gtd.GtdAPI, BaikalAPI, nrgtk.NrgtkAPI, dpd.DPDApi)}
+
+    gtd_cities, gtd_regions = directories.get_gtd_cities(), directories.get_gtd_regions()
+    gtd_city_index, gtd_region_index = gtd.build_city_index(gtd_cities), gtd.build_region_index(gtd_regions)
+    nrgtk_cities = directories.get_nrgtk_cities()
+    nrgtk_city_index = nrgtk.build_city_index(nrgtk_cities)
+    calculation = directories.get_dpd_calculation()
+    dpd_ids = [apis['dpd']._get_city_id(city, region) for city, region in CITIES]
+    with open(dellin.TERMINALS_PATH, 'rb') as f:
+        dellin_codes = [city['code'] for city in json.load(f)['city'][:len(CITIES)]]
+
+    benchmarks = {
+        'clean_region': lambda: [DeliveryAPI._get_clean_region(region) for _, region in CITIES],
+        'normalize_text': lambda: [normalize_text(city) for city, _ in CITIES],
+        'quote_key': lambda: get_quote_key(dpd.DPDApi, DELIVERY_INFO),
+        'dpd_city_id': lambda: [apis['dpd']._get_city_id(city, region) for city, region in CITIES],
+        'dpd_arrival_terminal': lambda: [dpd.DPDApi._check_arrival_terminal(city_id) for city_id in dpd_ids],
+        'dpd_geography_build': lambda: dpd.build_geography_index(dpd.GEOGRAPHY_PATH),
+        'dpd_terminals_build': lambda: dpd.build_terminal_cities(dpd.TERMINALS_PATH),
+        'dpd_tariff_parse': lambda: dpd.find_cheapest_tariff(calculation),
+        'dellin_terminal_id': lambda: [dellin.DellinAPI._get_terminal_id(code) for code in dellin_codes],
+        'dellin_terminals_build': lambda: dellin.build_terminal_index(dellin.TERMINALS_PATH),
+        'gtd_city_find': lambda: [apis['gtd']._find_cities(gtd_city_index, city) for city, _ in CITIES],
+        'gtd_region_code': lambda: [apis['gtd']._find_region_code(gtd_region_index, region) for _, region in CITIES],
+        'gtd_index_build': lambda: gtd.build_city_index(gtd_cities),
+        'nrgtk_city_find': lambda: [apis['nrgtk']._find_city_id(nrgtk_city_index, city, region)
+                                    for city, region in CITIES],
+        'nrgtk_index_build': lambda: nrgtk.build_city_index(nrgtk_cities),
+        'prefix_find': lambda: [gtd_city_index.find(city[:3]) for city, _ in CITIES],
+        'prefix_index_build': lambda: PrefixIndex((city['name'], city['id']) for city in nrgtk_cities),
+    }
+    for section, api in apis.items():
+        benchmarks[f'{section}_body'] = lambda api=api: api._build_request_body('1', '2')
+
+    return benchmarks
+
+
+def measure(func, repeat: int = DEFAULT_REPEAT):
+    """ Get time of one call of function, number of calls is chosen so that one run takes at least 0.2 s
+    func: function without arguments
+    repeat: number of runs, the fastest one is taken
+    Return: seconds
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+
+    return min(timer.repeat(repeat, number)) / number
+
+
+def run_microbenchmarks(names: list = None, repeat: int = DEFAULT_REPEAT, seed: int = 0):
+    """ Run benchmarks of CPU-bound quote functions, must be called in working directory of benchmark
+    names: names of benchmarks to run, all if None
+    repeat: number of runs of every benchmark
+    seed: seed of generated directories
+    Return: dict with benchmark names as keys and seconds per call as values
+    """
+    directories = Directories(seed)
+    directories.write_files()
+    benchmarks = get_benchmarks(directories)
+
+    unknown = set(names or ()) - set(benchmarks)
+    if unknown:
+        raise KeyError(f'unknown benchmarks: {", ".join(sorted(unknown))}')
+
+    return {name: measure(func, repeat) for name, func in benchmarks.items() if not names or name in names}
+
+
+def read_baseline(path: str = BASELINE_PATH):
+    """ Read saved results of benchmarks
+    path: path to baseline file
+    Return: dict with benchmark names as keys and seconds per call as values or None if there is no baseline
+    """
+    try:
+        with open(path, 'rb') as f:
+            return json.load(f)['results']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def write_baseline(results: dict, path: str = BASELINE_PATH):
+    """ Save results of benchmarks as baseline
+    results: dict with benchmark names as keys and seconds per call as values
+    path: path to baseline file
+    """
+    baseline = {
+        'python': sys.version.split()[0],
+        'results': results,
+    }
+
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, indent=4, sort_keys=True)
+
+
+def compare(results: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD):
+    """ Compare results of benchmarks with baseline
+    results: dict with benchmark names as keys and seconds per call as values
+    baseline: saved results
+    threshold: allowed slowdown, 0.2 is 20%
+    Return: list of (name, seconds, baseline seconds or None, change or None, True if regressed)
+    """
+    rows = []
+
+    for name, seconds in results.items():
+        base = baseline.get(name) if baseline else None
+        change = seconds / base - 1 if base else None
+        rows.append((name, seconds, base, change, change is not None and change > threshold))
+
+    return rows
@@ -0,0 +1,244 @@
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from urllib.parse import parse_qsl, urlsplit
+import glob
+import json
+import os
+import random
+import time
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+DEFAULT_ERROR_STATUS = 503
+
+
+def load_fixtures(path: str = FIXTURES_DIR):
+    """ Load recorded responses of carriers
+    path: path to fixtures directory with one json file per carrier section
+    Return: dict with carriers sections as keys and fixtures as values
+    """
+    fixtures = {}
+
+    for filename in sorted(glob.glob(os.path.join(path, '*.json'))):
+        with open(filename, 'rb') as f:
+            fixtures[os.path.splitext(os.path.basename(filename))[0]] = json.load(f)
+
+    return fixtures
+
+
+class StandinServer:
+    """ Local http server replaying recorded responses of carriers APIs.
+    Carrier is served at /<section>/ path, so it is enough to set base_url of carrier
+    to stand-in url. Latency, jitter and injected errors are set for all carriers and
+    can be overridden in fixture file or route.
+    """
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, fixtures: dict = None,
+                 latency: float = 0, jitter: float = 0, error_rate: float = 0,
+                 error_status: int = DEFAULT_ERROR_STATUS):
+        """
+        host: address to listen
+        port: port to listen, any free port if 0
+        fixtures: dict with carriers sections as keys and fixtures as values, fixtures folder by default
+        latency: delay of responses in seconds
+        jitter: maximum random deviation of delay in seconds
+        error_rate: share of requests answered with error_status
+        error_status: http status of injected errors
+        """
+        self.fixtures = fixtures if fixtures is not None else load_fixtures()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._lock = Lock()
+        self._calls = Counter()
+        self._errors = Counter()
+        self._random = random.Random()
+        self._thread = None
+        self.httpd = ThreadingHTTPServer((host, port), self._get_handler())
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        """ Base url of stand-in """
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def get_base_url(self, section: str):
+        """ Get url of carrier API served by stand-in
+        section: carrier section of config
+        Return: url
+        """
+        return f'{self.url}/{section}'
+
+    def configure(self, config):
+        """ Point carriers in config to stand-in
+        config: instance of ConfigParser
+        """
+        for section in self.fixtures:
+            if not config.has_section(section):
+                config.add_section(section)
+            config.set(section, 'base_url', self.get_base_url(section))
+
+        if 'dpd' in self.fixtures:
+            config.set('dpd', 'geography_url', f'{self.get_base_url("dpd")}/files/geography.csv')
+
+    @staticmethod
+    def _matches(route: dict, method: str, path: str, params: dict):
+        """ Check if route answers request
+        route: route of fixture
+        method: http method
+        path: request path without carrier prefix
+        params: query and json body parameters of request
+        Return: True or False
+        """
+        if route['method'] != method or route['path'].rstrip('/') != path.rstrip('/'):
+            return False
+
+        return all(params.get(name) == value for name, value in route.get('match', {}).items())
+
+    def find_route(self, section: str, method: str, path: str, params: dict):
+        """ Find the first route of carrier fixture answering request
+        section: carrier section of config
+        method: http method
+        path: request path without carrier prefix
+        params: query and json body parameters of request
+        Return: (fixture, route) or (None, None)
+        """
+        fixture = self.fixtures.get(section)
+        if fixture is None:
+            return None, None
+
+        for route in fixture['routes']:
+            if self._matches(route, method, path, params):
+                return fixture, route
+
+        return fixture, None
+
+    def get_delay(self, fixture: dict, route: dict):
+        """ Get delay of response
+        fixture: carrier fixture
+        route: route of fixture
+        Return: seconds
+        """
+        latency = route.get('latency', fixture.get('latency', self.latency))
+        jitter = route.get('jitter', fixture.get('jitter', self.jitter))
+
+        return max(latency + self._random.uniform(-jitter, jitter), 0)
+
+    def is_error(self, fixture: dict, route: dict):
+        """ Check if error must be injected instead of response
+        fixture: carrier fixture
+        route: route of fixture
+        Return: True or False
+        """
+        return self._random.random() < route.get('error_rate', fixture.get('error_rate', self.error_rate))
+
+    def get_body(self, route: dict):
+        """ Get body of recorded response
+        route: route of fixture
+        Return: (content type, body bytes)
+        """
+        if 'json' in route:
+            text = json.dumps(route['json'], ensure_ascii=False).replace('{standin_url}', self.url)
+            return route.get('content_type', 'application/json'), text.encode('utf-8')
+
+        text = route.get('text', '').replace('{standin_url}', self.url)
+        return route.get('content_type', 'text/plain'), text.encode(route.get('encoding', 'utf-8'))
+
+    def count(self, section: str, error: bool):
+        """ Save request to carrier
+        section: carrier section of config
+        error: True if error was injected
+        """
+        with self._lock:
+            self._calls[section] += 1
+            if error:
+                self._errors[section] += 1
+
+    def stats(self):
+        """ Get requests received by stand-in
+        Return: dict with requests and injected errors by carrier
+        """
+        with self._lock:
+            return {
+                'requests': dict(self._calls),
+                'errors': dict(self._errors),
+            }
+
+    def reset(self):
+        """ Forget received requests """
+        with self._lock:
+            self._calls.clear()
+            self._errors.clear()
+
+    def _get_handler(self):
+        """ Get request handler class of stand-in
+        Return: BaseHTTPRequestHandler subclass
+        """
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, content_type: str = 'text/plain', body: bytes = b''):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _handle(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                data = self.rfile.read(length) if length else b''
+
+                url = urlsplit(self.path)
+                _, section, path = (url.path.split('/', 2) + [''])[:3]
+                params = dict(parse_qsl(url.query))
+                if data:
+                    try:
+                        body = json.loads(data)
+                    except ValueError:
+                        body = None
+                    if isinstance(body, dict):
+                        params.update(body)
+
+                fixture, route = server.find_route(section, self.command, f'/{path}', params)
+                if route is None:
+                    server.count(section, False)
+                    self._send(404)
+                    return
+
+                time.sleep(server.get_delay(fixture, route))
+                error = server.is_error(fixture, route)
+                server.count(section, error)
+                if error:
+                    self._send(server.error_status)
+                    return
+
+                self._send(route.get('status', 200), *server.get_body(route))
+
+            do_GET = do_POST = _handle
+
+        return Handler
+
+    def start(self):
+        """ Serve requests in background thread
+        Return: self
+        """
+        self._thread = Thread(target=self.httpd.serve_forever, name='standin', daemon=True)
+        self._thread.start()
+
+        return self
+
+    def serve_forever(self):
+        """ Serve requests in the current thread """
+        self.httpd.serve_forever()
+
+    def stop(self):
+        """ Stop server and close its socket """
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,137 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from calculator.calculation.api import UNAVAILABLE_ERROR
+from calculator.calculation.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, get_breaker
+from calculator.calculation.cache import get_quote_key
+from calculator.calculation.calc import Calculator
+
+from .test_bulk import DELIVERY_INFO, get_api_class
+from .utils import WorkdirTestCase
+
+
+class CircuitBreakerTest(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('calculator.calculation.breaker.time.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(window=4, min_calls=4, error_rate=0.5, slow_call=1,
+                                      slow_rate=0.75, open_time=30)
+
+    def open_breaker(self):
+        for _ in range(4):
+            self.breaker.record(False, 0.1)
+
+    def test_stays_closed_below_min_calls(self):
+        for _ in range(3):
+            self.breaker.record(False, 0.1)
+
+        self.assertEqual(self.breaker.stats()['state'], CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+    def test_opens_on_error_rate(self):
+        for success in (True, True, False, False):
+            self.breaker.record(success, 0.1)
+
+        self.assertEqual(self.breaker.stats()['state'], OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.stats()['rejected'], 1)
+
+    def test_opens_on_slow_rate(self):
+        for duration in (0.1, 2, 2, 2):
+            self.breaker.record(True, duration)
+
+        self.assertEqual(self.breaker.stats()['state'], OPEN)
+
+    def test_allows_one_probe_after_open_time(self):
+        self.open_breaker()
+
+        self.now += 29
+        self.assertFalse(self.breaker.allow())
+        self.now += 1
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.stats()['state'], HALF_OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_probe_success_closes(self):
+        self.open_breaker()
+        self.now += 30
+        self.breaker.allow()
+
+        self.breaker.record(True, 0.1)
+
+        self.assertEqual(self.breaker.stats()['state'], CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+    def test_probe_failure_opens_again(self):
+        self.open_breaker()
+        self.now += 30
+        self.breaker.allow()
+
+        self.breaker.record(True, 2)
+
+        self.assertEqual(self.breaker.stats()['state'], OPEN)
+        self.now += 29
+        self.assertFalse(self.breaker.allow())
+
+    def test_lost_probe_is_replaced(self):
+        self.open_breaker()
+        self.now += 30
+        self.assertTrue(self.breaker.allow())
+
+        self.now += 30
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+
+
+class StaleFallbackTest(WorkdirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.write('assets/data/config.ini', b'[calculator]\ncache_ttl = 60\n\n[test_breaker_off]\nstale_fallback = no\n')
+
+    def get_open_api_class(self, section: str):
+        """ Get carrier which circuit breaker is open
+        section: carrier section of config
+        Return: FakeAPI subclass
+        """
+        api_class = get_api_class(section)
+        calculator = Calculator(dict(DELIVERY_INFO))
+        breaker = get_breaker(calculator.config, section)
+        for _ in range(breaker.min_calls):
+            breaker.record(False, 0)
+
+        return api_class
+
+    def set_expired_result(self, calculator, api_class):
+        """ Save result of carrier which is kept only for stale fallback
+        calculator: Calculator
+        api_class: DeliveryAPI subclass
+        Return: result dictionary
+        """
+        result = {'name': api_class.name, 'cost': '100.00', 'days': 2, 'error': ''}
+        calculator.cache.set(api_class, calculator.delivery_info, result)
+        calculator.cache.cache.delete(get_quote_key(api_class, calculator.delivery_info))
+
+        return result
+
+    def test_open_breaker_returns_stale_result(self):
+        api_class = self.get_open_api_class('test_breaker_stale')
+        calculator = Calculator(dict(DELIVERY_INFO))
+        result = self.set_expired_result(calculator, api_class)
+
+        self.assertEqual(calculator.run_calculator(api_class), dict(result, stale=True))
+
+    def test_open_breaker_without_stale_result(self):
+        api_class = self.get_open_api_class('test_breaker_empty')
+        calculator = Calculator(dict(DELIVERY_INFO))
+
+        self.assertEqual(calculator.run_calculator(api_class), api_class.error_result(UNAVAILABLE_ERROR))
+
+    def test_stale_fallback_can_be_disabled(self):
+        api_class = self.get_open_api_class('test_breaker_off')
+        calculator = Calculator(dict(DELIVERY_INFO))
+        self.set_expired_result(calculator, api_class)
+
+        self.assertEqual(calculator.run_calculator(api_class), api_class.error_result(UNAVAILABLE_ERROR))
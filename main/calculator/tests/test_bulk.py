@@ -0,0 +1,165 @@
+from unittest import mock
+import os
+
+from calculator.calculation.api import DeliveryAPI
+from calculator.calculation.breaker import get_breaker
+from calculator.calculation.bulk import (CALCULATION_ERROR, FAILED, RUNNING, BulkJob, BulkQuoter, get_bulk_row,
+                                         get_city_key, remove_old_jobs)
+from calculator.calculation.pool import CarrierPool
+
+from .utils import WorkdirTestCase
+
+
+DELIVERY_INFO = {
+    'derival_city': 'Москва',
+    'derival_region': 'Москва',
+    'arrival_city': 'Тула',
+    'arrival_region': 'Тульская область',
+    'produce_date': '2030-01-01',
+    'cargo': {'length': 1, 'width': 1, 'height': 1, 'weight': 10, 'volume': 1},
+}
+
+
+class FakeAPI(DeliveryAPI):
+    """ Carrier resolving cities from cities dict """
+    name = 'Fake'
+    section = 'test_bulk'
+    cities = {'Москва': 1, 'Тула': 2}
+    error = None
+
+    def _get_city_id(self, check_city: str, check_region: str):
+        if self.error is not None:
+            raise self.error
+        city_id = self.cities.get(check_city)
+        if city_id is None:
+            self.result['error'] = f'{check_city}: нет доставки'
+        return city_id
+
+    def _build_request_body(self, derival_id, arrival_id):
+        return {'from': derival_id, 'to': arrival_id}
+
+    def _get_delivery_calc(self):
+        return None
+
+    def _parse_delivery_calc(self, calculation):
+        pass
+
+
+def get_api_class(section: str, error: Exception = None):
+    """ Get carrier with its own circuit breaker
+    section: carrier section of config
+    error: exception raised by city lookup
+    Return: FakeAPI subclass
+    """
+    return type('FakeAPI', (FakeAPI,), {'section': section, 'error': error})
+
+
+def get_city_info(city: str, region: str = ''):
+    """ Get delivery info from and to city
+    city: city name
+    region: region name
+    Return: delivery info
+    """
+    return dict(DELIVERY_INFO, derival_city=city, derival_region=region, arrival_city=city, arrival_region=region)
+
+
+class ResolveCityTest(WorkdirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.quoter = BulkQuoter([dict(DELIVERY_INFO)], workers=1)
+
+    def test_resolved_city(self):
+        api_class = get_api_class('test_bulk_resolved')
+
+        self.assertIsNone(self.quoter.resolve_city(api_class, get_city_info('Тула', 'Тульская область')))
+
+    def test_city_without_delivery(self):
+        api_class = get_api_class('test_bulk_no_delivery')
+
+        result = self.quoter.resolve_city(api_class, get_city_info('Атлантида'))
+
+        self.assertEqual(result['error'], 'Атлантида: нет доставки')
+
+    def test_unexpected_error_is_error_of_carrier(self):
+        api_class = get_api_class('test_bulk_broken', ValueError('broken response'))
+
+        result = self.quoter.resolve_city(api_class, get_city_info('Атлантида'))
+
+        self.assertEqual(result['error'], CALCULATION_ERROR)
+
+    def test_open_breaker_is_not_requested(self):
+        api_class = get_api_class('test_bulk_open', AssertionError('carrier must not be requested'))
+        breaker = get_breaker(self.quoter.config, api_class.section)
+        for _ in range(breaker.min_calls):
+            breaker.record(False, 0)
+
+        self.assertIsNone(self.quoter.resolve_city(api_class, get_city_info('Атлантида')))
+
+    def test_resolve_keeps_errors_of_cities(self):
+        self.quoter.shipments = [dict(DELIVERY_INFO, arrival_city='Атлантида', arrival_region='')]
+        pool = CarrierPool(2)
+        self.addCleanup(pool.shutdown)
+
+        with mock.patch('calculator.calculation.bulk.CALCULATORS', (get_api_class('test_bulk_resolve'),)):
+            self.quoter.resolve(pool)
+
+        errors = {key: result['error'] for (_, key), result in self.quoter.unresolved.items()}
+        self.assertEqual(errors[get_city_key('Атлантида', '')], 'Атлантида: нет доставки')
+        self.assertNotIn(get_city_key('Москва', 'Москва'), errors)
+
+
+class PricedAPI(FakeAPI):
+    """ Carrier calculating price of delivery """
+    name = 'Priced'
+    section = 'test_bulk_priced'
+
+    def _get_delivery_calc(self):
+        return {'cost': '100.00', 'days': 2}
+
+    def _parse_delivery_calc(self, calculation):
+        self.result['cost'], self.result['days'] = calculation['cost'], calculation['days']
+
+
+class BrokenAPI(PricedAPI):
+    """ Carrier answering with page which is not json """
+    name = 'Broken'
+    section = 'test_bulk_parse'
+
+    def _get_delivery_calc(self):
+        raise ValueError('html instead of json')
+
+
+class QuoteTest(WorkdirTestCase):
+    def test_error_of_carrier_keeps_results_of_others(self):
+        quoter = BulkQuoter([dict(DELIVERY_INFO)], workers=1)
+
+        with mock.patch('calculator.calculation.bulk.CALCULATORS', (PricedAPI, BrokenAPI)), \
+                mock.patch('calculator.calculation.calc.CALCULATORS', (PricedAPI, BrokenAPI)), \
+                self.assertLogs('calculator.calculation.calc', 'ERROR'):
+            results, = quoter.quote()
+            row = get_bulk_row(['Москва'], results)
+
+        self.assertEqual(row, ['Москва', '100.00', 2, CALCULATION_ERROR, '', ''])
+
+
+class BulkJobTest(WorkdirTestCase):
+    def test_job_of_finished_worker_is_failed(self):
+        job = BulkJob('job')
+        os.makedirs(job.path)
+        job.write_status(state=RUNNING, done=1, total=2, owner=1, pid=2 ** 22 + 1)
+
+        self.assertEqual(job.read_status()['state'], FAILED)
+
+    def test_unknown_job(self):
+        self.assertIsNone(BulkJob('unknown').read_status())
+
+    def test_old_jobs_are_removed(self):
+        old, new = BulkJob('old'), BulkJob('new')
+        for job in (old, new):
+            os.makedirs(job.path)
+        os.utime(old.path, (0, 0))
+
+        remove_old_jobs()
+
+        self.assertFalse(os.path.exists(old.path))
+        self.assertTrue(os.path.exists(new.path))
@@ -0,0 +1,123 @@
+from configparser import ConfigParser
+from unittest import mock
+import asyncio
+import time
+
+from calculator import views
+from calculator.calculation.api import CALCULATION_ERROR, CONNECTION_ERROR
+from calculator.calculation.baikal import AsyncBaikalAPI, BaikalAPI
+from calculator.calculation.cache import QuoteCache, get_quote_key
+from calculator.calculation.calc import CALCULATORS, TIMEOUT_ERROR, AsyncCalculator, Calculator
+from calculator.standin.benchmark import CONFIG_PATH, get_cleaned_data, get_shipments, prepare_workdir
+from calculator.standin.server import StandinServer
+
+from .utils import WorkdirTestCase
+
+
+class BrokenBaikalAPI(BaikalAPI):
+    """ Carrier answering with page which is not json """
+    def _get_delivery_calc(self):
+        raise ValueError('html instead of json')
+
+
+class AsyncBrokenBaikalAPI(AsyncBaikalAPI):
+    """ Carrier answering with page which is not json """
+    async def _get_delivery_calc(self):
+        raise ValueError('html instead of json')
+
+
+class CalculatorStandinTest(WorkdirTestCase):
+    """ Calculator requesting carriers served by stand-in """
+    def setUp(self):
+        super().setUp()
+        self.server = StandinServer(error_status=500).start()
+        self.addCleanup(self.server.stop)
+        # breakers of carriers are shared by the process
+        patcher = mock.patch.dict('calculator.calculation.breaker._breakers', clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.config = prepare_workdir(self.server, cache=True)
+        QuoteCache(self.config).cache.clear()
+        self.info = views.get_delivery_info(get_cleaned_data(get_shipments(2)[1]))
+
+    def configure(self, section: str, **options):
+        """ Change options of config
+        section: section of config
+        options: new options
+        """
+        config = ConfigParser()
+        config.read(CONFIG_PATH)
+        for option, value in options.items():
+            config.set(section, option, str(value))
+        with open(CONFIG_PATH, 'w', encoding='utf-8') as f:
+            config.write(f)
+
+    def calculate(self):
+        """ Calculate shipment
+        Return: dict with carriers names as keys and results as values
+        """
+        return {result['name']: result for result in Calculator(dict(self.info)).calculate()}
+
+    def test_all_carriers_are_quoted(self):
+        results = self.calculate()
+
+        self.assertEqual(set(results), {api_class.name for api_class in CALCULATORS})
+        self.assertEqual({name: result['error'] for name, result in results.items() if result['error']}, {})
+
+    def test_late_carrier_is_marked_by_deadline(self):
+        self.configure('calculator', deadline=0.5)
+        self.server.fixtures['baikal']['latency'] = 2
+
+        started = time.monotonic()
+        results = self.calculate()
+
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertEqual(results[BaikalAPI.name]['error'], TIMEOUT_ERROR)
+        self.assertEqual([name for name, result in results.items() if result['error']], [BaikalAPI.name])
+
+    def test_open_breaker_falls_back_to_stale_result(self):
+        self.configure('baikal', breaker_min_calls=2, breaker_window=2)
+        quoted = self.calculate()[BaikalAPI.name]
+        self.server.fixtures['baikal']['error_rate'] = 1
+        cache = QuoteCache(self.config).cache
+        key = get_quote_key(BaikalAPI, dict(self.info, produce_date=Calculator.get_date()))
+
+        for _ in range(2):
+            cache.delete(key)
+            self.assertEqual(self.calculate()[BaikalAPI.name]['error'], CONNECTION_ERROR)
+        requests = self.server.stats()['requests']['baikal']
+        cache.delete(key)
+        result = self.calculate()[BaikalAPI.name]
+
+        self.assertEqual(result, dict(quoted, stale=True))
+        self.assertEqual(self.server.stats()['requests']['baikal'], requests)
+
+    def assert_only_broken_failed(self, results: list):
+        """ Check that carrier with unexpected error is the only failed one
+        results: results of calculation
+        """
+        errors = {result['name']: result['error'] for result in results if result['error']}
+
+        self.assertEqual(len(results), len(CALCULATORS))
+        self.assertEqual(errors, {BaikalAPI.name: CALCULATION_ERROR})
+
+    def test_unexpected_error_fails_only_its_carrier(self):
+        calculator = Calculator(dict(self.info))
+        calculator.calculators = [BrokenBaikalAPI if calc is BaikalAPI else calc for calc in calculator.calculators]
+
+        with self.assertLogs('calculator.calculation.calc', 'ERROR'):
+            results = calculator.calculate()
+
+        self.assert_only_broken_failed(results)
+
+    def test_unexpected_error_fails_only_its_carrier_on_event_loop(self):
+        async def calculate():
+            calculator = AsyncCalculator(dict(self.info))
+            calculator.calculators = [AsyncBrokenBaikalAPI if calc is AsyncBaikalAPI else calc
+                                      for calc in calculator.calculators]
+            return await calculator.calculate()
+
+        with self.assertLogs('calculator.calculation.calc', 'ERROR'):
+            results = asyncio.run(calculate())
+
+        self.assert_only_broken_failed(results)
@@ -0,0 +1,135 @@
+from threading import current_thread
+from unittest import mock
+import asyncio
+import os
+import time
+import uuid
+
+from calculator.calculation.directories import CachedDirectory, FileIndex, write_manifest
+
+from .utils import WorkdirTestCase
+
+
+class FileIndexTest(WorkdirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.write('assets/data/index.txt', b'a\nb\n')
+        self.threads = []
+
+    def build(self, path: str):
+        self.threads.append(current_thread())
+        with open(path) as f:
+            return f.read().split()
+
+    def test_async_index_is_built_off_event_loop(self):
+        index = FileIndex('assets/data/index.txt', self.build)
+
+        async def get_twice():
+            return await index.get_async(), await index.get_async(), current_thread()
+
+        first, second, loop_thread = asyncio.run(get_twice())
+
+        self.assertEqual(first, ['a', 'b'])
+        self.assertIs(second, first)
+        self.assertEqual(len(self.threads), 1)
+        self.assertIsNot(self.threads[0], loop_thread)
+
+
+class CachedDirectoryTest(WorkdirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = time.time()
+        patcher = mock.patch('calculator.calculation.directories.time.time', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # cache is shared by tests, so every test has its own directory
+        self.name = f'test-{uuid.uuid4()}'
+        self.directory = CachedDirectory(self.name)
+        self.fetches = []
+
+    def fetch(self):
+        self.fetches.append(self.now)
+        return {'version': len(self.fetches)}
+
+    def wait_refresh(self, directory=None):
+        """ Wait for background download of directory
+        directory: CachedDirectory, self.directory by default
+        """
+        directory = directory or self.directory
+        for _ in range(500):
+            if not directory._refreshing:
+                return
+            time.sleep(0.01)
+        self.fail('directory is not refreshed')
+
+    def test_index_is_downloaded_once_per_interval(self):
+        self.assertEqual(self.directory.get(self.fetch, 60), {'version': 1})
+        self.now += 59
+        self.assertEqual(self.directory.get(self.fetch, 60), {'version': 1})
+
+        self.assertEqual(len(self.fetches), 1)
+
+    def test_outdated_index_is_refreshed_in_background(self):
+        self.directory.get(self.fetch, 60)
+        self.now += 60
+
+        self.assertEqual(self.directory.get(self.fetch, 60), {'version': 1})
+        self.wait_refresh()
+        self.assertEqual(self.directory.get(self.fetch, 60), {'version': 2})
+
+    def test_index_is_shared_with_other_workers(self):
+        self.directory.get(self.fetch, 60)
+        other = CachedDirectory(self.name)
+
+        self.assertEqual(other.get(self.fetch, 60), {'version': 1})
+        self.assertEqual(len(self.fetches), 1)
+
+    def test_refresh_is_claimed_by_one_worker(self):
+        self.directory.get(self.fetch, 60)
+        other = CachedDirectory(self.name)
+        other.get(self.fetch, 60)
+        self.now += 60
+
+        with mock.patch('calculator.calculation.directories.get_pool') as get_pool:
+            self.directory.get(self.fetch, 60)
+            other.get(self.fetch, 60)
+
+        self.assertEqual(get_pool.return_value.submit.call_count, 1)
+
+    def test_failed_refresh_releases_claim(self):
+        self.directory.get(self.fetch, 60)
+        self.now += 60
+
+        self.directory.get(lambda: None, 60)
+        self.wait_refresh()
+        self.assertEqual(self.directory.get(self.fetch, 60), {'version': 1})
+        self.wait_refresh()
+
+        self.assertEqual(self.directory.get(self.fetch, 60), {'version': 2})
+
+    def test_fresh_snapshot_is_used_instead_of_download(self):
+        self.write('assets/data/snapshot.json', b'{}')
+        os.utime('assets/data/snapshot.json', (self.now - 3600, self.now - 3600))
+        write_manifest({'assets/data/snapshot.json': {'checked': self.now - 10}})
+        directory = CachedDirectory(self.name, 'assets/data/snapshot.json', lambda path: {'snapshot': path})
+
+        self.assertEqual(directory.get(self.fetch, 60), {'snapshot': 'assets/data/snapshot.json'})
+        self.assertEqual(self.fetches, [])
+
+        self.now += 60
+        directory.get(self.fetch, 60)
+        self.wait_refresh(directory)
+        self.assertEqual(directory.get(self.fetch, 60), {'version': 1})
+
+    def test_outdated_index_is_refreshed_on_event_loop(self):
+        async def fetch():
+            return self.fetch()
+
+        async def get_all():
+            first = await self.directory.get_async(fetch, 60)
+            self.now += 60
+            outdated = await self.directory.get_async(fetch, 60)
+            await asyncio.gather(*self.directory._tasks)
+            return first, outdated, await self.directory.get_async(fetch, 60)
+
+        self.assertEqual(asyncio.run(get_all()), ({'version': 1}, {'version': 1}, {'version': 2}))
@@ -0,0 +1,69 @@
+import tracemalloc
+
+from calculator.calculation import dpd
+
+from .utils import WorkdirTestCase
+
+
+TERMINALS = 5000
+
+
+def get_terminals(count: int):
+    """ Get xml of terminals
+    count: number of terminals
+    Return: xml string
+    """
+    return ''.join(
+        f'<terminal><terminalCode>T{i}</terminalCode><terminalName>Терминал {i}</terminalName>'
+        f'<address><cityId>{49000000 + i}</cityId><street>Улица {i}</street></address></terminal>'
+        for i in range(count)
+    )
+
+
+def get_soap_terminals(count: int):
+    """ Get SOAP response of getTerminalsSelfDelivery2 as it is saved by DPDTerminalsSync
+    count: number of terminals
+    Return: xml bytes
+    """
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<S:Envelope xmlns:S="http://schemas.xmlsoap.org/soap/envelope/"><S:Body>'
+        '<ns2:getTerminalsSelfDelivery2Response xmlns:ns2="http://dpd.ru/ws/geography/2015-05-20"><return>'
+        f'{get_terminals(count)}'
+        '</return></ns2:getTerminalsSelfDelivery2Response></S:Body></S:Envelope>'
+    ).encode()
+
+
+class TerminalCitiesTest(WorkdirTestCase):
+    def get_peak(self, data: bytes):
+        """ Read terminals file and measure memory
+        data: content of terminals file
+        Return: (city ids, peak of allocated memory in bytes)
+        """
+        self.write(dpd.TERMINALS_PATH, data)
+
+        tracemalloc.start()
+        try:
+            city_ids = dpd.build_terminal_cities(dpd.TERMINALS_PATH)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return city_ids, peak
+
+    def test_flat_file(self):
+        city_ids, _ = self.get_peak(f'<return>{get_terminals(3)}</return>'.encode())
+
+        self.assertEqual(city_ids, {'49000000', '49000001', '49000002'})
+
+    def test_soap_file(self):
+        city_ids, _ = self.get_peak(get_soap_terminals(3))
+
+        self.assertEqual(city_ids, {'49000000', '49000001', '49000002'})
+
+    def test_soap_file_is_not_kept_in_memory(self):
+        city_ids, soap_peak = self.get_peak(get_soap_terminals(TERMINALS))
+        _, flat_peak = self.get_peak(f'<return>{get_terminals(TERMINALS)}</return>'.encode())
+
+        self.assertEqual(len(city_ids), TERMINALS)
+        self.assertLess(soap_peak, flat_peak * 1.5)
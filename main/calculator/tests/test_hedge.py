@@ -0,0 +1,123 @@
+from configparser import ConfigParser
+from unittest import mock
+import asyncio
+import time
+
+from django.test import SimpleTestCase
+
+from calculator.calculation import hedge
+from calculator.calculation.hedge import Hedger, get_hedger
+
+
+class HedgerTest(SimpleTestCase):
+    def setUp(self):
+        self.hedger = Hedger(percentile=50, min_samples=4, max_rate=0.5, window=10)
+        self.calls = 0
+
+    def warm_up(self, delay: float = 0.01):
+        """ Save latency samples so that hedging starts
+        delay: latency of samples
+        """
+        for _ in range(4):
+            self.hedger.record(delay)
+
+    def send_slow_first(self):
+        """ Request which first copy is late """
+        self.calls += 1
+        call = self.calls
+        if call == 1:
+            time.sleep(0.3)
+        return call
+
+    def test_no_hedge_without_samples(self):
+        self.assertEqual(self.hedger.call(self.send_slow_first), 1)
+        self.assertEqual(self.hedger.stats()['hedges'], 0)
+
+    def test_fast_response_is_not_hedged(self):
+        self.warm_up(0.5)
+
+        self.assertEqual(self.hedger.call(lambda: 'fast'), 'fast')
+        self.assertEqual(self.hedger.stats()['hedges'], 0)
+
+    def test_late_response_is_hedged(self):
+        self.warm_up()
+
+        self.assertEqual(self.hedger.call(self.send_slow_first), 2)
+        stats = self.hedger.stats()
+        self.assertEqual((stats['hedges'], stats['wins'], stats['losses']), (1, 1, 0))
+
+    def test_claim_is_limited_by_max_rate(self):
+        claims = [self.hedger._claim(True) for _ in range(4)]
+
+        self.assertEqual(claims, [True, False, True, False])
+        self.assertEqual(self.hedger.stats()['hedge_rate'], 0.5)
+
+    def test_failed_hedge_waits_for_primary(self):
+        self.warm_up()
+
+        def send():
+            self.calls += 1
+            if self.calls == 1:
+                time.sleep(0.3)
+                return 'primary'
+            raise OSError('hedge failed')
+
+        self.assertEqual(self.hedger.call(send), 'primary')
+        self.assertEqual(self.hedger.stats()['losses'], 1)
+
+    def test_async_loser_is_cancelled(self):
+        self.warm_up()
+        cancelled = []
+
+        async def send():
+            self.calls += 1
+            call = self.calls
+            try:
+                if call == 1:
+                    await asyncio.sleep(10)
+                return call
+            except asyncio.CancelledError:
+                cancelled.append(call)
+                raise
+
+        async def call():
+            result = await self.hedger.call_async(send)
+            await asyncio.sleep(0)
+            return result
+
+        self.assertEqual(asyncio.run(call()), 2)
+        self.assertEqual(cancelled, [1])
+
+    def test_cancelled_async_call_cancels_requests(self):
+        self.warm_up()
+        cancelled = []
+
+        async def send():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+
+        async def call():
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(self.hedger.call_async(send), timeout=0.1)
+            await asyncio.sleep(0)
+
+        asyncio.run(call())
+
+        self.assertEqual(cancelled, [1, 1])
+
+    def test_executor_is_sized_by_configured_workers(self):
+        config = ConfigParser()
+        config.read_dict({'calculator': {'workers': '30'}, 'test_hedge_workers': {'hedge': 'yes'}})
+        hedger = get_hedger(config, 'test_hedge_workers')
+        for _ in range(hedger.min_samples):
+            hedger.record(1)
+
+        with mock.patch.object(hedge, '_executor', None):
+            self.assertEqual(hedger.call(lambda: 'fast'), 'fast')
+            executor = hedge._executor
+        self.addCleanup(executor.shutdown)
+
+        self.assertEqual(executor._max_workers, 60)
@@ -0,0 +1,166 @@
+from configparser import ConfigParser
+from threading import Event, Semaphore, Thread
+import json
+import os
+import time
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.test import RequestFactory, SimpleTestCase
+
+from calculator.calculation.metrics import DEAD_WORKERS, Metrics, is_scrape_allowed
+from calculator.calculation.pool import get_pool, shutdown_pool
+from calculator.calculation.singleflight import SingleFlight
+
+from .utils import WorkdirTestCase
+
+
+DEAD_PID = 2 ** 22 + 1
+
+
+class MetricsTest(WorkdirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.metrics = Metrics('metrics', interval=3600)
+
+    def write_worker(self, pid: int, requests: int, open_breakers: int):
+        """ Write metrics file of worker
+        pid: process id
+        requests: value of requests counter
+        open_breakers: value of breaker gauge
+        """
+        self.write(self.metrics.get_worker_path(pid), json.dumps({
+            'counters': [
+                ['carrier_requests_total', [['carrier', 'dpd'], ['status', '2xx']], requests],
+                ['carrier_breaker_open', [['carrier', 'dpd']], open_breakers],
+            ],
+            'histograms': [
+                ['calculator_duration_seconds', [], {'buckets': [1, 10], 'counts': [requests, 0],
+                                                    'sum': requests * 0.5, 'count': requests}],
+            ],
+        }).encode())
+
+    def get_values(self):
+        counters, histograms = self.metrics.aggregate()
+        return (
+            counters.get(('carrier_requests_total', (('carrier', 'dpd'), ('status', '2xx'))), 0),
+            counters.get(('carrier_breaker_open', (('carrier', 'dpd'),)), 0),
+            histograms[('calculator_duration_seconds', ())]['count'],
+        )
+
+    def test_dead_workers_are_merged(self):
+        self.write_worker(DEAD_PID, 3, 1)
+        self.write_worker(DEAD_PID + 1, 4, 1)
+        self.write_worker(os.getpid(), 5, 1)
+
+        self.assertEqual(self.get_values(), (12, 1, 12))
+        self.assertEqual(sorted(os.listdir('metrics')), sorted(['.lock', f'{DEAD_WORKERS}.json', f'{os.getpid()}.json']))
+
+        self.write_worker(DEAD_PID, 2, 1)
+        self.assertEqual(self.get_values(), (14, 1, 14))
+
+    def test_file_of_recycled_pid_is_merged_on_first_flush(self):
+        self.write_worker(os.getpid(), 3, 1)
+
+        self.metrics.inc('carrier_requests_total', {'carrier': 'dpd', 'status': '2xx'})
+        self.metrics.flush()
+        counters, _ = self.metrics.aggregate()
+
+        self.assertEqual(counters[('carrier_requests_total', (('carrier', 'dpd'), ('status', '2xx')))], 4)
+
+    def test_nothing_is_saved_before_recording(self):
+        self.metrics.flush(force=False)
+
+        self.assertIsNone(self.metrics._flusher_pid)
+        self.assertFalse(os.path.exists(self.metrics.get_worker_path(os.getpid())))
+
+        self.metrics.inc('carrier_requests_total', {'carrier': 'dpd', 'status': '2xx'})
+        self.metrics.flush(force=False)
+
+        self.assertEqual(self.metrics._flusher_pid, os.getpid())
+        self.assertTrue(os.path.exists(self.metrics.get_worker_path(os.getpid())))
+
+    def test_observe_does_not_write_file(self):
+        self.metrics.observe('calculator_duration_seconds', {}, 0.1)
+
+        self.assertFalse(os.path.exists(self.metrics.get_worker_path(os.getpid())))
+
+    def test_pool_gauges(self):
+        config = ConfigParser()
+        config.read_dict({'calculator': {'workers': '2'}})
+        shutdown_pool()
+        self.addCleanup(shutdown_pool)
+        pool = get_pool(config)
+        release = Event()
+        started = Semaphore(0)
+        futures = [pool.submit(lambda: started.release() or release.wait()) for _ in range(3)]
+        for _ in range(2):
+            started.acquire(timeout=5)
+
+        self.metrics.flush()
+        counters, _ = self.metrics.aggregate()
+        release.set()
+        for future in futures:
+            future.result()
+
+        self.assertEqual(counters[('carrier_pool_active', ())], 2)
+        self.assertEqual(counters[('carrier_pool_queued', ())], 1)
+        self.assertEqual(counters[('carrier_pool_saturation', (('worker', str(os.getpid())),))], 1)
+
+    def test_singleflight_gauges(self):
+        flight = SingleFlight()
+        started = Event()
+        release = Event()
+
+        def leader():
+            started.set()
+            release.wait()
+            return {}
+
+        threads = [Thread(target=flight.do, args=('key', leader))]
+        threads[0].start()
+        started.wait(5)
+        threads += [Thread(target=flight.do, args=('key', dict)) for _ in range(2)]
+        for thread in threads[1:]:
+            thread.start()
+        while flight.stats()['waiters'] < 2:
+            time.sleep(0.01)
+
+        self.metrics.flush()
+        counters, _ = self.metrics.aggregate()
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertGreaterEqual(counters[('quote_singleflight_in_flight', ())], 1)
+        self.assertGreaterEqual(counters[('quote_singleflight_waiters', ())], 2)
+
+
+class ScrapeAccessTest(SimpleTestCase):
+    def setUp(self):
+        self.config = ConfigParser()
+        self.config.read_dict({'calculator': {'metrics_allow': '10.0.0.5', 'metrics_token': 'secret'}})
+
+    def get_request(self, address='192.168.1.1', user=None, **headers):
+        request = RequestFactory().get('/metrics', REMOTE_ADDR=address, **headers)
+        request.user = user or AnonymousUser()
+        return request
+
+    def test_allowed_address(self):
+        self.assertTrue(is_scrape_allowed(self.get_request('10.0.0.5'), self.config))
+
+    def test_no_address_is_allowed_by_default(self):
+        self.assertFalse(is_scrape_allowed(self.get_request('127.0.0.1'), ConfigParser()))
+        self.assertFalse(is_scrape_allowed(self.get_request(''), ConfigParser()))
+        self.assertFalse(is_scrape_allowed(self.get_request('127.0.0.1'), self.config))
+
+    def test_token(self):
+        self.assertTrue(is_scrape_allowed(self.get_request(HTTP_AUTHORIZATION='Bearer secret'), self.config))
+        self.assertFalse(is_scrape_allowed(self.get_request(HTTP_AUTHORIZATION='Bearer wrong'), self.config))
+
+    def test_empty_token_is_not_accepted(self):
+        self.config.remove_option('calculator', 'metrics_token')
+        self.assertFalse(is_scrape_allowed(self.get_request(HTTP_AUTHORIZATION='Bearer '), self.config))
+
+    def test_staff(self):
+        self.assertTrue(is_scrape_allowed(self.get_request(user=User(is_staff=True)), self.config))
+        self.assertFalse(is_scrape_allowed(self.get_request(user=User()), self.config))
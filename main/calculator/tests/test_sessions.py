@@ -0,0 +1,36 @@
+import asyncio
+
+from django.test import SimpleTestCase
+
+from calculator.calculation.sessions import SessionManager
+
+
+class SessionManagerTest(SimpleTestCase):
+    def test_cold_async_logins_are_shared(self):
+        sessions = SessionManager()
+        logins = []
+
+        async def login():
+            logins.append(1)
+            await asyncio.sleep(0.01)
+            return f'session-{len(logins)}'
+
+        async def get_all():
+            return await asyncio.gather(*(sessions.get_async(login, 60) for _ in range(50)))
+
+        values = asyncio.run(get_all())
+
+        self.assertEqual(len(logins), 1)
+        self.assertEqual(set(values), {'session-1'})
+
+    def test_failed_async_login_is_retried_by_next_caller(self):
+        sessions = SessionManager()
+        results = iter([None, 'session'])
+
+        async def login():
+            return next(results)
+
+        async def get_two():
+            return await asyncio.gather(sessions.get_async(login, 60), sessions.get_async(login, 60))
+
+        self.assertEqual(asyncio.run(get_two()), [None, 'session'])
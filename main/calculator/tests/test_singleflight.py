@@ -0,0 +1,133 @@
+from threading import Event, Thread
+import asyncio
+import time
+
+from django.test import SimpleTestCase
+
+from calculator.calculation.singleflight import AsyncSingleFlight, SingleFlight
+
+
+class SingleFlightTest(SimpleTestCase):
+    def setUp(self):
+        self.flight = SingleFlight()
+        self.calls = 0
+        self.release = Event()
+
+    def run_followers(self, func, count: int = 3):
+        """ Start leader with func and followers with the same key, then let leader finish
+        func: function of leader
+        count: number of followers
+        Return: list of results or exceptions of leader and followers
+        """
+        outcomes = [None] * (count + 1)
+
+        def call(i):
+            try:
+                outcomes[i] = self.flight.do('key', func)
+            except Exception as e:
+                outcomes[i] = e
+
+        threads = [Thread(target=call, args=(i,)) for i in range(count + 1)]
+        threads[0].start()
+        while not self.flight.stats()['in_flight']:
+            time.sleep(0.001)
+        for thread in threads[1:]:
+            thread.start()
+        while self.flight.stats()['waiters'] < count:
+            time.sleep(0.001)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+
+        return outcomes
+
+    def test_followers_get_copy_of_leader_result(self):
+        def func():
+            self.calls += 1
+            self.release.wait()
+            return {'cost': '100.00'}
+
+        outcomes = self.run_followers(func)
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(outcomes, [{'cost': '100.00'}] * 4)
+        self.assertEqual(len({id(outcome) for outcome in outcomes}), 4)
+        self.assertEqual(self.flight.stats(), {'in_flight': 0, 'waiters': 0, 'coalesced': 3})
+
+    def test_leader_exception_is_raised_by_followers(self):
+        error = ValueError('bad response')
+
+        def func():
+            self.calls += 1
+            self.release.wait()
+            raise error
+
+        outcomes = self.run_followers(func)
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(outcomes, [error] * 4)
+
+    def test_call_after_failure_runs_again(self):
+        def fail():
+            raise ValueError('bad response')
+
+        with self.assertRaises(ValueError):
+            self.flight.do('key', fail)
+
+        self.assertEqual(self.flight.do('key', dict), {})
+
+
+class AsyncSingleFlightTest(SimpleTestCase):
+    def setUp(self):
+        self.flight = AsyncSingleFlight()
+        self.calls = 0
+
+    async def gather(self, func, count: int = 4):
+        """ Run calls with the same key concurrently
+        func: coroutine function of calls
+        count: number of calls
+        Return: list of results or exceptions
+        """
+        return await asyncio.gather(*(self.flight.do('key', func) for _ in range(count)), return_exceptions=True)
+
+    def test_followers_get_copy_of_leader_result(self):
+        async def func():
+            self.calls += 1
+            await asyncio.sleep(0.01)
+            return {'cost': '100.00'}
+
+        outcomes = asyncio.run(self.gather(func))
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(outcomes, [{'cost': '100.00'}] * 4)
+        self.assertEqual(self.flight.stats(), {'in_flight': 0, 'waiters': 0, 'coalesced': 3})
+
+    def test_leader_exception_is_raised_by_followers(self):
+        error = ValueError('bad response')
+
+        async def func():
+            self.calls += 1
+            await asyncio.sleep(0.01)
+            raise error
+
+        outcomes = asyncio.run(self.gather(func))
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(outcomes, [error] * 4)
+
+    def test_follower_takes_over_cancelled_leader(self):
+        async def func():
+            self.calls += 1
+            await asyncio.sleep(0.05)
+            return {'call': self.calls}
+
+        async def run():
+            leader = asyncio.ensure_future(self.flight.do('key', func))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(self.flight.do('key', func))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return await follower
+
+        self.assertEqual(asyncio.run(run()), {'call': 2})
+        self.assertEqual(self.flight.stats()['in_flight'], 0)
@@ -0,0 +1,148 @@
+from configparser import ConfigParser
+import json
+import os
+
+from django.test import SimpleTestCase
+
+from calculator.calculation.sync import SYNCS, JSONDirectorySync, run_sync
+
+from .utils import WorkdirTestCase
+
+
+class FakeResponse:
+    """ Streamed response of directory request """
+    def __init__(self, status_code: int, body: bytes = b'', etag: str = None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = {'ETag': etag} if etag else {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size: int):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i:i + chunk_size]
+
+
+class FakeSync(JSONDirectorySync):
+    """ Directory sync answering with queued responses """
+    section = 'test_sync'
+    name = 'test'
+    path = 'assets/data/test-directory.json'
+    id_key = 'id'
+
+    def __init__(self, config, session, responses: list):
+        super().__init__(config, session)
+        self.responses = responses
+        self.requests = []
+        self.loads = 0
+
+    def request(self, headers: dict):
+        self.requests.append(headers)
+        return self.responses.pop(0)
+
+    def load(self, path: str):
+        self.loads += 1
+
+
+def get_body(items: list):
+    """ Get directory json
+    items: list of (id, name)
+    Return: json bytes
+    """
+    return json.dumps([{'id': key, 'name': name} for key, name in items]).encode('utf-8')
+
+
+class DirectorySyncTest(WorkdirTestCase):
+    def run_sync(self, *responses, state: dict = None, digests: dict = None):
+        """ Run sync with responses
+        responses: responses of directory requests
+        state: sync info of previous download
+        digests: hashes of snapshot entries
+        Return: (sync, info, state, digests)
+        """
+        sync = FakeSync(ConfigParser(), None, list(responses))
+        info, state, digests = run_sync(sync, state or {}, digests)
+
+        return sync, info, state, digests
+
+    def test_first_download(self):
+        sync, info, state, digests = self.run_sync(FakeResponse(200, get_body([(1, 'a'), (2, 'b')]), 'v1'))
+
+        self.assertEqual((info['status'], info['added'], info['entries'], info['error']), ('updated', 2, 2, ''))
+        self.assertEqual(state['etag'], 'v1')
+        self.assertEqual(sync.loads, 1)
+        self.assertTrue(os.path.exists(FakeSync.path))
+
+    def test_entries_are_diffed(self):
+        _, _, state, digests = self.run_sync(FakeResponse(200, get_body([(1, 'a'), (2, 'b'), (3, 'c')])))
+
+        sync, info, _, _ = self.run_sync(FakeResponse(200, get_body([(1, 'a'), (2, 'B'), (4, 'd')])),
+                                         state=state, digests=digests)
+
+        self.assertEqual((info['added'], info['removed'], info['changed']), (1, 1, 1))
+        self.assertEqual(sync.loads, 1)
+
+    def test_unchanged_snapshot_is_kept(self):
+        body = get_body([(1, 'a'), (2, 'b')])
+        _, _, state, digests = self.run_sync(FakeResponse(200, body))
+        inode = os.stat(FakeSync.path).st_ino
+
+        sync, info, _, _ = self.run_sync(FakeResponse(200, body), state=state, digests=digests)
+
+        self.assertEqual(info['status'], 'unchanged')
+        self.assertEqual(info['rebuild_saved'], state['build_time'])
+        self.assertEqual(os.stat(FakeSync.path).st_ino, inode)
+        self.assertEqual(sync.loads, 0)
+
+    def test_digests_are_read_from_snapshot(self):
+        body = get_body([(1, 'a'), (2, 'b')])
+        _, _, state, _ = self.run_sync(FakeResponse(200, body))
+
+        _, info, _, _ = self.run_sync(FakeResponse(200, body), state=state)
+
+        self.assertEqual(info['status'], 'unchanged')
+
+    def test_not_modified(self):
+        _, _, state, digests = self.run_sync(FakeResponse(200, get_body([(1, 'a')]), 'v1'))
+
+        sync, info, new_state, _ = self.run_sync(FakeResponse(304), state=state, digests=digests)
+
+        self.assertEqual(sync.requests, [{'If-None-Match': 'v1'}])
+        self.assertEqual(info['status'], 'not modified')
+        self.assertEqual(info['bytes_saved'], state['bytes'])
+        self.assertEqual(new_state['total_bytes_saved'], state['bytes'])
+
+    def test_empty_directory_keeps_snapshot(self):
+        body = get_body([(1, 'a')])
+        _, _, state, digests = self.run_sync(FakeResponse(200, body))
+
+        _, info, _, _ = self.run_sync(FakeResponse(200, b'[]'), state=state, digests=digests)
+
+        self.assertIn('ValueError', info['error'])
+        with open(FakeSync.path, 'rb') as f:
+            self.assertEqual(f.read(), body)
+        self.assertEqual([name for name in os.listdir('assets/data') if name.startswith('.tmp-')], [])
+
+
+class DirectorySyncClassesTest(SimpleTestCase):
+    def test_syncs_implement_directory_sync(self):
+        config = ConfigParser()
+        config.read_dict({sync.section: {} for sync in SYNCS})
+
+        for sync in SYNCS:
+            with self.subTest(sync=sync.__name__):
+                self.assertIsInstance(sync(config, None), sync)
+
+    def test_sync_without_request_is_not_created(self):
+        class IncompleteSync(JSONDirectorySync):
+            section = 'incomplete'
+
+        with self.assertRaises(TypeError):
+            IncompleteSync(ConfigParser(), None)
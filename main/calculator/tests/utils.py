@@ -0,0 +1,32 @@
+import os
+import tempfile
+
+from django.test import SimpleTestCase
+
+from calculator.calculation.metrics import metrics
+
+
+class WorkdirTestCase(SimpleTestCase):
+    """ Test case running in temporary working directory, so that data files
+    of carriers, which paths are relative to the current directory, are its own.
+    Metrics recorded by the test are dropped, so they are not saved to the current directory on exit.
+    """
+    def setUp(self):
+        super().setUp()
+        cwd = os.getcwd()
+        workdir = tempfile.TemporaryDirectory(prefix='calculator-test-')
+        os.chdir(workdir.name)
+        self.addCleanup(workdir.cleanup)
+        self.addCleanup(os.chdir, cwd)
+        self.addCleanup(metrics.reset)
+        os.makedirs('assets/data', exist_ok=True)
+
+    @staticmethod
+    def write(path: str, data: bytes):
+        """ Write data file
+        path: path to file
+        data: content of file
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 
 from . import views
@@ -6,5 +7,8 @@ from . import views
 app_name = 'calculator'
 
 urlpatterns = [
-    path('', views.index, name='index'),
+    path('', views.index_async if settings.CALCULATOR_ASYNC else views.index, name='index'),
+    path('bulk/', views.bulk, name='bulk'),
+    path('bulk/<uuid:job_id>/', views.bulk_job, name='bulk_job'),
+    path('bulk/<uuid:job_id>/quotes.csv', views.bulk_result, name='bulk_result'),
 ]
\ No newline at end of file
@@ -1,9 +1,17 @@
+from configparser import ConfigParser
+
+from asgiref.sync import sync_to_async
 from django.contrib.auth.decorators import login_required
-from django.shortcuts import render
+from django.contrib.auth.views import redirect_to_login
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden
+from django.shortcuts import redirect, render
 
-from .forms import CalculatorForm
+from .forms import SHIPMENT_COLUMNS, BulkForm, CalculatorForm
 
-from .calculation.calc import Calculator
+from .calculation.bulk import DONE, BulkJob
+from .calculation.calc import AsyncCalculator, Calculator
+from .calculation.metrics import is_scrape_allowed, metrics as carrier_metrics
+from .calculation.profiling import QuoteProfiler, is_profiling_requested
 
 
 def get_delivery_info(cleaned_data):
@@ -42,8 +50,15 @@ def index(request):
         form = CalculatorForm(request.POST)
         if form.is_valid():
             info = get_delivery_info(form.cleaned_data)
-            calculator = Calculator(info)
-            results = calculator.calculate()
+            if is_profiling_requested(request):
+                profiler = QuoteProfiler()
+                results = profiler.run(Calculator(info, profiler).calculate)
+                report = profiler.get_report()
+                profiler.save_report(report)
+                context['profile'] = profiler.format_report(report)
+            else:
+                calculator = Calculator(info)
+                results = calculator.calculate()
             context['form'] = form
             context['results'] = results
     else:
@@ -51,3 +66,83 @@ def index(request):
         context['form'] = form
 
     return render(request, 'calculator/index.html', context)
+
+
+async def index_async(request):
+    is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+    if not is_authenticated:
+        return redirect_to_login(request.get_full_path())
+
+    context = {}
+    if request.method == 'POST':
+        form = CalculatorForm(request.POST)
+        if form.is_valid():
+            info = get_delivery_info(form.cleaned_data)
+            calculator = AsyncCalculator(info)
+            results = await calculator.calculate()
+            context['form'] = form
+            context['results'] = results
+    else:
+        form = CalculatorForm()
+        context['form'] = form
+
+    return await sync_to_async(render)(request, 'calculator/index.html', context)
+
+
+@login_required
+def bulk(request):
+    if request.method == 'POST':
+        form = BulkForm(request.POST, request.FILES)
+        if form.is_valid():
+            dialect, shipments = form.cleaned_data['file']
+            shipments = [(values, get_delivery_info(data) if data else None, error)
+                         for values, data, error in shipments]
+            # batch runs in background thread, page of the job shows its progress
+            job = BulkJob.start(dialect, shipments, SHIPMENT_COLUMNS, request.user.pk)
+            return redirect('calculator:bulk_job', job_id=job.job_id)
+    else:
+        form = BulkForm()
+
+    return render(request, 'calculator/bulk.html', {'form': form})
+
+
+def get_bulk_job(request, job_id):
+    """ Get job of bulk quoting started by user
+    request: Django request
+    job_id: id of job
+    Return: (BulkJob, status of job), Http404 is raised if job is not found or started by another user
+    """
+    job = BulkJob(str(job_id))
+    status = job.read_status()
+
+    if status is None or (status['owner'] != request.user.pk and not request.user.is_staff):
+        raise Http404
+
+    return job, status
+
+
+@login_required
+def bulk_job(request, job_id):
+    job, status = get_bulk_job(request, job_id)
+
+    return render(request, 'calculator/bulk_job.html', {'job': job, 'status': status, 'done': status['state'] == DONE})
+
+
+@login_required
+def bulk_result(request, job_id):
+    job, status = get_bulk_job(request, job_id)
+    if status['state'] != DONE:
+        raise Http404
+
+    return FileResponse(open(job.result_path, 'rb'), as_attachment=True, filename='quotes.csv',
+                        content_type='text/csv; charset=utf-8')
+
+
+def metrics(request):
+    config = ConfigParser()
+    config.read('assets/data/config.ini')
+    if not is_scrape_allowed(request, config):
+        return HttpResponseForbidden()
+
+    # Prometheus text format, summed over all workers
+    return HttpResponse(carrier_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
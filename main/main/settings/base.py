@@ -85,6 +85,39 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+
+# 'quotes' keeps carriers calculation results, locmem evicts least recently used entries
+# when MAX_ENTRIES is reached. 'directories' keeps carriers directories (branches, cities),
+# 'cities' keeps city ids resolved by carriers API. Use memcached backend to share them between workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'directories': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'directories',
+    },
+    'cities': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'cities',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+    'quotes': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'quotes',
+        'TIMEOUT': 600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+
 # Login
 
 LOGIN_REDIRECT_URL = '/calculator'
@@ -124,3 +157,9 @@ MEDIA_URL = '/media/'
 # Forms
 
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
+
+
+# Calculator
+
+# Serve calculator with async view, set by asgi.py
+CALCULATOR_ASYNC = os.environ.get('CALCULATOR_ASYNC') == '1'
@@ -16,8 +16,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from calculator.views import metrics
+
 urlpatterns = [
     path('', include('login_app.urls', namespace='login')),
     path('admin-panel/', admin.site.urls),
     path('calculator/', include('calculator.urls', namespace='calculator')),
+    path('metrics', metrics, name='metrics'),
 ]